@@ -0,0 +1,3 @@
+DROP TABLE IF EXISTS finance.receipt_sync_cursors;
+
+DELETE FROM ops.schema_migrations WHERE filename = '197_receipt_sync_cursors.up.sql';
@@ -0,0 +1,14 @@
+-- Migration 197: Receipt sync cursors
+-- Per-label Gmail historyId checkpoints so receipt ingestion only fetches
+-- messages added since the last run instead of re-listing the whole label.
+
+CREATE TABLE IF NOT EXISTS finance.receipt_sync_cursors (
+    gmail_label VARCHAR(100) PRIMARY KEY,      -- e.g. 'LifeOS/Receipts/Carrefour'
+    label_id VARCHAR(100) NOT NULL,            -- Gmail label ID the cursor belongs to
+    history_id BIGINT NOT NULL,                -- Last fully processed mailbox historyId
+    last_full_sync_at TIMESTAMPTZ,             -- Last time the label was listed in full
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE finance.receipt_sync_cursors IS 'Gmail historyId checkpoint per receipt label for incremental ingestion';
+COMMENT ON COLUMN finance.receipt_sync_cursors.history_id IS 'Only advanced after every message up to this point was fetched without errors';
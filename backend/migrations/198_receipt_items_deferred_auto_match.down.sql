@@ -0,0 +1,20 @@
+-- Rollback: Deferred, set-based receipt item auto-matching
+
+DROP FUNCTION IF EXISTS finance.auto_match_receipt_items(INTEGER[], NUMERIC);
+
+-- Restore the unconditional per-row trigger from migration 167
+CREATE OR REPLACE FUNCTION finance.trigger_auto_match_receipt_item()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Only auto-match if not already matched
+    IF NEW.matched_food_id IS NULL THEN
+        PERFORM finance.auto_match_receipt_item(NEW.id, 0.4);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+COMMENT ON FUNCTION finance.trigger_auto_match_receipt_item IS 'Trigger function to auto-match on insert';
+
+DELETE FROM ops.schema_migrations WHERE filename = '198_receipt_items_deferred_auto_match.up.sql';
@@ -0,0 +1,81 @@
+-- Migration 198: Deferred, set-based receipt item auto-matching
+-- trg_auto_match_receipt_item runs nutrition.search_foods once per inserted row.
+-- Receipt ingestion bulk-inserts a receipt's items in one statement and matches
+-- them in a single pass per batch of receipts instead:
+--   * sessions that SET finance.defer_auto_match = 'on' skip the row trigger
+--   * finance.auto_match_receipt_items(receipt_ids) matches all unmatched items
+--     of those receipts in one statement (same rules as auto_match_receipt_item)
+
+CREATE OR REPLACE FUNCTION finance.trigger_auto_match_receipt_item()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Bulk writers match the whole batch afterwards (finance.auto_match_receipt_items)
+    IF current_setting('finance.defer_auto_match', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+
+    -- Only auto-match if not already matched
+    IF NEW.matched_food_id IS NULL THEN
+        PERFORM finance.auto_match_receipt_item(NEW.id, 0.4);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION finance.auto_match_receipt_items(
+    p_receipt_ids INTEGER[],
+    p_confidence_threshold NUMERIC DEFAULT 0.4
+)
+RETURNS TABLE(
+    total_processed INTEGER,
+    total_matched INTEGER
+)
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN QUERY
+    WITH items AS (
+        -- Unmatched food items of the given receipts
+        SELECT ri.id, finance.clean_receipt_item(ri.item_description) AS cleaned
+        FROM finance.receipt_items ri
+        WHERE ri.receipt_id = ANY(p_receipt_ids)
+          AND ri.matched_food_id IS NULL
+          AND ri.item_description IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM finance.receipt_non_food_items nf
+              WHERE lower(ri.item_description) LIKE '%' || nf.pattern || '%'
+          )
+    ),
+    best AS (
+        SELECT i.id, m.food_id, m.confidence
+        FROM items i
+        CROSS JOIN LATERAL (
+            SELECT s.id AS food_id, similarity(s.name, i.cleaned)::NUMERIC AS confidence
+            FROM nutrition.search_foods(i.cleaned, 1, false) s
+            LIMIT 1
+        ) m
+        WHERE m.confidence >= p_confidence_threshold
+    ),
+    matched AS (
+        UPDATE finance.receipt_items ri
+        SET matched_food_id = b.food_id,
+            match_confidence = b.confidence,
+            is_user_confirmed = false,
+            nutrition_snapshot = jsonb_build_object(
+                'calories_per_100g', f.calories_per_100g,
+                'protein_per_100g', f.protein_per_100g,
+                'carbs_per_100g', f.carbs_per_100g,
+                'fat_per_100g', f.fat_per_100g
+            )
+        FROM best b
+        JOIN nutrition.foods f ON f.id = b.food_id
+        WHERE ri.id = b.id
+        RETURNING ri.id
+    )
+    SELECT (SELECT COUNT(*) FROM items)::INTEGER,
+           (SELECT COUNT(*) FROM matched)::INTEGER;
+END;
+$$;
+
+COMMENT ON FUNCTION finance.auto_match_receipt_items IS 'Set-based auto-match of unmatched items for a batch of receipts (used when finance.defer_auto_match is on)';
+COMMENT ON FUNCTION finance.trigger_auto_match_receipt_item IS 'Trigger function to auto-match on insert (skipped when finance.defer_auto_match = on)';
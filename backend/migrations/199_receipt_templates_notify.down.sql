@@ -0,0 +1,6 @@
+-- Rollback: Receipt template change notifications
+
+DROP TRIGGER IF EXISTS trg_receipt_templates_notify ON finance.receipt_templates;
+DROP FUNCTION IF EXISTS finance.notify_receipt_template_change();
+
+DELETE FROM ops.schema_migrations WHERE filename = '199_receipt_templates_notify.up.sql';
@@ -0,0 +1,27 @@
+-- Migration 199: Receipt template change notifications
+-- Receipt ingestion keeps finance.receipt_templates in memory for drift detection
+-- and LISTENs on 'receipt_templates' to pick up approvals and new templates
+-- from other sessions. Payload: '<template_hash>:<status>' ('<template_hash>:'
+-- when the template was deleted).
+
+CREATE OR REPLACE FUNCTION finance.notify_receipt_template_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('receipt_templates', OLD.template_hash || ':');
+        RETURN OLD;
+    END IF;
+    PERFORM pg_notify('receipt_templates', NEW.template_hash || ':' || COALESCE(NEW.status, ''));
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_receipt_templates_notify ON finance.receipt_templates;
+
+CREATE TRIGGER trg_receipt_templates_notify
+    AFTER INSERT OR UPDATE OF status OR DELETE ON finance.receipt_templates
+    FOR EACH ROW
+    EXECUTE FUNCTION finance.notify_receipt_template_change();
+
+COMMENT ON FUNCTION finance.notify_receipt_template_change IS 'NOTIFY receipt_templates with <template_hash>:<status> on template insert/status change/delete';
@@ -0,0 +1,7 @@
+-- Rollback: Receipt pipeline run metrics
+
+DROP VIEW IF EXISTS ops.v_receipt_pipeline_health;
+DROP VIEW IF EXISTS ops.v_receipt_pipeline_stages;
+DROP TABLE IF EXISTS ops.receipt_pipeline_runs;
+
+DELETE FROM ops.schema_migrations WHERE filename = '200_receipt_pipeline_runs.up.sql';
@@ -0,0 +1,81 @@
+-- Migration 200: Receipt pipeline run metrics
+-- One row per receipt_ingestion.py run (or per hour of --daemon) with per-stage
+-- wall time, item/byte counts, DB round trips and Gmail calls, written by
+-- pipeline_metrics.py. Stage keys: fetch, download, store, extract, parse,
+-- persist, link, finalize (plus "other" for unattributed DB round trips).
+
+CREATE TABLE IF NOT EXISTS ops.receipt_pipeline_runs (
+    id SERIAL PRIMARY KEY,
+    run_id UUID NOT NULL DEFAULT gen_random_uuid() UNIQUE,
+    mode TEXT NOT NULL CHECK (mode IN ('cli', 'daemon')),
+    status TEXT NOT NULL CHECK (status IN ('success', 'error')),
+    error TEXT,
+    hostname TEXT,
+    started_at TIMESTAMPTZ NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    db_round_trips INTEGER NOT NULL DEFAULT 0,
+    -- {"<stage>": {"seconds", "self_seconds", "calls", "items", "bytes",
+    --              "db_round_trips", "api_calls", "items_per_second"}}
+    stages JSONB NOT NULL DEFAULT '{}'::jsonb,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX idx_receipt_pipeline_runs_started_at ON ops.receipt_pipeline_runs(started_at DESC);
+
+-- One row per run and stage, for dashboards and regression queries
+CREATE OR REPLACE VIEW ops.v_receipt_pipeline_stages AS
+SELECT
+    r.run_id,
+    r.mode,
+    r.status,
+    r.started_at,
+    s.key AS stage,
+    (s.value->>'seconds')::numeric AS seconds,
+    (s.value->>'self_seconds')::numeric AS self_seconds,
+    (s.value->>'items')::integer AS items,
+    (s.value->>'bytes')::bigint AS bytes,
+    (s.value->>'db_round_trips')::integer AS db_round_trips,
+    (s.value->>'api_calls')::integer AS api_calls,
+    (s.value->>'items_per_second')::numeric AS items_per_second
+FROM ops.receipt_pipeline_runs r
+CROSS JOIN LATERAL jsonb_each(r.stages) AS s(key, value);
+
+-- Latest run vs the trailing 7-day median per stage
+CREATE OR REPLACE VIEW ops.v_receipt_pipeline_health AS
+WITH latest AS (
+    SELECT DISTINCT ON (stage) *
+    FROM ops.v_receipt_pipeline_stages
+    WHERE status = 'success'
+    ORDER BY stage, started_at DESC
+),
+baseline AS (
+    SELECT
+        stage,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY self_seconds) AS median_self_seconds,
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY db_round_trips) AS median_db_round_trips,
+        COUNT(*) AS runs
+    FROM ops.v_receipt_pipeline_stages
+    WHERE status = 'success'
+      AND started_at >= now() - INTERVAL '7 days'
+    GROUP BY stage
+)
+SELECT
+    l.stage,
+    l.started_at AS last_run_at,
+    l.self_seconds AS last_self_seconds,
+    b.median_self_seconds,
+    l.items AS last_items,
+    l.items_per_second AS last_items_per_second,
+    l.db_round_trips AS last_db_round_trips,
+    b.median_db_round_trips,
+    b.runs AS runs_7d,
+    CASE
+        WHEN b.runs < 3 OR b.median_self_seconds IS NULL OR b.median_self_seconds = 0 THEN 'insufficient_data'
+        WHEN l.self_seconds > b.median_self_seconds * 2 THEN 'regressed'
+        ELSE 'ok'
+    END AS status
+FROM latest l
+LEFT JOIN baseline b USING (stage);
+
+COMMENT ON TABLE ops.receipt_pipeline_runs IS 'Per-stage timings, counts and DB round trips of receipt ingestion runs (pipeline_metrics.py).';
+COMMENT ON VIEW ops.v_receipt_pipeline_health IS 'Latest receipt pipeline run per stage vs trailing 7-day median; status regressed when self time doubles.';
@@ -0,0 +1,13 @@
+-- Rollback: Sync finance.known_brands with the receipt parsers
+-- No-op for the seeded rows: the up migration inserted them with
+-- ON CONFLICT DO NOTHING and does not record which ones it added, so deleting
+-- them by name could remove brands that existed before the migration.
+-- Brands that should no longer match can be deactivated (is_active = false).
+SELECT 'Migration 201 down: known_brands seed rows are kept' AS info;
+
+-- Restore the migration 079 entries that the up migration dropped
+UPDATE finance.known_brands SET is_active = true WHERE brand_name = 'Basmati';
+UPDATE finance.known_brands SET aliases = array_append(aliases, 'Modern')
+WHERE brand_name = 'Modern Bakery' AND NOT ('Modern' = ANY(aliases));
+
+DELETE FROM ops.schema_migrations WHERE filename = '201_known_brands_parser_sync.up.sql';
@@ -0,0 +1,22 @@
+-- Migration 201: Sync finance.known_brands with the receipt parsers
+-- The receipt parsers now match brands against this table (brand_index.py)
+-- instead of their own hard-coded lists. Seed the brands that only existed in
+-- those lists so their items keep a known_list brand.
+
+INSERT INTO finance.known_brands (brand_name, aliases, category) VALUES
+    ('Kitkat', ARRAY['KITKAT', 'Kit Kat'], 'chocolate'),
+    ('Snickers', ARRAY['SNICKERS'], 'chocolate'),
+    ('Mars', ARRAY['MARS'], 'chocolate'),
+    ('Nadec', ARRAY['NADEC'], 'dairy'),
+    ('Anchor', ARRAY['ANCHOR'], 'dairy'),
+    ('Red Bull', ARRAY['RED BULL'], 'beverages'),
+    ('Coca Cola', ARRAY['COCA COLA', 'Coca-Cola'], 'beverages'),
+    ('Pepsi', ARRAY['PEPSI'], 'beverages')
+ON CONFLICT (brand_name) DO NOTHING;
+
+-- A known_list match is reported with high confidence, so drop the 079 seeds
+-- that are not brands: 'Basmati' is a rice variety ("India Gate Basmati Rice"
+-- is India Gate), and the bare alias 'Modern' matches any "Modern ..." item.
+UPDATE finance.known_brands SET is_active = false WHERE brand_name = 'Basmati';
+UPDATE finance.known_brands SET aliases = array_remove(aliases, 'Modern')
+WHERE brand_name = 'Modern Bakery';
@@ -0,0 +1,881 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of the receipt pipeline
+
+Replays receipt emails through the real fetch, parse and link code against a
+throwaway Postgres:
+
+    fixtures   backend/data/receipts/*.pdf (each wrapped in a Carrefour email)
+               and ops/artifacts/receipts/*.eml, copied --scale times with a
+               per-copy trailer so every copy has its own content hash
+    Gmail      FakeGmail serves them with the googleapiclient call surface the
+               pipeline uses (labels, profile, history, messages, attachments,
+               batch requests); nothing touches the network
+    Postgres   a temporary cluster (initdb + pg_ctl, --pg-bin or PATH), or a
+               scratch database created on --db-url; schema from --schema
+               (pg_dump --schema-only of the live database) or replayed from
+               init.sql, init-extended.sql and migrations/*.up.sql (plus
+               bench_schema_drift.sql)
+
+For each phase (fetch, parse, link) it reports receipts/second, p95
+per-receipt latency, DB round trips, Gmail calls and peak RSS, then compares
+them with bench_baseline.json and exits 1 if any metric regressed by more than
+its tolerance (REGRESSION_TOLERANCES), if the parse status counts differ from
+the baseline's or if any receipt failed to parse. A run with failed receipts
+is never recorded as the baseline.
+
+The baseline must come from the reference host with real poppler: throughput,
+latency and status counts depend on the machine and on the pdftotext output.
+Until one is recorded there, only failed receipts fail the bench.
+
+Per-receipt latency is the time since the previous receipt of the phase
+completed; receipts completing together (one batch commit, one set-based link)
+split that gap evenly.
+
+Usage:
+    ./bench_pipeline.py                      # scale 10, compare with the baseline
+    ./bench_pipeline.py --scale 50 --workers 4 --no-compare
+    ./bench_pipeline.py --update-baseline    # record this run as the baseline
+    ./bench_pipeline.py --db-url postgresql://nexus@localhost/postgres --schema schema.sql
+
+The temporary cluster cannot be started as root (initdb refuses).
+"""
+
+import argparse
+import base64
+import contextlib
+import email
+import email.policy
+import hashlib
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+from psycopg2.extras import execute_values
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = SCRIPT_DIR.parent.parent
+REPO_DIR = BACKEND_DIR.parent
+
+FIXTURE_DIRS = [BACKEND_DIR / 'data' / 'receipts', REPO_DIR / 'ops' / 'artifacts' / 'receipts']
+BASELINE_PATH = SCRIPT_DIR / 'bench_baseline.json'
+MIGRATIONS_DIR = BACKEND_DIR / 'migrations'
+SCHEMA_BOOTSTRAP = [BACKEND_DIR / 'init.sql', BACKEND_DIR / 'init-extended.sql']
+# Out-of-band schema changes, replayed just before the first migration that needs them
+SCHEMA_DRIFT = {'167_receipt_auto_match.up.sql': SCRIPT_DIR / 'bench_schema_drift.sql'}
+
+PHASES = ('fetch', 'parse', 'link')
+
+# metric -> (higher is better, allowed relative change in the bad direction)
+REGRESSION_TOLERANCES = {
+    'receipts_per_second': (True, 0.25),
+    'p95_ms': (False, 0.50),
+    'db_round_trips': (False, 0.05),
+    'peak_rss_mb': (False, 0.25),
+}
+
+# Every Nth parsed receipt gets a bank-SMS stand-in transaction before the
+# link phase, so it exercises both matching and transaction creation
+LINK_SEED_EVERY = 2
+
+# Objects the fetch/parse/link path needs; a replayed schema that lacks them
+# cannot be benchmarked (use --schema)
+REQUIRED_RELATIONS = (
+    'finance.receipts', 'finance.receipt_raw_text', 'finance.receipt_items',
+    'finance.receipt_templates', 'finance.receipt_sync_cursors', 'finance.transactions',
+)
+REQUIRED_CALLS = ('SELECT * FROM finance.auto_match_receipt_items(ARRAY[]::integer[])',)
+
+BENCH_SENDER = 'Carrefour UAE <noreply@mafretail.com>'
+
+
+class BenchSetupError(Exception):
+    """The benchmark database could not be prepared."""
+
+
+# ============================================================================
+# Fake Gmail
+# ============================================================================
+
+class FakeRequest:
+    """googleapiclient HttpRequest stand-in: execute() calls the handler.
+
+    `round_trip` is called first, once per execute() (not when run in a batch).
+    """
+
+    def __init__(self, handler: Callable, kwargs: Dict[str, Any],
+                 round_trip: Optional[Callable[[], None]] = None):
+        self.handler = handler
+        self.kwargs = kwargs
+        self.round_trip = round_trip
+
+    def execute(self):
+        if self.round_trip:
+            self.round_trip()
+        return self.handler(**self.kwargs)
+
+
+class FakeResource:
+    """googleapiclient Resource stand-in.
+
+    Members that are FakeResources are sub-resources (service.users().messages());
+    callables are API methods returning a FakeRequest.
+    """
+
+    def __init__(self, round_trip: Optional[Callable[[], None]] = None, **members):
+        self._round_trip = round_trip
+        self._members = members
+
+    def __getattr__(self, name):
+        try:
+            member = self._members[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        if isinstance(member, FakeResource):
+            return lambda: member
+        return lambda **kwargs: FakeRequest(member, kwargs, self._round_trip)
+
+
+class FakeBatch:
+    """BatchHttpRequest stand-in: runs the added requests in order on execute().
+
+    The whole batch is one round trip; if `round_trip` raises, no request runs.
+    """
+
+    def __init__(self, callback: Callable, round_trip: Optional[Callable[[], None]] = None):
+        self.callback = callback
+        self.round_trip = round_trip
+        self.requests = []
+
+    def add(self, request: FakeRequest, request_id: str = None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self):
+        if self.round_trip:
+            self.round_trip()
+        for request_id, request in self.requests:
+            try:
+                response = request.handler(**request.kwargs)
+            except Exception as e:
+                self.callback(request_id, None, e)
+            else:
+                self.callback(request_id, response, None)
+
+
+class FakeGmail:
+    """In-memory mailbox served through the Gmail API calls the pipeline makes.
+
+    Messages are stored as Gmail `format=full` payloads; attachment bodies are
+    kept as (fixture bytes, copy number) and encoded when requested, so the
+    mailbox itself adds little to the measured RSS. Read-only once built, so
+    one instance can serve every download thread.
+
+    `round_trips` counts HTTP round trips (a batch is one). Setting
+    `failing_batches` makes that many upcoming batch executes fail as a
+    whole, like a transport error.
+    """
+
+    def __init__(self):
+        self.labels: Dict[str, str] = {}
+        self.label_messages: Dict[str, List[str]] = {}
+        self.messages: Dict[str, Dict] = {}
+        self.attachments: Dict[str, Tuple[bytes, str, int]] = {}
+        self.history_id = 1000
+        self.round_trips = 0
+        self.failing_batches = 0
+        self._lock = threading.Lock()
+
+    def add_message(self, label_name: str, message: email.message.Message, copy: int) -> str:
+        """Add one copy of a parsed email under a label. Returns: the Gmail message ID"""
+        label_id = self.labels.setdefault(label_name, f"Label_{len(self.labels) + 1}")
+        msg_ids = self.label_messages.setdefault(label_id, [])
+        msg_id = f"{len(self.messages) + 1:016x}"
+        sent = parsedate_to_datetime(message['Date']) + timedelta(minutes=copy)
+        self.messages[msg_id] = {
+            'id': msg_id,
+            'threadId': msg_id,
+            'labelIds': [label_id],
+            'internalDate': str(int(sent.timestamp() * 1000)),
+            'historyId': str(self.history_id),
+            'payload': self._payload(message, msg_id, copy, ''),
+        }
+        msg_ids.append(msg_id)
+        return msg_id
+
+    def _payload(self, part: email.message.Message, msg_id: str, copy: int, part_id: str) -> Dict:
+        mime_type = part.get_content_type()
+        payload = {
+            'partId': part_id,
+            'mimeType': mime_type,
+            'filename': part.get_filename() or '',
+            'headers': [{'name': name, 'value': str(value)} for name, value in part.items()],
+            'body': {'size': 0},
+        }
+        if part.is_multipart():
+            payload['parts'] = [
+                self._payload(sub, msg_id, copy, f"{part_id}.{i}" if part_id else str(i))
+                for i, sub in enumerate(part.get_payload())
+            ]
+            return payload
+
+        data = part.get_payload(decode=True) or b''
+        if payload['filename']:
+            attachment_id = f"att_{msg_id}_{part_id or 0}"
+            self.attachments[attachment_id] = (data, mime_type, copy)
+            payload['body'] = {'attachmentId': attachment_id, 'size': len(data)}
+        else:
+            data = unique_copy(data, mime_type, copy)
+            payload['body'] = {'size': len(data), 'data': base64.urlsafe_b64encode(data).decode('ascii')}
+        return payload
+
+    def fixture_pdfs(self) -> List[bytes]:
+        """Every distinct PDF attachment (copy 0 of each fixture)."""
+        return [data for data, mime_type, copy in self.attachments.values()
+                if copy == 0 and mime_type == 'application/pdf']
+
+    def service(self) -> FakeResource:
+        """The `service` object receipt_ingestion expects from build_gmail_service()."""
+        counted = self._round_trip
+        messages = FakeResource(
+            counted,
+            list=self._list_messages,
+            get=self._get_message,
+            attachments=FakeResource(counted, get=self._get_attachment),
+        )
+        users = FakeResource(
+            counted,
+            getProfile=lambda userId: {'emailAddress': 'bench@example.com', 'historyId': str(self.history_id)},
+            labels=FakeResource(counted, list=self._list_labels),
+            history=FakeResource(counted, list=self._list_history),
+            messages=messages,
+        )
+        service = FakeResource(users=users)
+        service.new_batch_http_request = lambda callback=None: FakeBatch(callback, self._batch_round_trip)
+        return service
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+
+    def _batch_round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+            if self.failing_batches:
+                self.failing_batches -= 1
+                raise ConnectionError("batch request failed")
+
+    def _list_labels(self, userId):
+        return {'labels': [{'id': label_id, 'name': name, 'type': 'user'}
+                           for name, label_id in self.labels.items()]}
+
+    def _list_history(self, userId, startHistoryId, **kwargs):
+        return {'history': [], 'historyId': str(self.history_id)}
+
+    def _list_messages(self, userId, labelIds, maxResults=100, pageToken=None):
+        msg_ids = self.label_messages.get(labelIds[0], [])
+        start = int(pageToken or 0)
+        page = msg_ids[start:start + maxResults]
+        results = {'messages': [{'id': m, 'threadId': m} for m in page],
+                   'resultSizeEstimate': len(page)}
+        if start + maxResults < len(msg_ids):
+            results['nextPageToken'] = str(start + maxResults)
+        return results
+
+    def _get_message(self, userId, id, format='full'):
+        return self.messages[id]
+
+    def _get_attachment(self, userId, messageId, id):
+        data, mime_type, copy = self.attachments[id]
+        data = unique_copy(data, mime_type, copy)
+        return {'size': len(data), 'data': base64.urlsafe_b64encode(data).decode('ascii')}
+
+
+def unique_copy(data: bytes, mime_type: str, copy: int) -> bytes:
+    """Copy `copy` of a receipt body, with a trailer that only changes its hash.
+
+    PDF readers ignore anything after %%EOF, and an HTML comment doesn't
+    change what the Careem parser sees. Copy 0 is the fixture itself.
+    """
+    if copy == 0:
+        return data
+    if mime_type == 'application/pdf':
+        return data + f"\n%bench-copy {copy}\n".encode('ascii')
+    if mime_type == 'text/html':
+        return data + f"\n<!-- bench-copy {copy} -->\n".encode('ascii')
+    return data
+
+
+def pdf_fixture_email(pdf_path: Path, sent: datetime) -> EmailMessage:
+    """Wrap a receipt PDF in an email like the ones Carrefour sends."""
+    message = EmailMessage()
+    message['From'] = BENCH_SENDER
+    message['To'] = 'bench@example.com'
+    message['Subject'] = f"Your Carrefour receipt {pdf_path.stem}"
+    message['Date'] = format_datetime(sent)
+    message.set_content("Thank you for shopping at Carrefour. Your receipt is attached.")
+    message.add_attachment(pdf_path.read_bytes(), maintype='application', subtype='pdf',
+                           filename=pdf_path.name.split('_', 1)[-1])
+    return message
+
+
+def build_mailbox(fixture_dirs: List[Path], scale: int) -> Tuple[FakeGmail, Dict[str, int]]:
+    """Load .pdf/.eml fixtures into a FakeGmail, `scale` copies of each.
+
+    Emails with a PDF attachment (and bare PDFs) go under the Carrefour label,
+    the rest under the Careem (HTML) label - see VENDOR_LABELS.
+
+    Returns: (mailbox, messages per label)
+    """
+    from receipt_ingestion import VENDOR_LABELS
+
+    pdf_label = VENDOR_LABELS['carrefour_uae'][0]
+    html_label = VENDOR_LABELS['careem_quik'][0]
+
+    fixtures = []
+    sent = datetime(2026, 1, 1, 9, 0, tzinfo=timezone.utc)
+    for fixture_dir in fixture_dirs:
+        for path in sorted(fixture_dir.glob('*.pdf')):
+            fixtures.append((pdf_label, pdf_fixture_email(path, sent)))
+            sent += timedelta(days=1)
+        for path in sorted(fixture_dir.glob('*.eml')):
+            message = email.message_from_bytes(path.read_bytes(), policy=email.policy.default)
+            has_pdf = any(part.get_content_type() == 'application/pdf' for part in message.walk())
+            fixtures.append((pdf_label if has_pdf else html_label, message))
+    if not fixtures:
+        raise BenchSetupError(f"No .pdf/.eml fixtures in {', '.join(map(str, fixture_dirs))}")
+
+    mailbox = FakeGmail()
+    counts: Dict[str, int] = {}
+    for copy in range(scale):
+        for label_name, message in fixtures:
+            mailbox.add_message(label_name, message, copy)
+            counts[label_name] = counts.get(label_name, 0) + 1
+    return mailbox, counts
+
+
+# ============================================================================
+# Throwaway Postgres
+# ============================================================================
+
+def find_pg_bin(pg_bin: Optional[str], program: str) -> str:
+    """Path of a Postgres client/server program (--pg-bin, PATH, then Debian's layout)."""
+    if pg_bin:
+        return str(Path(pg_bin) / program)
+    found = shutil.which(program)
+    if found:
+        return found
+    for candidate in sorted(Path('/usr/lib/postgresql').glob(f'*/bin/{program}'), reverse=True):
+        return str(candidate)
+    raise BenchSetupError(f"{program} not found: install the PostgreSQL server or pass --pg-bin")
+
+
+@contextlib.contextmanager
+def throwaway_cluster(pg_bin: Optional[str]) -> Iterator[str]:
+    """Start a temporary Postgres cluster on a Unix socket; deleted on exit.
+
+    Yields: an admin DSN (database postgres)
+    """
+    root = Path(tempfile.mkdtemp(prefix='receipt-bench-pg-'))
+    data_dir = root / 'data'
+    try:
+        subprocess.run([find_pg_bin(pg_bin, 'initdb'), '-D', str(data_dir), '-U', 'nexus',
+                        '-A', 'trust', '-E', 'UTF8', '--locale=C', '--no-sync'],
+                       check=True, capture_output=True, text=True)
+        subprocess.run([find_pg_bin(pg_bin, 'pg_ctl'), '-D', str(data_dir), '-l', str(root / 'postgres.log'),
+                        '-o', f"-k {root} -c listen_addresses=''", '-w', 'start'],
+                       check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(root, ignore_errors=True)
+        raise BenchSetupError(f"Could not start a temporary cluster: {e.stderr.strip() or e}") from None
+
+    try:
+        yield make_dsn(host=str(root), user='nexus', dbname='postgres')
+    finally:
+        subprocess.run([find_pg_bin(pg_bin, 'pg_ctl'), '-D', str(data_dir), '-m', 'immediate', 'stop'],
+                       capture_output=True)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def scratch_database(admin_dsn: str, name: str) -> Iterator[str]:
+    """Create an empty database on the server of `admin_dsn`; dropped on exit.
+
+    Encoding and locale match the nexus-db container (UTF8, C).
+
+    Yields: its DSN
+    """
+    def run(sql):
+        conn = psycopg2.connect(admin_dsn)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        finally:
+            conn.close()
+
+    run(f'DROP DATABASE IF EXISTS "{name}"')
+    run(f"CREATE DATABASE \"{name}\" TEMPLATE template0 ENCODING 'UTF8' LC_COLLATE 'C' LC_CTYPE 'C'")
+    try:
+        yield make_dsn(admin_dsn, dbname=name)
+    finally:
+        run(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+
+
+def apply_schema(dsn: str, psql: str, schema_path: Optional[Path], verbose: bool = False):
+    """Load the schema into the bench database with psql.
+
+    Without `schema_path`, replays SCHEMA_BOOTSTRAP and then every
+    migrations/*.up.sql in migrate.sh order, with SCHEMA_DRIFT files before
+    the migrations they are keyed by. Some historical migrations don't
+    apply to an empty database (they depend on objects created out of band),
+    so failures are reported and skipped; check_schema() then decides whether
+    the receipt path is complete.
+    """
+    if schema_path:
+        files = [schema_path]
+    else:
+        files = list(SCHEMA_BOOTSTRAP)
+        for path in sorted(MIGRATIONS_DIR.glob('*.up.sql')):
+            if path.name.startswith('verify_'):
+                continue
+            if path.name in SCHEMA_DRIFT:
+                files.append(SCHEMA_DRIFT[path.name])
+            files.append(path)
+
+    failed = []
+    for path in files:
+        result = subprocess.run([psql, '-X', '-q', '-v', 'ON_ERROR_STOP=1', '-d', dsn, '-f', str(path)],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            error = next((line for line in result.stderr.splitlines() if 'ERROR' in line),
+                         result.stderr.strip())
+            if schema_path:
+                raise BenchSetupError(f"{path.name} failed: {error}")
+            failed.append((path.name, error))
+
+    print(f"Schema: {schema_path.name if schema_path else f'{len(files)} files replayed'}"
+          + (f", {len(failed)} failed on an empty database" if failed else ""))
+    if verbose:
+        for name, error in failed:
+            print(f"  {name}: {error}")
+    return failed
+
+
+def check_schema(dsn: str):
+    """Raise BenchSetupError unless the receipt tables and functions are usable."""
+    missing = []
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            for relation in REQUIRED_RELATIONS:
+                cur.execute("SELECT to_regclass(%s)", (relation,))
+                if cur.fetchone()[0] is None:
+                    missing.append(relation)
+        for sql in REQUIRED_CALLS:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+            except psycopg2.Error as e:
+                missing.append(f"{sql} ({e.pgerror.strip().splitlines()[0] if e.pgerror else e})")
+            conn.rollback()
+    finally:
+        conn.close()
+    if missing:
+        raise BenchSetupError("Schema can't run the receipt pipeline, missing: " + '; '.join(missing)
+                              + " - pass --schema with a pg_dump --schema-only of the live database")
+
+
+# ============================================================================
+# Measurement
+# ============================================================================
+
+class CompletionClock:
+    """Per-receipt latency samples from the times receipts complete.
+
+    A receipt's latency is the time since the previous completion (or the
+    phase start); k receipts completing at once get 1/k of the gap each.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.samples: List[float] = []
+
+    def done(self, count: int):
+        if count <= 0:
+            return
+        now = time.perf_counter()
+        self.samples.extend([(now - self.last) / count] * count)
+        self.last = now
+
+    @contextlib.contextmanager
+    def watching(self, module, name: str, count: Callable[[Any], int]):
+        """Record completions from module.<name> (count(result) receipts per call) while active."""
+        original = getattr(module, name)
+
+        def wrapper(*args, **kwargs):
+            result = original(*args, **kwargs)
+            self.done(count(result))
+            return result
+
+        setattr(module, name, wrapper)
+        try:
+            yield
+        finally:
+            setattr(module, name, original)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for no samples)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def reset_peak_rss() -> bool:
+    """Reset this process's peak RSS (Linux /proc/self/clear_refs). Returns: True if supported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss() (VmHWM), else since process start."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def children_peak_rss_mb() -> float:
+    """Largest peak RSS of any finished child (pool workers, pdftotext) so far."""
+    maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+@contextlib.contextmanager
+def measured_phase(results: Dict[str, Dict], phase: str, quiet: bool) -> Iterator[CompletionClock]:
+    """Measure one phase into results[phase]; the body records completions on the clock."""
+    import receipt_ingestion as ri
+
+    ri.METRICS.reset()
+    reset_peak_rss()
+    clock = CompletionClock()
+    with open(os.devnull, 'w') if quiet else contextlib.nullcontext(sys.stdout) as out, \
+            contextlib.redirect_stdout(out):
+        yield clock
+    elapsed = time.perf_counter() - clock.started
+
+    snapshot = ri.METRICS.snapshot()
+    receipts = len(clock.samples)
+    results[phase] = {
+        'receipts': receipts,
+        'seconds': round(elapsed, 3),
+        'receipts_per_second': round(receipts / elapsed, 2) if elapsed > 0 else 0.0,
+        'p95_ms': round(percentile(clock.samples, 95) * 1000, 2),
+        'db_round_trips': sum(int(stats['db_round_trips']) for stats in snapshot.values()),
+        'api_calls': sum(int(stats['api_calls']) for stats in snapshot.values()),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'children_peak_rss_mb': round(children_peak_rss_mb(), 1),
+    }
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def approve_fixture_templates(conn, mailbox: FakeGmail) -> int:
+    """Approve the Carrefour templates of the fixture PDFs, as they are in production.
+
+    On an empty database every template is new, so the parse phase would stop
+    at needs_review and insert no items. Each distinct fixture is extracted
+    once here, outside the measured phases.
+
+    Returns: number of templates approved
+    """
+    import receipt_ingestion as ri
+    from carrefour_parser import parse_carrefour_receipt, PARSE_VERSION
+    from pdf_extract import extract_pdf_text
+
+    templates = {}
+    for data in mailbox.fixture_pdfs():
+        path = ri.BLOB_STORE.locate(hashlib.sha256(data).hexdigest())
+        if path is None:
+            continue
+        try:
+            parsed = parse_carrefour_receipt(extract_pdf_text(path))
+        except Exception as e:
+            print(f"  Fixture {path.name[:16]}... not parsed: {e}")
+            continue
+        if parsed.get('template_hash'):
+            templates[parsed['template_hash']] = parsed.get('parse_version', PARSE_VERSION)
+
+    if templates:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO finance.receipt_templates (vendor, template_hash, parse_version, status, notes)
+                VALUES %s
+                ON CONFLICT (template_hash) DO UPDATE SET status = 'approved'
+            """, list(templates.items()),
+                template="('carrefour_uae', %s, %s, 'approved', 'Receipt benchmark fixture')")
+        conn.commit()
+    return len(templates)
+
+
+def seed_link_transactions(conn) -> int:
+    """Insert a bank-SMS stand-in transaction for every LINK_SEED_EVERY-th parsed receipt.
+
+    Returns: number of transactions inserted
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO finance.transactions
+                (date, merchant_name, amount, currency, category, is_grocery, client_id, notes)
+            SELECT r.receipt_date, 'CARREFOUR', -r.total_amount, 'AED', 'Groceries', true,
+                   'bench:' || r.id, 'receipt benchmark SMS stand-in'
+            FROM finance.receipts r
+            WHERE r.parse_status = 'success'
+              AND r.receipt_date IS NOT NULL
+              AND r.total_amount IS NOT NULL
+              AND r.id %% %s = 0
+        """, (LINK_SEED_EVERY,))
+        seeded = cur.rowcount
+    conn.commit()
+    return seeded
+
+
+def run_pipeline(dsn: str, mailbox: FakeGmail, args) -> Dict[str, Dict]:
+    """Fetch, parse and link the mailbox into the bench database, measuring each phase."""
+    import receipt_ingestion as ri
+
+    params = parse_dsn(dsn)
+    ri.DB_CONFIG.update(host=params.get('host', 'localhost'), port=params.get('port', '5432'),
+                        database=params['dbname'], user=params.get('user', 'nexus'),
+                        password=params.get('password', ''))
+    conn = ri.get_db_connection(max_retries=0)
+    ri.refresh_brand_index(conn)
+    conn.commit()
+    service = mailbox.service()
+    results: Dict[str, Dict] = {}
+    quiet = not args.verbose
+
+    try:
+        with measured_phase(results, 'fetch', quiet) as clock, \
+                clock.watching(ri, 'process_gmail_message', len), \
+                clock.watching(ri, 'process_html_email', len):
+            for vendor, (gmail_label, content_type) in ri.VENDOR_LABELS.items():
+                ri.fetch_label_receipts(
+                    service, conn, gmail_label, vendor=vendor, content_type=content_type,
+                    batch_size=args.batch_size, download_workers=args.download_workers,
+                    service_factory=lambda: service)
+
+        approved = approve_fixture_templates(conn, mailbox)
+        with measured_phase(results, 'parse', quiet) as clock, \
+                clock.watching(ri, 'store_parsed_receipt', lambda _: 1):
+            ri.parse_pending_receipts(conn, workers=args.workers)
+
+        seeded = seed_link_transactions(conn)
+        with measured_phase(results, 'link', quiet) as clock, \
+                clock.watching(ri, 'link_receipts_to_transactions', int), \
+                clock.watching(ri, 'create_transactions_for_unlinked_receipts', int):
+            ri.link_receipts_to_transactions(conn)
+            ri.create_transactions_for_unlinked_receipts(conn)
+        results['parse']['approved_templates'] = approved
+        results['link']['seeded_transactions'] = seeded
+
+        with conn.cursor() as cur:
+            cur.execute("SELECT parse_status, COUNT(*) FROM finance.receipts GROUP BY 1 ORDER BY 1")
+            results['parse']['status_counts'] = dict(cur.fetchall())
+    finally:
+        conn.close()
+    return results
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    """Set up fixtures, database and pipeline config, run it once and return the report."""
+    with tempfile.TemporaryDirectory(prefix='receipt-bench-') as workdir:
+        # receipt_ingestion reads these at import time
+        os.environ['PDF_STORAGE_PATH'] = str(Path(workdir) / 'receipts')
+        os.environ['SECRETS_DIR'] = workdir
+        os.environ['GMAIL_LABEL_CACHE'] = str(Path(workdir) / 'gmail_labels.json')
+        os.environ['PIPELINE_REPORT_PATH'] = str(Path(workdir) / 'pipeline_report.json')
+        os.environ['BRAND_INDEX_CACHE'] = str(Path(workdir) / 'brand_index.json')
+
+        mailbox, counts = build_mailbox([Path(d) for d in args.fixtures], args.scale)
+        print(f"Mailbox: {', '.join(f'{n} messages in {label}' for label, n in counts.items())}")
+
+        with contextlib.ExitStack() as stack:
+            if args.db_url:
+                admin_dsn = args.db_url
+            else:
+                admin_dsn = stack.enter_context(throwaway_cluster(args.pg_bin))
+            dsn = stack.enter_context(scratch_database(admin_dsn, f"receipt_bench_{os.getpid()}"))
+            apply_schema(dsn, find_pg_bin(args.pg_bin, 'psql'),
+                         Path(args.schema) if args.schema else None, verbose=args.verbose)
+            check_schema(dsn)
+            phases = run_pipeline(dsn, mailbox, args)
+
+    from pdf_extract import get_pdf_extractor
+    return {
+        'recorded_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'host': {
+            'hostname': platform.node(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'pdf_extractor': get_pdf_extractor().method,
+        },
+        'options': {
+            'scale': args.scale,
+            'workers': args.workers,
+            'batch_size': args.batch_size,
+            'download_workers': args.download_workers,
+        },
+        'phases': phases,
+    }
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Check every phase metric against the baseline (see REGRESSION_TOLERANCES).
+
+    Returns: descriptions of the regressions (empty = pass)
+    """
+    regressions = []
+    print(f"\n=== Compared with baseline of {baseline['recorded_at']} ({baseline['host']['hostname']}) ===")
+    if baseline['host'] != report['host']:
+        print(f"  Note: baseline host {baseline['host']} differs from {report['host']}")
+    for phase in PHASES:
+        for metric, (higher_is_better, tolerance) in REGRESSION_TOLERANCES.items():
+            expected = baseline['phases'].get(phase, {}).get(metric)
+            actual = report['phases'][phase][metric]
+            if not expected:
+                continue
+            change = (actual - expected) / expected
+            worse = -change if higher_is_better else change
+            verdict = 'REGRESSED' if worse > tolerance else 'ok'
+            print(f"  {phase:6s} {metric:20s} {actual:>10} vs {expected:>10} ({change:+.1%})  {verdict}")
+            if verdict != 'ok':
+                regressions.append(f"{phase} {metric}: {actual} vs baseline {expected} "
+                                   f"({change:+.1%}, tolerance {tolerance:.0%})")
+
+    # Same fixtures, same outcome: a receipt that parses differently is a
+    # regression however fast it was, and no fixture may fail to parse
+    status_counts = report['phases']['parse']['status_counts']
+    expected_counts = baseline['phases']['parse'].get('status_counts')
+    if status_counts != expected_counts:
+        print(f"  parse  status_counts        {status_counts} vs {expected_counts}  REGRESSED")
+        regressions.append(f"parse status_counts: {status_counts} vs baseline {expected_counts}")
+    if status_counts.get('failed'):
+        regressions.append(f"parse failed: {status_counts['failed']} receipt(s) failed to parse")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    print("\n=== Receipt Pipeline Benchmark ===")
+    print(f"  {'phase':6s} {'receipts':>8s} {'rcpt/s':>9s} {'p95 ms':>9s} {'db trips':>9s} "
+          f"{'api calls':>9s} {'peak RSS':>9s}")
+    for phase in PHASES:
+        r = report['phases'][phase]
+        print(f"  {phase:6s} {r['receipts']:>8} {r['receipts_per_second']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['db_round_trips']:>9} {r['api_calls']:>9} {r['peak_rss_mb']:>7.1f}MB")
+    print(f"  parse status: {report['phases']['parse']['status_counts']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline receipt pipeline benchmark')
+    parser.add_argument('--scale', type=int, default=10, metavar='N',
+                        help='Copies of each fixture email (default 10)')
+    parser.add_argument('--fixtures', action='append', metavar='DIR',
+                        help='Directory of .pdf/.eml fixtures (repeatable; default: the repo fixtures)')
+    parser.add_argument('--workers', type=int, default=0, metavar='N',
+                        help='Parse in N processes (receipt_ingestion.py --workers)')
+    parser.add_argument('--batch-size', type=int, default=50, metavar='N',
+                        help='Gmail calls per batch request (receipt_ingestion.py --batch-size)')
+    parser.add_argument('--download-workers', type=int, default=0, metavar='N',
+                        help='Attachment download threads (receipt_ingestion.py --download-workers)')
+    parser.add_argument('--db-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='Create the scratch database on this server instead of a temporary cluster')
+    parser.add_argument('--pg-bin', default=os.environ.get('PG_BIN'), metavar='DIR',
+                        help='Directory with initdb, pg_ctl and psql')
+    parser.add_argument('--schema', metavar='FILE',
+                        help='Schema to load (pg_dump --schema-only) instead of replaying migrations')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH), metavar='FILE',
+                        help='Baseline to compare with / update')
+    parser.add_argument('--update-baseline', action='store_true', help='Write this run as the baseline')
+    parser.add_argument('--no-compare', action='store_true', help="Don't compare with the baseline")
+    parser.add_argument('--json', metavar='FILE', help='Also write the report to FILE')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline output and migration failures')
+    args = parser.parse_args()
+    args.fixtures = args.fixtures or [str(d) for d in FIXTURE_DIRS]
+
+    sys.path.insert(0, str(SCRIPT_DIR))
+    try:
+        report = run_benchmark(args)
+    except BenchSetupError as e:
+        print(f"Benchmark setup failed: {e}")
+        sys.exit(2)
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2) + '\n')
+
+    baseline_path = Path(args.baseline)
+    failed = report['phases']['parse']['status_counts'].get('failed')
+    if args.update_baseline:
+        if failed:
+            print(f"\nNot recording a baseline with {failed} failed receipt(s) "
+                  f"(see --verbose for the parse errors)")
+            sys.exit(1)
+        baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"\nBaseline written to {baseline_path}")
+        return
+    if args.no_compare:
+        return
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path} (record one on the reference host with --update-baseline)")
+        if failed:
+            print(f"{failed} receipt(s) failed to parse")
+            sys.exit(1)
+        return
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline['options'] != report['options']:
+        print(f"\nBaseline was recorded with {baseline['options']}, this run used {report['options']}: "
+              f"re-run with the same options or pass --no-compare")
+        sys.exit(2)
+
+    regressions = compare_with_baseline(report, baseline)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+-- Receipt benchmark: schema drift
+-- Receipt columns and statuses the live database has that no migration
+-- creates (they were changed by hand). When bench_pipeline.py replays
+-- migrations into an empty database it applies this just before migration
+-- 167, so 167 and the parse stage find them.
+-- Item match columns follow backend/contracts/receipts.md.
+
+ALTER TABLE finance.receipts
+    ADD COLUMN IF NOT EXISTS parsed_json JSONB,
+    ADD COLUMN IF NOT EXISTS doc_type VARCHAR(50);
+
+-- receipt_ingestion.py also writes needs_review (template drift) and skipped
+-- (unsupported document types)
+ALTER TABLE finance.receipts DROP CONSTRAINT IF EXISTS receipts_parse_status_check;
+ALTER TABLE finance.receipts ADD CONSTRAINT receipts_parse_status_check
+    CHECK (parse_status IN ('pending', 'success', 'failed', 'partial', 'needs_review', 'skipped'));
+
+ALTER TABLE finance.receipt_items
+    ADD COLUMN IF NOT EXISTS matched_food_id INTEGER,
+    ADD COLUMN IF NOT EXISTS match_confidence NUMERIC(3,2),
+    ADD COLUMN IF NOT EXISTS is_user_confirmed BOOLEAN DEFAULT FALSE,
+    ADD COLUMN IF NOT EXISTS nutrition_snapshot JSONB;
@@ -0,0 +1,229 @@
+"""
+Content-addressed receipt blob store
+
+Receipt PDFs/HTML bodies are stored by SHA256 of their content in two levels
+of shard directories so no single directory grows without bound:
+
+    <root>/ab/cd/abcd1234...   (full 64-char hex digest)
+
+Writes go to a temp file in the target shard, are fsynced, then renamed into
+place, so a crash mid-write never leaves a torn file under a blob's name.
+Writing a blob that already exists is a no-op.
+
+Content whose hash isn't known up front (attachments decoded from Gmail) is
+streamed into <root>/.staging/ with stage(), hashed as it is written, and then
+committed into its shard or discarded (e.g. a duplicate). Staged files left
+behind by a crash are removed by clear_staging().
+
+Receipts ingested before the store existed live in the flat
+<root>/<hash16>_<filename> layout. open_blob()/locate() accept that legacy
+path as a fallback, and adopt_legacy_blob() copies such a file into its shard.
+"""
+
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Tuple, Union
+
+_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+STAGING_DIR = '.staging'
+
+
+class BlobStore:
+    """Sharded, content-addressed file store rooted at `root`."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path_for(self, content_hash: str) -> Path:
+        """Shard path of a blob: <root>/aa/bb/<sha256>."""
+        if not _HASH_RE.match(content_hash):
+            raise ValueError(f"Not a SHA256 hex digest: {content_hash!r}")
+        return self.root / content_hash[:2] / content_hash[2:4] / content_hash
+
+    def relative_path(self, content_hash: str) -> str:
+        """Blob path relative to the store root's parent (finance.receipts.pdf_storage_path)."""
+        return str(self.path_for(content_hash).relative_to(self.root.parent))
+
+    def exists(self, content_hash: str) -> bool:
+        return self.path_for(content_hash).exists()
+
+    def put(self, data: bytes, content_hash: Optional[str] = None) -> Tuple[Path, bool]:
+        """Store `data` atomically under its hash.
+
+        Returns: (blob_path, created) - created is False when it already existed
+        """
+        if content_hash is None:
+            content_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(content_hash)
+        if path.exists():
+            return path, False
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+        _fsync_dir(path.parent)
+        return path, True
+
+    def stage(self, chunks: Iterable[bytes]) -> 'StagedBlob':
+        """Write `chunks` to a staging file, hashing as they are written.
+
+        Only one chunk is held at a time. The file is fsynced before this
+        returns; commit() or discard() the result.
+        """
+        staging = self.root / STAGING_DIR
+        staging.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=staging)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            _unlink(tmp_path)
+            raise
+        return StagedBlob(self, Path(tmp_path), digest.hexdigest(), size)
+
+    def clear_staging(self, max_age: float = 86400) -> int:
+        """Delete staging files older than `max_age` seconds (left by a crash).
+
+        Returns: number of files removed
+        """
+        staging = self.root / STAGING_DIR
+        if not staging.is_dir():
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in staging.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def locate(self, content_hash: str, legacy_path: Optional[Path] = None) -> Optional[Path]:
+        """Path of a blob: its shard if present, else `legacy_path` if that exists."""
+        path = self.path_for(content_hash)
+        if path.exists():
+            return path
+        if legacy_path is not None and Path(legacy_path).is_file():
+            return Path(legacy_path)
+        return None
+
+    def open_blob(self, content_hash: str, legacy_path: Optional[Path] = None) -> Union[mmap.mmap, memoryview]:
+        """Read-only memory-mapped view of a blob (usable as a context manager).
+
+        A zero-byte blob (e.g. a truncated attachment) can't be mapped and
+        gives an empty memoryview, so readers see no content instead of an
+        mmap ValueError.
+
+        Raises FileNotFoundError if neither the shard nor `legacy_path` exists.
+        """
+        path = self.locate(content_hash, legacy_path)
+        if path is None:
+            raise FileNotFoundError(f"Blob not found: {content_hash}")
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'')
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def adopt_legacy_blob(self, content_hash: str, legacy_path: Path) -> Optional[Path]:
+        """Copy a flat-layout file into its shard after verifying its hash.
+
+        The legacy file is left in place; callers remove it once nothing
+        references it any more.
+
+        Returns the shard path, or None if the legacy file is missing or its
+        content does not match `content_hash` (e.g. a torn write).
+        """
+        if self.exists(content_hash):
+            return self.path_for(content_hash)
+        if legacy_path is None or not legacy_path.is_file():
+            return None
+
+        data = legacy_path.read_bytes()
+        if hashlib.sha256(data).hexdigest() != content_hash:
+            return None
+        path, _ = self.put(data, content_hash)
+        return path
+
+
+class StagedBlob:
+    """Content streamed into the store's staging area, not yet under its hash."""
+
+    def __init__(self, store: BlobStore, tmp_path: Path, content_hash: str, size: int):
+        self.store = store
+        self.tmp_path = tmp_path
+        self.content_hash = content_hash
+        self.size = size
+        self.done = False
+
+    def commit(self) -> Tuple[Path, bool]:
+        """Move the staged file into its shard (dropped if the blob already exists).
+
+        Returns: (blob_path, created), like BlobStore.put()
+        """
+        path = self.store.path_for(self.content_hash)
+        if self.done:
+            return path, False
+        self.done = True
+        if path.exists():
+            _unlink(self.tmp_path)
+            return path, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.chmod(self.tmp_path, 0o644)
+            os.replace(self.tmp_path, path)
+        except BaseException:
+            _unlink(self.tmp_path)
+            raise
+        _fsync_dir(path.parent)
+        return path, True
+
+    def discard(self):
+        """Delete the staged file (no-op once committed or discarded)."""
+        if not self.done:
+            self.done = True
+            _unlink(self.tmp_path)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _fsync_dir(directory: Path):
+    """Persist a rename by fsyncing the containing directory (POSIX only)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,294 @@
+"""
+Brand index for receipt line items
+
+Both receipt parsers tag line items with a brand (extract_brand()). Known
+brands come from finance.known_brands (brand_name plus aliases, active rows;
+see migrations 079 and 201) and are matched as whole words through a token
+trie, so the cost per item depends on the description's length, not on the
+number of brands:
+
+    "nestle maggi chicken stock"  ->  nestle -> maggi -> "Maggi"
+    "kinder bueno 43 g"           ->  kinder -> "Kinder"
+
+When several brands match, the leftmost wins, then the longest. Results are
+memoized per lowercased description.
+
+refresh_brand_index(conn) loads the table and writes it to a JSON cache file
+together with a version stamp (an md5 of the active rows, computed by the
+database), so later runs and worker processes read the cache and the table is
+only re-read when the stamp changes. Without a database or cache (the
+parsers' __main__, a fresh checkout) the index is built from LITERAL_BRANDS.
+"""
+
+import json
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# Bump when matching/normalization changes so existing cache files are rebuilt
+INDEX_FORMAT = 1
+
+# Cache file written by refresh_brand_index(); worker processes re-check its
+# mtime at most this often
+CACHE_PATH = Path(os.environ.get('BRAND_INDEX_CACHE', str(Path(__file__).parent / 'brand_index.json')))
+CACHE_RECHECK_SECONDS = 60
+
+# Lowercased descriptions memoized per index
+MATCH_CACHE_SIZE = 8192
+
+# Fallback brands when finance.known_brands can't be read (or is empty);
+# matched brands are returned title-cased
+LITERAL_BRANDS = {
+    # Cereals & Breakfast
+    'nestle', 'nestlé', 'kelloggs', "kellogg's", 'quaker',
+    # Chocolate & Snacks
+    'kinder', 'galaxy', 'cadbury', 'cadburys', 'lindt', 'toblerone', 'kitkat', 'snickers', 'mars',
+    # Spreads & Jams
+    'bonne maman', 'nutella', 'skippy',
+    # Rice & Grains
+    'tilda', 'uncle bens', "uncle ben's",
+    # Spices & Seasonings
+    'bayara', 'maggi',
+    # Dairy
+    'almarai', 'al marai', 'lurpak', 'philadelphia', 'kiri', 'puck', 'nadec', 'anchor',
+    # Beverages
+    'vimto', 'tang', 'nescafe', 'nescafé', 'lipton', 'red bull', 'coca cola', 'pepsi',
+    # Bakery
+    'modern bakery', 'americana',
+    # Health & Organic
+    'earth goods', 'goody',
+    # Personal Care
+    'dettol', 'fairy',
+}
+
+# Words to skip when doing position-based extraction
+SKIP_WORDS = {
+    'the', 'fresh', 'organic', 'natural', 'premium', 'classic', 'original',
+    'mini', 'large', 'small', 'medium', 'extra', 'super', 'new', 'special',
+    'carrot', 'tomato', 'potato', 'onion', 'apple', 'banana', 'orange', 'lemon',
+    'chicken', 'beef', 'lamb', 'fish', 'salmon', 'tuna', 'shrimp',
+}
+
+BRAND_STAMP_SQL = """
+    SELECT md5(coalesce(string_agg(
+               brand_name || '=' || array_to_string(coalesce(aliases, '{}'), '|'),
+               ';' ORDER BY brand_name), ''))
+    FROM finance.known_brands
+    WHERE is_active
+"""
+
+BRAND_ROWS_SQL = """
+    SELECT brand_name, coalesce(aliases, '{}')
+    FROM finance.known_brands
+    WHERE is_active
+    ORDER BY brand_name
+"""
+
+REFRESH_SAVEPOINT = 'brand_index_refresh'
+
+# Trie key holding the brand that ends at a node
+_END = None
+
+
+class BrandIndex:
+    """Token trie over brand names and aliases.
+
+    `brands` maps a lowercased name or alias to the brand reported for it.
+    A brand matches where its words appear as whole space-separated tokens
+    followed by a space, anywhere in the description; with allow_comma it may
+    also end in a comma when it starts the description ("almarai, milk").
+    """
+
+    def __init__(self, brands: Dict[str, str], version: str):
+        self.brands = dict(brands)
+        self.version = version
+        self.trie: Dict[Any, Any] = {}
+        for name, brand in self.brands.items():
+            node = self.trie
+            for word in name.split(' '):
+                node = node.setdefault(word, {})
+            node[_END] = brand
+        self.match = lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    @classmethod
+    def from_literals(cls, version: str = f'{INDEX_FORMAT}:literals') -> 'BrandIndex':
+        return cls({name: name.title() for name in LITERAL_BRANDS}, version)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, Iterable[str]]], version: str) -> 'BrandIndex':
+        """Index (brand_name, aliases) rows; the first brand claiming an alias keeps it."""
+        brands: Dict[str, str] = {}
+        for brand_name, aliases in rows:
+            brands.setdefault(brand_name.lower(), brand_name)
+            for alias in aliases:
+                brands.setdefault(alias.lower(), brand_name)
+        return cls(brands, version)
+
+    def _match(self, desc_lower: str, allow_comma: bool = False) -> Optional[str]:
+        """Brand for a lowercased description (memoized through self.match)."""
+        tokens = desc_lower.split(' ')
+        last = len(tokens) - 1
+        for start in range(last + 1):
+            node = self.trie
+            found = None
+            for pos in range(start, last + 1):
+                token = tokens[pos]
+                if allow_comma and start == 0 and ',' in token:
+                    child = node.get(token.split(',', 1)[0])
+                    if child is not None and _END in child:
+                        found = child[_END]
+                node = node.get(token)
+                if node is None:
+                    break
+                if _END in node and pos < last:
+                    found = node[_END]
+            if found is not None:
+                return found
+        return None
+
+
+def load_cached_index(path: Path = CACHE_PATH) -> Optional[BrandIndex]:
+    """Index from the cache file, or None if it is missing or unreadable."""
+    try:
+        data = json.loads(path.read_text())
+        if not str(data['version']).startswith(f'{INDEX_FORMAT}:'):
+            return None
+        return BrandIndex(data['brands'], data['version'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_index(index: BrandIndex, path: Path = CACHE_PATH):
+    """Write the cache file atomically (workers may be reading it)."""
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        tmp_path.write_text(json.dumps({'version': index.version, 'brands': index.brands},
+                                       ensure_ascii=False, indent=1, sort_keys=True))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"  Could not write brand index cache {path}: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
+
+_active: Optional[BrandIndex] = None
+_cache_mtime: Optional[float] = None
+_next_check = 0.0
+
+
+def _cache_file_mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def get_brand_index() -> BrandIndex:
+    """The index in use: the cache file if there is one, else LITERAL_BRANDS.
+
+    The cache file's mtime is re-checked every CACHE_RECHECK_SECONDS, so
+    worker processes pick up a refresh made by the parent.
+    """
+    global _active, _cache_mtime, _next_check
+    now = time.monotonic()
+    if _active is not None and now < _next_check:
+        return _active
+    _next_check = now + CACHE_RECHECK_SECONDS
+
+    mtime = _cache_file_mtime(CACHE_PATH)
+    if _active is None or (mtime is not None and mtime != _cache_mtime):
+        cached = load_cached_index(CACHE_PATH) if mtime is not None else None
+        _active = cached or _active or BrandIndex.from_literals()
+        _cache_mtime = mtime
+    return _active
+
+
+def set_brand_index(index: BrandIndex):
+    global _active, _cache_mtime, _next_check
+    _active = index
+    _cache_mtime = _cache_file_mtime(CACHE_PATH)
+    _next_check = time.monotonic() + CACHE_RECHECK_SECONDS
+
+
+def refresh_brand_index(conn) -> BrandIndex:
+    """Make finance.known_brands the active index, rewriting the cache file.
+
+    Only the version stamp is queried when the active index or the cache file
+    is already current. Runs inside a savepoint of the caller's transaction
+    (the caller commits); if the table can't be read, the current index
+    (cache or literals) stays in use.
+    """
+    import psycopg2
+
+    index = get_brand_index()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SAVEPOINT {REFRESH_SAVEPOINT}")
+            try:
+                cur.execute(BRAND_STAMP_SQL)
+                version = f'{INDEX_FORMAT}:{cur.fetchone()[0]}'
+                if index.version != version:
+                    cached = load_cached_index(CACHE_PATH)
+                    if cached is not None and cached.version == version:
+                        index = cached
+                    else:
+                        cur.execute(BRAND_ROWS_SQL)
+                        rows = cur.fetchall()
+                        if rows:
+                            index = BrandIndex.from_rows(rows, version)
+                        else:
+                            index = BrandIndex.from_literals(version)
+                        save_index(index, CACHE_PATH)
+            except psycopg2.Error:
+                cur.execute(f"ROLLBACK TO SAVEPOINT {REFRESH_SAVEPOINT}")
+                raise
+            finally:
+                cur.execute(f"RELEASE SAVEPOINT {REFRESH_SAVEPOINT}")
+    except psycopg2.Error as e:
+        reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+        print(f"  Could not load finance.known_brands ({reason}); using brand index {index.version}")
+        return index
+
+    set_brand_index(index)
+    return index
+
+
+def extract_brand(description: str, allow_comma: bool = False) -> Dict[str, Any]:
+    """
+    Extract brand from item description.
+    Returns dict with brand, confidence, source.
+
+    allow_comma: a known brand may end in a comma at the start of the
+    description, and the position fallback splits words on commas too.
+    """
+    if not description:
+        return {"brand": None, "brand_confidence": None, "brand_source": None}
+
+    # Try known brands first (high confidence)
+    brand = get_brand_index().match(description.lower(), allow_comma)
+    if brand:
+        return {
+            "brand": brand,
+            "brand_confidence": 0.95,
+            "brand_source": "known_list"
+        }
+
+    # Fallback: first word if capitalized and not in skip list
+    words = (description.replace(',', ' ') if allow_comma else description).split()
+    if words:
+        first_word = words[0]
+        if (len(first_word) > 2
+            and first_word[0].isupper()
+            and not first_word[0].isdigit()
+            and first_word.lower() not in SKIP_WORDS):
+            return {
+                "brand": first_word,
+                "brand_confidence": 0.60,
+                "brand_source": "position"
+            }
+
+    return {"brand": None, "brand_confidence": None, "brand_source": None}
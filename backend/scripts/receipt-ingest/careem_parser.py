@@ -38,82 +38,17 @@ import re
 import hashlib
 import quopri
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import List, Optional
 from pathlib import Path
 from email import policy
 from email.parser import BytesParser
 
-# Parser version - increment when parsing logic changes
-PARSE_VERSION = 'careem_v2'
-
-# Known brands for high-confidence matching (synced with finance.known_brands)
-KNOWN_BRANDS = {
-    # Cereals & Breakfast
-    'nestle', 'nestlé', 'kelloggs', "kellogg's", 'quaker',
-    # Chocolate & Snacks
-    'kinder', 'galaxy', 'cadbury', 'cadburys', 'lindt', 'toblerone', 'kitkat', 'snickers', 'mars',
-    # Spreads & Jams
-    'bonne maman', 'nutella', 'skippy',
-    # Rice & Grains
-    'tilda', 'uncle bens', "uncle ben's",
-    # Spices & Seasonings
-    'bayara', 'maggi',
-    # Dairy
-    'almarai', 'al marai', 'lurpak', 'philadelphia', 'kiri', 'puck', 'nadec', 'anchor',
-    # Beverages
-    'vimto', 'tang', 'nescafe', 'nescafé', 'lipton', 'red bull', 'coca cola', 'pepsi',
-    # Bakery
-    'modern bakery', 'americana',
-    # Health & Organic
-    'earth goods', 'goody',
-    # Personal Care
-    'dettol', 'fairy',
-}
+from brand_index import extract_brand
+from receipt_models import LineItem, ParsedReceipt
 
-# Words to skip when doing position-based extraction
-SKIP_WORDS = {
-    'the', 'fresh', 'organic', 'natural', 'premium', 'classic', 'original',
-    'mini', 'large', 'small', 'medium', 'extra', 'super', 'new', 'special',
-    'carrot', 'tomato', 'potato', 'onion', 'apple', 'banana', 'orange', 'lemon',
-    'chicken', 'beef', 'lamb', 'fish', 'salmon', 'tuna', 'shrimp',
-}
 
-
-def extract_brand(description: str) -> Dict[str, Any]:
-    """
-    Extract brand from item description.
-    Returns dict with brand, confidence, source.
-    """
-    if not description:
-        return {"brand": None, "brand_confidence": None, "brand_source": None}
-
-    desc_lower = description.lower()
-
-    # Try known brands first (high confidence)
-    for brand in KNOWN_BRANDS:
-        if desc_lower.startswith(brand + ' ') or f' {brand} ' in desc_lower:
-            # Return properly capitalized brand name
-            return {
-                "brand": brand.title(),
-                "brand_confidence": 0.95,
-                "brand_source": "known_list"
-            }
-
-    # Fallback: first word if capitalized and not in skip list
-    words = description.split()
-    if words:
-        first_word = words[0]
-        if (len(first_word) > 2
-            and first_word[0].isupper()
-            and not first_word[0].isdigit()
-            and first_word.lower() not in SKIP_WORDS):
-            return {
-                "brand": first_word,
-                "brand_confidence": 0.60,
-                "brand_source": "position"
-            }
-
-    return {"brand": None, "brand_confidence": None, "brand_source": None}
+# Parser version - increment when parsing logic changes
+PARSE_VERSION = 'careem_v3'
 
 
 def decode_quoted_printable(text: str) -> str:
@@ -159,7 +94,7 @@ def extract_email_date(eml_path: str) -> Optional[str]:
     return None
 
 
-def parse_careem_html(html_content: str) -> Dict[str, Any]:
+def parse_careem_html(html_content: str) -> ParsedReceipt:
     """
     Parse Careem Quik email HTML content.
 
@@ -167,16 +102,15 @@ def parse_careem_html(html_content: str) -> Dict[str, Any]:
     - Items: <span style="color: #18AB33">QTY &times;</span> Item Name
     - Prices: AED XX.XX
     """
-    result = {
+    result = ParsedReceipt("careem_quik", {
         "parser_version": "1.0.0",
         "parse_version": PARSE_VERSION,
         "vendor": "careem_quik",
         "currency": "AED",
         "parse_errors": [],
-        "line_items": [],
         "savings": {},
         "delivery": {}
-    }
+    })
 
     # Decode quoted-printable if needed
     if '=3D' in html_content or '=\n' in html_content:
@@ -239,21 +173,18 @@ def parse_careem_html(html_content: str) -> Dict[str, Any]:
                 price = 0.0
             original_price = None
 
-        item = {
-            "description": description,
-            "qty": qty,
-            "unit_price": round(price / qty, 2) if qty > 0 else price,
-            "total": price
-        }
+        item = LineItem(
+            description,
+            qty=qty,
+            unit_price=round(price / qty, 2) if qty > 0 else price,
+            total=price,
+            **extract_brand(description)
+        )
         if original_price and original_price != price:
-            item["original_price"] = original_price
-            item["discount"] = round(original_price - price, 2)
-
-        # Extract brand
-        brand_info = extract_brand(description)
-        item.update(brand_info)
+            item.original_price = original_price
+            item.discount = round(original_price - price, 2)
 
-        result["line_items"].append(item)
+        result.line_items.append(item)
 
     # =========================================================================
     # Extract Totals and Fees
@@ -380,7 +311,7 @@ def parse_careem_html(html_content: str) -> Dict[str, Any]:
     return result
 
 
-def parse_careem_receipt(eml_path: str) -> Dict[str, Any]:
+def parse_careem_receipt(eml_path: str) -> ParsedReceipt:
     """
     Parse Careem Quik receipt from .eml file.
 
@@ -388,14 +319,14 @@ def parse_careem_receipt(eml_path: str) -> Dict[str, Any]:
         eml_path: Path to .eml file
 
     Returns:
-        Dictionary with parsed receipt data
+        ParsedReceipt (to_dict() gives the format at the top of this module)
     """
     html_content = extract_html_from_eml(eml_path)
     if not html_content:
-        return {
+        return ParsedReceipt("careem_quik", {
             "parse_errors": ["Could not extract HTML content from email"],
             "vendor": "careem_quik"
-        }
+        })
 
     result = parse_careem_html(html_content)
 
@@ -411,7 +342,7 @@ def parse_careem_receipt(eml_path: str) -> Dict[str, Any]:
     return result
 
 
-def validate_parsed_receipt(parsed: Dict[str, Any]) -> List[str]:
+def validate_parsed_receipt(parsed: ParsedReceipt) -> List[str]:
     """
     Validate parsed receipt data.
 
@@ -428,7 +359,7 @@ def validate_parsed_receipt(parsed: Dict[str, Any]) -> List[str]:
     # Cross-validate: sum of items should be close to subtotal_after_discount
     # (items show post-discount prices, not original prices)
     if parsed.get("line_items"):
-        items_sum = sum(item.get("total", 0) for item in parsed["line_items"])
+        items_sum = sum(item.total for item in parsed.line_items)
         subtotal = parsed.get("subtotal_after_discount")
         if subtotal and abs(items_sum - subtotal) > 1.0:  # Allow 1 AED tolerance
             errors.append(f"Items sum ({items_sum:.2f}) differs from subtotal ({subtotal:.2f})")
@@ -456,4 +387,4 @@ if __name__ == "__main__":
         parsed["validation_errors"] = validation_errors
 
     # Output
-    print(json.dumps(parsed, indent=2, ensure_ascii=False))
+    print(json.dumps(parsed.to_dict(), indent=2, ensure_ascii=False))
@@ -42,83 +42,122 @@ Output format:
 import re
 import hashlib
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
 from pathlib import Path
 
-# Parser version - increment when parsing logic changes
-PARSE_VERSION = 'carrefour_v2'
-
-# Known brands for high-confidence matching (synced with finance.known_brands)
-KNOWN_BRANDS = {
-    # Cereals & Breakfast
-    'nestle', 'nestlé', 'kelloggs', "kellogg's", 'quaker',
-    # Chocolate & Snacks
-    'kinder', 'galaxy', 'cadbury', 'cadburys', 'lindt', 'toblerone', 'kitkat', 'snickers', 'mars',
-    # Spreads & Jams
-    'bonne maman', 'nutella', 'skippy',
-    # Rice & Grains
-    'tilda', 'uncle bens', "uncle ben's",
-    # Spices & Seasonings
-    'bayara', 'maggi',
-    # Dairy
-    'almarai', 'al marai', 'lurpak', 'philadelphia', 'kiri', 'puck', 'nadec', 'anchor',
-    # Beverages
-    'vimto', 'tang', 'nescafe', 'nescafé', 'lipton', 'red bull', 'coca cola', 'pepsi',
-    # Bakery
-    'modern bakery', 'americana',
-    # Health & Organic
-    'earth goods', 'goody',
-    # Personal Care
-    'dettol', 'fairy',
-}
+import brand_index
+from receipt_models import LineItem, ParsedReceipt
 
-# Words to skip when doing position-based extraction
-SKIP_WORDS = {
-    'the', 'fresh', 'organic', 'natural', 'premium', 'classic', 'original',
-    'mini', 'large', 'small', 'medium', 'extra', 'super', 'new', 'special',
-    'carrot', 'tomato', 'potato', 'onion', 'apple', 'banana', 'orange', 'lemon',
-    'chicken', 'beef', 'lamb', 'fish', 'salmon', 'tuna', 'shrimp',
-}
+
+# Parser version - increment when parsing logic changes
+PARSE_VERSION = 'carrefour_v3'
 
 
 def extract_brand(description: str) -> Dict[str, Any]:
+    """Extract brand from item description (see brand_index.extract_brand)."""
+    # Carrefour descriptions can put a comma straight after the brand ("Almarai, ...")
+    return brand_index.extract_brand(description, allow_comma=True)
+
+
+# Structural labels fingerprinted by compute_template_hash(). Order doesn't
+# matter (the fingerprint is sorted), but editing any entry changes every
+# template hash and sends all new receipts back to needs_review.
+TEMPLATE_LABELS = (
+    # Header labels - these define the receipt structure
+    r'Tax Invoice',
+    r'Invoice No\.?',
+    r'Order No\.?',
+    r'Invoice Date',
+    r'Order Date',
+    r'Exp\. Del\. Date',
+    r'CUSTOMER INFORMATION',
+    r'STORE INFORMATION',
+    r'TRN\s*:',
+    # Table column headers
+    r'Description',
+    r'Ordered',
+    r'Delivered',
+    r'Unit Price\s*(?:Incl|Excl)\.?\s*VAT',
+    r'Total\s*(?:Incl|Excl)\.?\s*VAT',
+    r'VAT\s*%',
+    r'VAT\s*Amount',
+    r'Discount',
+    r'Barcode:',
+    # Footer/summary labels
+    r'Total Amount Incl\.?\s*VAT',
+    r'Total Amount Excl\.?\s*VAT',
+    r'Payment Type',
+    r'Promo savings',
+    r'Products? savings',
+    r'Total savings',
+    r'Your Savings',
+    r'Majid Al Futtaim',
+    r'Thank you for shopping',
+)
+
+# Characters where str.lower() and re.IGNORECASE disagree on ASCII letters
+# ('\u0130' also lowercases to two code points, shifting offsets)
+CASEFOLD_MISMATCH_CHARS = '\u0130\u0131\u017f'
+
+
+class TemplateFingerprinter:
     """
-    Extract brand from item description.
-    Returns dict with brand, confidence, source.
+    Finds the first match of every template label in a single scan.
+
+    Labels are regexes matched case-insensitively; each one found contributes
+    its first match, lowercased. The scanner is one alternation of all labels,
+    factored by first letter and run over the lowercased text. Matches of
+    different labels can overlap ("VAT" inside "Total Incl VAT %"), so at each
+    hit the labels sharing the letter at every offset of the hit are tried
+    anchored there.
     """
-    if not description:
-        return {"brand": None, "brand_confidence": None, "brand_source": None}
-
-    desc_lower = description.lower()
-
-    # Try known brands first (high confidence)
-    for brand in KNOWN_BRANDS:
-        if desc_lower.startswith(brand + ' ') or f' {brand} ' in desc_lower or desc_lower.startswith(brand + ','):
-            # Return properly capitalized brand name
-            return {
-                "brand": brand.title(),
-                "brand_confidence": 0.95,
-                "brand_source": "known_list"
-            }
-
-    # Fallback: first word if capitalized and not in skip list
-    words = description.replace(',', ' ').split()
-    if words:
-        first_word = words[0]
-        if (len(first_word) > 2
-            and first_word[0].isupper()
-            and not first_word[0].isdigit()
-            and first_word.lower() not in SKIP_WORDS):
-            return {
-                "brand": first_word,
-                "brand_confidence": 0.60,
-                "brand_source": "position"
-            }
-
-    return {"brand": None, "brand_confidence": None, "brand_source": None}
-
-
-def compute_template_hash(pdf_text: str) -> str:
+
+    def __init__(self, labels):
+        self.labels = tuple(labels)
+        lowered = [label.lower() for label in self.labels]
+        self._folded = [re.compile(label, re.IGNORECASE) for label in self.labels]
+        self._by_first: Dict[str, List] = {}
+        for index, label in enumerate(lowered):
+            if not label[:2].isalpha():
+                raise ValueError(f"Template label must start with two letters: {label!r}")
+            self._by_first.setdefault(label[0], []).append((index, re.compile(label)))
+        self._scanner = re.compile('|'.join(
+            f"{first}(?:{'|'.join(p.pattern[1:] for _, p in patterns)})"
+            for first, patterns in self._by_first.items()))
+
+    def fingerprint(self, text: str, text_lower: Optional[str] = None) -> List[str]:
+        """Sorted, lowercased first match of each label present in `text`.
+
+        `text_lower` is text.lower() when the caller already has it.
+        """
+        if any(char in text for char in CASEFOLD_MISMATCH_CHARS):
+            matches = (pattern.search(text) for pattern in self._folded)
+            return sorted(m.group(0).lower().strip() for m in matches if m)
+        if text_lower is None:
+            text_lower = text.lower()
+
+        found: Dict[int, str] = {}
+        for hit in self._scanner.finditer(text_lower):
+            for pos in range(hit.start(), hit.end()):
+                for index, pattern in self._by_first.get(text_lower[pos], ()):
+                    if index not in found:
+                        match = pattern.match(text_lower, pos)
+                        if match:
+                            found[index] = match.group(0).strip()
+            if len(found) == len(self.labels):
+                break
+        return sorted(found.values())
+
+    def hash(self, text: str, text_lower: Optional[str] = None) -> str:
+        """SHA256 of the '|'-joined fingerprint."""
+        fingerprint = '|'.join(self.fingerprint(text, text_lower))
+        return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+TEMPLATE_FINGERPRINTER = TemplateFingerprinter(TEMPLATE_LABELS)
+
+
+def compute_template_hash(pdf_text: str, text_lower: Optional[str] = None) -> str:
     """
     Compute a hash of the PDF's structural elements (headers, labels, layout).
 
@@ -126,92 +165,44 @@ def compute_template_hash(pdf_text: str) -> str:
     If Carrefour changes their receipt format, this hash will change,
     triggering a 'needs_review' status for drift detection.
 
-    We extract:
+    We extract (see TEMPLATE_LABELS):
     - Header labels (Invoice No, Order No, etc.)
     - Section headers (CUSTOMER INFORMATION, etc.)
     - Table column headers
     - Footer boilerplate patterns
 
+    Pass `text_lower` (pdf_text.lower()) to reuse an existing lowercase copy.
+
     Returns:
         SHA256 hash of normalized structural text
     """
-    structural_patterns = []
+    return TEMPLATE_FINGERPRINTER.hash(pdf_text, text_lower)
 
-    # Header labels - these define the receipt structure
-    header_labels = [
-        r'(Tax Invoice)',
-        r'(Invoice No\.?)',
-        r'(Order No\.?)',
-        r'(Invoice Date)',
-        r'(Order Date)',
-        r'(Exp\. Del\. Date)',
-        r'(CUSTOMER INFORMATION)',
-        r'(STORE INFORMATION)',
-        r'(TRN\s*:)',
-    ]
-
-    # Table column headers
-    column_headers = [
-        r'(Description)',
-        r'(Ordered)',
-        r'(Delivered)',
-        r'(Unit Price\s*(?:Incl|Excl)\.?\s*VAT)',
-        r'(Total\s*(?:Incl|Excl)\.?\s*VAT)',
-        r'(VAT\s*%)',
-        r'(VAT\s*Amount)',
-        r'(Discount)',
-        r'(Barcode:)',
-    ]
-
-    # Footer/summary labels
-    footer_labels = [
-        r'(Total Amount Incl\.?\s*VAT)',
-        r'(Total Amount Excl\.?\s*VAT)',
-        r'(Payment Type)',
-        r'(Promo savings)',
-        r'(Products? savings)',
-        r'(Total savings)',
-        r'(Your Savings)',
-        r'(Majid Al Futtaim)',
-        r'(Thank you for shopping)',
-    ]
-
-    all_patterns = header_labels + column_headers + footer_labels
 
-    for pattern in all_patterns:
-        match = re.search(pattern, pdf_text, re.IGNORECASE)
-        if match:
-            # Normalize: lowercase, strip whitespace
-            normalized = match.group(1).lower().strip()
-            structural_patterns.append(normalized)
-
-    # Sort for consistent ordering regardless of document order
-    structural_patterns.sort()
-
-    # Create fingerprint string
-    fingerprint = '|'.join(structural_patterns)
-
-    # Return SHA256 hash
-    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
-
-
-def detect_document_type(pdf_text: str) -> str:
+def detect_document_type(pdf_text: str, text_lower: Optional[str] = None) -> str:
     """
     Detect the type of Carrefour document.
 
+    Pass `text_lower` (pdf_text.lower()) to reuse an existing lowercase copy.
+
     Returns:
         'tax_invoice' - Standard grocery receipt
         'tips_receipt' - Driver tip receipt
         'refund_note' - Refund document
         'unknown' - Unrecognized format
     """
-    text_lower = pdf_text.lower()
+    if text_lower is None:
+        text_lower = pdf_text.lower()
 
-    # Check tax_invoice FIRST - takes priority since PDFs may contain
-    # generic "Refund Note" policy sections in the footer
+    # Tips receipts say "should not be considered as a tax invoice" in their
+    # footer, so they must be recognized before the tax invoice check
+    if 'tips receipt' in text_lower:
+        return 'tips_receipt'
+    # Check tax_invoice before refunds - PDFs may contain generic
+    # "Refund Note" policy sections in the footer
     if 'tax invoice' in text_lower:
         return 'tax_invoice'
-    if 'tips receipt' in text_lower or 'driver tip' in text_lower:
+    if 'driver tip' in text_lower:
         return 'tips_receipt'
     if 'refund note' in text_lower or 'credit note' in text_lower:
         return 'refund_note'
@@ -219,45 +210,59 @@ def detect_document_type(pdf_text: str) -> str:
     return 'unknown'
 
 
-def parse_carrefour_receipt(pdf_text: str) -> Dict[str, Any]:
+def parse_carrefour_receipt(pdf_text: str) -> ParsedReceipt:
     """
     Parse Carrefour UAE receipt text into structured data.
 
+    Runs parse_carrefour_header() and collects iter_carrefour_line_items()
+    into result.line_items.
+
     Args:
         pdf_text: Raw text extracted from PDF
 
     Returns:
-        Dictionary with parsed receipt data
+        ParsedReceipt (to_dict() gives the format at the top of this module)
 
     Raises:
         ValueError: If critical fields cannot be extracted
     """
+    result = parse_carrefour_header(pdf_text)
+    if not result.get("skip_reason"):
+        result.line_items = list(iter_carrefour_line_items(pdf_text))
+    return result
+
+
+def parse_carrefour_header(pdf_text: str) -> ParsedReceipt:
+    """
+    Parse everything but the line items: document type, template hash,
+    invoice metadata, totals and savings.
+
+    line_items is left empty; stream the items separately with
+    iter_carrefour_line_items(). Non-invoice documents (tips, refunds) come
+    back with a "skip_reason".
+    """
     # Detect document type first
-    doc_type = detect_document_type(pdf_text)
+    text_lower = pdf_text.lower()
+    doc_type = detect_document_type(pdf_text, text_lower)
 
     # Compute template hash for drift detection
-    template_hash = compute_template_hash(pdf_text)
+    template_hash = compute_template_hash(pdf_text, text_lower)
 
-    result = {
+    result = ParsedReceipt("carrefour_uae", {
         "parser_version": "1.0.0",
         "parse_version": PARSE_VERSION,
         "template_hash": template_hash,
         "vendor": "carrefour_uae",
         "doc_type": doc_type,
         "parse_errors": [],
-        "line_items": [],
         "savings": {}
-    }
+    })
 
     # Skip non-invoice documents (tips, refunds) - mark for skipping
     if doc_type != 'tax_invoice':
         result["skip_reason"] = f"Document type '{doc_type}' not supported for parsing"
         return result
 
-    # Clean the text - remove Arabic (RTL) text for easier parsing
-    # Keep only ASCII and common Unicode
-    lines = pdf_text.split('\n')
-
     # =========================================================================
     # Extract Invoice Metadata
     # =========================================================================
@@ -383,157 +388,198 @@ def parse_carrefour_receipt(pdf_text: str) -> Dict[str, Any]:
     if total_savings_match:
         result["savings"]["total_savings"] = float(total_savings_match.group(1))
 
-    # =========================================================================
-    # Extract Line Items
-    # =========================================================================
-
-    result["line_items"] = parse_line_items(pdf_text)
-
     return result
 
 
-def parse_line_items(pdf_text: str) -> List[Dict[str, Any]]:
+# Header/footer lines that never belong to an item (matched anywhere in the line)
+LINE_SKIP_MARKERS = (
+    'Majid Al Futtaim', 'Tax Invoice', 'Order No', 'Invoice No',
+    'CUSTOMER INFORMATION', 'STORE INFORMATION', 'Description',
+    'Thank you for shopping', 'Total Amount', 'VAT %',
+    'Payment Type', 'Promo savings', 'Products savings',
+    'Total savings', 'Your Savings', 'Refund Note',
+    'This sale was accepted', 'Page ', 'TRN ', 'City Center',
+    'Ordered', 'Delivered', 'Unit Price', 'Substitution'
+)
+
+# Address/contact lines that follow the items but aren't description text
+CONTINUATION_SKIP_PREFIXES = ('Po Box', 'Dubai', 'UAE', 'http', 'Customer Care')
+
+# Line classifier, compiled once. Tags are checked in this order and the
+# first that applies wins: skip, item, barcode, voucher, continuation.
+_SKIP_LINE_RE = re.compile('|'.join(map(re.escape, LINE_SKIP_MARKERS)))
+
+# Description followed by the 9 item numbers:
+# qty_ordered, qty_delivered, unit_price_incl, unit_price_excl, total_excl,
+# vat_rate, vat_amt, discount, total_incl
+_ITEM_LINE_RE = re.compile(r'^(.+?)\s+' + r'\s+'.join([r'(\d+\.?\d*)'] * 9) + r'\s*$')
+_ITEM_NUMBER_RE = re.compile(r'\d+\.?\d*')
+
+# Barcode and voucher tags in one search; a barcode wins over a voucher
+_TAG_LINE_RE = re.compile(
+    r'Barcode:\s*(?P<barcode>\d+)'
+    r'|(?i:Voucher Discount:\s*(?P<voucher>[\d.]+)\s*AED)'
+)
+_BARCODE_RE = re.compile(r'Barcode:\s*(\d+)')
+
+_NUMERIC_ONLY_RE = re.compile(r'^[\d\s.,]+$')
+_ARABIC_ONLY_RE = re.compile(r'^[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\s\d.]+$')
+_BIDI_CONTROL_RE = re.compile(r'[\u200B-\u200F\u202A-\u202E\u2066-\u2069\uFEFF]+')
+_ARABIC_SCRIPT_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+')
+_FREE_SUFFIX_RE = re.compile(r'\s*\(Free\)\s*$')
+
+ITEM_NUMBER_FIELDS = (
+    'qty_ordered', 'qty_delivered', 'unit_price_incl_vat', 'unit_price_excl_vat',
+    'total_excl_vat', 'vat_rate', 'vat_amount', 'discount', 'total_incl_vat'
+)
+
+
+def classify_line(line: str):
+    """Tag a receipt line for parse_line_items().
+
+    Returns: (tag, value) where tag is 'skip', 'item' (value: the item regex
+             match), 'barcode', 'voucher' (value: the captured number),
+             'continuation' (value: stripped text) or None
     """
-    Parse line items from Carrefour receipt.
+    if _SKIP_LINE_RE.search(line):
+        return 'skip', None
+
+    # The item regex backtracks over -layout's long runs of spaces, so only
+    # run it when the last 9 words are numbers (true of every item line)
+    tail = line.rsplit(None, 9)[-9:]
+    if len(tail) == 9 and all(_ITEM_NUMBER_RE.fullmatch(word) for word in tail):
+        match = _ITEM_LINE_RE.match(line)
+        if match:
+            return 'item', match
+
+    tag = _TAG_LINE_RE.search(line)
+    if tag:
+        if tag.lastgroup == 'barcode':
+            return 'barcode', tag.group('barcode')
+        # A barcode later in the line still takes precedence
+        barcode = _BARCODE_RE.search(line, tag.end())
+        if barcode:
+            return 'barcode', barcode.group(1)
+        return 'voucher', tag.group('voucher')
+
+    stripped = line.strip()
+    if (len(stripped) > 3 and not _ARABIC_ONLY_RE.match(stripped)
+            and not _NUMERIC_ONLY_RE.match(stripped)
+            and not stripped.startswith(CONTINUATION_SKIP_PREFIXES)):
+        return 'continuation', stripped
+    return None, None
+
+
+def iter_lines(text_or_lines: Union[str, Iterable[str]]) -> Iterator[str]:
+    """Lines of a text, as text.split('\\n') would give them, without building the list.
+
+    An iterable of lines (e.g. an open text file) is passed through with
+    trailing newlines removed.
+    """
+    if not isinstance(text_or_lines, str):
+        for line in text_or_lines:
+            yield line.rstrip('\n')
+        return
+
+    text = text_or_lines
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_carrefour_line_items(text_or_lines: Union[str, Iterable[str]]) -> Iterator[LineItem]:
+    """
+    Yield line items from a Carrefour receipt as each one is finalized.
 
     With pdftotext -layout, each item has:
     - Description + 9 numbers on the same line (or description spans multiple lines)
     - Arabic translation lines
     - Barcode: XXXXX line
 
-    Numbers are: qty_ordered, qty_delivered, unit_price_incl, unit_price_excl, total_excl, vat_rate, vat_amt, discount, total_incl
+    Each line is tagged once by classify_line(); barcode, voucher and
+    continuation lines only apply once an item line has been seen. An item
+    is complete when the next item line (or the end of the text) is reached,
+    so only one item is held at a time however long the invoice is.
+
+    Args:
+        text_or_lines: Extracted text, or an iterable of its lines
     """
-    items = []
-
-    # Pattern to match a line ending with 9 numbers (the item data)
-    # The numbers are at the end of the line, separated by whitespace
-    item_line_pattern = re.compile(
-        r'^(.+?)\s+'  # Description (non-greedy)
-        r'(\d+\.?\d*)\s+'  # qty_ordered
-        r'(\d+\.?\d*)\s+'  # qty_delivered
-        r'(\d+\.?\d*)\s+'  # unit_price_incl_vat
-        r'(\d+\.?\d*)\s+'  # unit_price_excl_vat
-        r'(\d+\.?\d*)\s+'  # total_excl_vat
-        r'(\d+\.?\d*)\s+'  # vat_rate
-        r'(\d+\.?\d*)\s+'  # vat_amount
-        r'(\d+\.?\d*)\s+'  # discount
-        r'(\d+\.?\d*)\s*$'  # total_incl_vat
-    )
-
-    barcode_pattern = re.compile(r'Barcode:\s*(\d+)')
-
-    lines = pdf_text.split('\n')
     current_item = None
     extra_description = []
 
-    for line in lines:
-        # Skip header/footer lines
-        if any(skip in line for skip in [
-            'Majid Al Futtaim', 'Tax Invoice', 'Order No', 'Invoice No',
-            'CUSTOMER INFORMATION', 'STORE INFORMATION', 'Description',
-            'Thank you for shopping', 'Total Amount', 'VAT %',
-            'Payment Type', 'Promo savings', 'Products savings',
-            'Total savings', 'Your Savings', 'Refund Note',
-            'This sale was accepted', 'Page ', 'TRN ', 'City Center',
-            'Ordered', 'Delivered', 'Unit Price', 'Substitution'
-        ]):
-            continue
+    for line in iter_lines(text_or_lines):
+        tag, value = classify_line(line)
 
-        # Check if this line contains item data (description + 9 numbers)
-        match = item_line_pattern.match(line)
-        if match:
-            # Save previous item if exists
+        if tag == 'item':
+            # Emit previous item if exists
             if current_item:
-                items.append(current_item)
-
-            description = match.group(1).strip()
-            current_item = {
-                "description": description,
-                "barcode": None,
-                "qty_ordered": float(match.group(2)),
-                "qty_delivered": float(match.group(3)),
-                "unit_price_incl_vat": float(match.group(4)),
-                "unit_price_excl_vat": float(match.group(5)),
-                "total_excl_vat": float(match.group(6)),
-                "vat_rate": float(match.group(7)),
-                "vat_amount": float(match.group(8)),
-                "discount": float(match.group(9)),
-                "total_incl_vat": float(match.group(10))
-            }
+                yield current_item
 
-            # Check for "(Free)" marker
-            if current_item["total_incl_vat"] == 0:
-                current_item["is_free"] = True
+            description = value.group(1).strip()
+            # The 9 numbers fill LineItem's fields in ITEM_NUMBER_FIELDS order;
+            # the brand comes from the description before clean-up
+            current_item = LineItem(description, None, *map(float, value.groups()[1:]),
+                                    **extract_brand(description))
 
-            # Extract brand
-            brand_info = extract_brand(description)
-            current_item.update(brand_info)
+            # Check for "(Free)" marker
+            if current_item.total_incl_vat == 0:
+                current_item.is_free = True
 
             extra_description = []
+        elif current_item is None:
             continue
-
-        # Check for barcode line
-        barcode_match = barcode_pattern.search(line)
-        if barcode_match and current_item:
-            current_item["barcode"] = barcode_match.group(1)
+        elif tag == 'barcode':
+            current_item.barcode = value
             # Finalize description with any extra lines
             if extra_description:
-                full_desc = current_item["description"] + " " + " ".join(extra_description)
-                current_item["description"] = clean_description(full_desc)
+                full_desc = current_item.description + " " + " ".join(extra_description)
+                current_item.description = clean_description(full_desc)
             else:
-                current_item["description"] = clean_description(current_item["description"])
-            continue
-
-        # Check for voucher discount line
-        voucher_match = re.search(r'Voucher Discount:\s*([\d.]+)\s*AED', line, re.IGNORECASE)
-        if voucher_match and current_item:
-            current_item["voucher_discount"] = float(voucher_match.group(1))
-            continue
-
-        # If we have a current item and this line looks like additional description
-        # (English text continuation, not Arabic, not empty)
-        if current_item and line.strip():
-            stripped = line.strip()
-            # Skip Arabic-only lines
-            if not is_arabic_only(stripped):
-                # Skip lines that are just numbers or very short
-                if len(stripped) > 3 and not re.match(r'^[\d\s.,]+$', stripped):
-                    # Skip known non-description lines
-                    if not stripped.startswith(('Po Box', 'Dubai', 'UAE', 'http', 'Customer Care')):
-                        extra_description.append(stripped)
+                current_item.description = clean_description(current_item.description)
+        elif tag == 'voucher':
+            current_item.voucher_discount = float(value)
+        elif tag == 'continuation':
+            extra_description.append(value)
 
     # Don't forget the last item
     if current_item:
-        if extra_description and not current_item.get("barcode"):
-            full_desc = current_item["description"] + " " + " ".join(extra_description)
-            current_item["description"] = clean_description(full_desc)
-        items.append(current_item)
+        if extra_description and not current_item.barcode:
+            full_desc = current_item.description + " " + " ".join(extra_description)
+            current_item.description = clean_description(full_desc)
+        yield current_item
+
 
-    return items
+def parse_line_items(pdf_text: str) -> List[LineItem]:
+    """Parse line items from Carrefour receipt (see iter_carrefour_line_items)."""
+    return list(iter_carrefour_line_items(pdf_text))
 
 
 def clean_description(desc: str) -> str:
     """Clean up product description."""
     # Remove RTL/LTR embedding and formatting characters
-    desc = re.sub(r'[\u200B-\u200F\u202A-\u202E\u2066-\u2069\uFEFF]+', '', desc)
+    desc = _BIDI_CONTROL_RE.sub('', desc)
     # Remove Arabic script (main Arabic, Arabic Supplement, Arabic Extended)
-    desc = re.sub(r'[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]+', '', desc)
+    desc = _ARABIC_SCRIPT_RE.sub('', desc)
     # Remove extra whitespace
     desc = ' '.join(desc.split())
     # Remove trailing commas
     desc = desc.strip().rstrip(',')
     # Remove "(Free)" suffix if present - keep as separate field
-    desc = re.sub(r'\s*\(Free\)\s*$', '', desc)
+    desc = _FREE_SUFFIX_RE.sub('', desc)
     return desc
 
 
 def is_arabic_only(text: str) -> bool:
     """Check if text contains only Arabic characters and whitespace."""
-    arabic_pattern = re.compile(r'^[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\s\d.]+$')
-    return bool(arabic_pattern.match(text))
+    return bool(_ARABIC_ONLY_RE.match(text))
 
 
-def validate_parsed_receipt(parsed: Dict[str, Any]) -> List[str]:
+def validate_parsed_receipt(parsed: ParsedReceipt) -> List[str]:
     """
     Validate parsed receipt data for completeness.
 
@@ -559,7 +605,7 @@ def validate_parsed_receipt(parsed: Dict[str, Any]) -> List[str]:
 
     # Validate line items sum
     if parsed.get("line_items") and parsed.get("total_incl_vat"):
-        items_total = sum(item.get("total_incl_vat", 0) for item in parsed["line_items"])
+        items_total = sum(item.total_incl_vat for item in parsed.line_items)
         # Note: voucher_discount is metadata only - item totals already reflect final prices
         if abs(items_total - parsed["total_incl_vat"]) > 0.10:  # Allow 10 fils tolerance for rounding
             errors.append(f"Line items sum ({items_total:.2f}) doesn't match total ({parsed['total_incl_vat']:.2f})")
@@ -567,6 +613,22 @@ def validate_parsed_receipt(parsed: Dict[str, Any]) -> List[str]:
     return errors
 
 
+def benchmark_line_items(texts: List[str], repeat: int = 50) -> Dict[str, float]:
+    """Time parse_line_items() over extracted receipt texts, `repeat` passes.
+
+    Returns: lines, seconds, lines_per_second
+    """
+    import time
+
+    lines = sum(text.count('\n') + 1 for text in texts) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            parse_line_items(text)
+    elapsed = time.perf_counter() - start
+    return {'lines': lines, 'seconds': round(elapsed, 3), 'lines_per_second': round(lines / elapsed)}
+
+
 # For testing
 if __name__ == "__main__":
     import sys
@@ -575,8 +637,23 @@ if __name__ == "__main__":
 
     if len(sys.argv) < 2:
         print("Usage: python carrefour_parser.py <pdf_file>")
+        print("       python carrefour_parser.py --bench [pdf_file ...]")
         sys.exit(1)
 
+    if sys.argv[1] == '--bench':
+        # Line scanner throughput over the fixture receipts (or the given PDFs)
+        from pdf_extract import extract_pdf_text
+
+        paths = [Path(p) for p in sys.argv[2:]]
+        if not paths:
+            data_dir = Path(__file__).resolve().parent.parent.parent / 'data' / 'receipts'
+            paths = sorted(data_dir.glob('*.pdf'))
+        texts = [extract_pdf_text(path) for path in paths]
+        result = benchmark_line_items(texts)
+        print(f"parse_line_items: {result['lines']} lines in {result['seconds']:.3f}s, "
+              f"{result['lines_per_second']:,} lines/s ({len(paths)} files)")
+        sys.exit(0)
+
     pdf_path = sys.argv[1]
 
     # Extract text using pdftotext with layout preservation
@@ -596,4 +673,4 @@ if __name__ == "__main__":
         parsed["validation_errors"] = validation_errors
 
     # Output
-    print(json.dumps(parsed, indent=2, ensure_ascii=False))
+    print(json.dumps(parsed.to_dict(), indent=2, ensure_ascii=False))
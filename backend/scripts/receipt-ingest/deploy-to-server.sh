@@ -20,6 +20,13 @@ ssh "$SERVER" "mkdir -p $REMOTE_DIR"
 # Copy all required files
 echo "Copying files..."
 scp "$SCRIPT_DIR/carrefour_parser.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/careem_parser.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/blob_store.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/brand_index.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/receipt_models.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/pdf_extract.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/transaction_matcher.py" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/pipeline_metrics.py" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/receipt_ingestion.py" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/Dockerfile" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/docker-compose.yml" "$SERVER:$REMOTE_DIR/"
@@ -27,6 +34,7 @@ scp "$SCRIPT_DIR/deploy/requirements.txt" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/entrypoint.sh" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/lifeos-receipt-ingest.service" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/lifeos-receipt-ingest.timer" "$SERVER:$REMOTE_DIR/"
+scp "$SCRIPT_DIR/deploy/lifeos-receipt-ingest-daemon.service" "$SERVER:$REMOTE_DIR/"
 scp "$SCRIPT_DIR/deploy/install.sh" "$SERVER:$REMOTE_DIR/"
 
 # Copy secrets if they exist locally
@@ -76,3 +84,6 @@ echo "  ssh $SERVER 'sudo journalctl -u lifeos-receipt-ingest -f'"
 echo ""
 echo "To enable hourly timer:"
 echo "  ssh $SERVER 'sudo systemctl enable --now lifeos-receipt-ingest.timer'"
+echo ""
+echo "Or, to run continuously (new receipts within seconds, replaces the timer):"
+echo "  ssh $SERVER 'sudo systemctl enable --now lifeos-receipt-ingest-daemon'"
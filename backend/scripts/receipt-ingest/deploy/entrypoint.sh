@@ -39,9 +39,20 @@ log "Gmail Label: $GMAIL_LABEL"
 log "Data Dir: $DATA_DIR"
 log "Args: $*"
 
-# Run the ingestion script with provided arguments, logging output
-python /app/receipt_ingestion.py "$@" 2>&1 | tee -a "$LOG_FILE"
-EXIT_CODE=${PIPESTATUS[0]}
+# Run the ingestion script with provided arguments, logging output.
+# Forward SIGTERM/SIGINT (docker stop) so --daemon can drain and exit cleanly.
+python -u /app/receipt_ingestion.py "$@" > >(tee -a "$LOG_FILE") 2>&1 &
+PID=$!
+trap 'kill -TERM $PID 2>/dev/null' TERM INT
+set +e
+wait $PID
+EXIT_CODE=$?
+# A trapped signal interrupts the first wait; wait again for the drain to finish
+if kill -0 $PID 2>/dev/null; then
+    wait $PID
+    EXIT_CODE=$?
+fi
+set -e
 
 log "=== Receipt Ingestion Finished (exit code: $EXIT_CODE) ==="
 exit $EXIT_CODE
@@ -7,6 +7,7 @@ set -e
 INSTALL_DIR="/opt/lifeos/receipt-ingest"
 SECRETS_DIR="/opt/lifeos/secrets"
 DATA_DIR="/opt/lifeos/data/receipts"
+STATE_DIR="/opt/lifeos/data/receipt-ingest"
 LOG_DIR="/opt/lifeos/logs"
 
 echo "=== Installing LifeOS Receipt Ingestion Service ==="
@@ -22,12 +23,14 @@ echo "Creating directories..."
 mkdir -p "$INSTALL_DIR"
 mkdir -p "$SECRETS_DIR"
 mkdir -p "$DATA_DIR"
+mkdir -p "$STATE_DIR"
 mkdir -p "$LOG_DIR"
 
 # Set permissions
 chown -R scrypt:scrypt /opt/lifeos
 chmod 700 "$SECRETS_DIR"
 chmod 755 "$DATA_DIR"
+chmod 755 "$STATE_DIR"
 chmod 755 "$LOG_DIR"
 
 # Copy application files
@@ -37,12 +40,20 @@ cp docker-compose.yml "$INSTALL_DIR/"
 cp requirements.txt "$INSTALL_DIR/"
 cp entrypoint.sh "$INSTALL_DIR/"
 cp carrefour_parser.py "$INSTALL_DIR/"
+cp careem_parser.py "$INSTALL_DIR/"
+cp blob_store.py "$INSTALL_DIR/"
+cp brand_index.py "$INSTALL_DIR/"
+cp receipt_models.py "$INSTALL_DIR/"
+cp pdf_extract.py "$INSTALL_DIR/"
+cp transaction_matcher.py "$INSTALL_DIR/"
+cp pipeline_metrics.py "$INSTALL_DIR/"
 cp receipt_ingestion.py "$INSTALL_DIR/"
 
 # Install systemd units
 echo "Installing systemd units..."
 cp lifeos-receipt-ingest.service /etc/systemd/system/
 cp lifeos-receipt-ingest.timer /etc/systemd/system/
+cp lifeos-receipt-ingest-daemon.service /etc/systemd/system/
 
 # Reload systemd
 systemctl daemon-reload
@@ -91,6 +102,10 @@ echo ""
 echo "4. Enable the timer:"
 echo "   systemctl enable --now lifeos-receipt-ingest.timer"
 echo "   systemctl list-timers | grep receipt"
+echo "   (or, for new receipts within seconds instead of hourly, the daemon:"
+echo "   systemctl disable --now lifeos-receipt-ingest.timer"
+echo "   systemctl enable --now lifeos-receipt-ingest-daemon"
+echo "   journalctl -u lifeos-receipt-ingest-daemon -f)"
 echo ""
 echo "5. Manual run options:"
 echo "   cd $INSTALL_DIR"
@@ -0,0 +1,254 @@
+"""
+PDF text extraction backends
+
+carrefour_parser relies on the column alignment of `pdftotext -layout`, so
+every backend must return exactly what that command prints (pages followed
+by a form feed).
+
+Backends:
+    pdftotext  - one `pdftotext -layout` subprocess per file (poppler-utils)
+    poppler    - in-process poppler via the `pdftotext` Python binding
+                 (physical layout = the CLI's -layout); no fork per receipt
+    auto       - poppler if the binding is installed, re-checked against the
+                 CLI on the first file and every AUTO_VERIFY_EVERY-th file
+                 after it; any difference switches to pdftotext for good
+
+Each extraction is labelled with the backend and poppler version that
+produced it (e.g. "pdftotext_layout@22.02.0"); receipt_ingestion stores the
+label in finance.receipt_raw_text.extraction_method and only reuses cached
+text with the current label, so a poppler upgrade or a backend switch
+re-extracts.
+
+Select with PDF_EXTRACTOR=auto|poppler|pdftotext (default pdftotext). Files
+between two checks are taken from poppler unverified, so only opt in to
+auto/poppler once `python pdf_extract.py` reports identical output on the
+server's receipts.
+
+Benchmark / byte-for-byte check against the CLI:
+    python pdf_extract.py [pdf_file ...]    (default: backend/data/receipts/*.pdf)
+"""
+
+import os
+import re
+import subprocess
+import time
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+try:
+    import pdftotext as poppler_binding
+except ImportError:
+    poppler_binding = None
+
+PDF_EXTRACTOR = os.environ.get('PDF_EXTRACTOR', 'pdftotext')
+PDFTOTEXT_TIMEOUT = 30
+
+# auto: extract every Nth file with both backends (1 = every file)
+AUTO_VERIFY_EVERY = max(int(os.environ.get('PDF_AUTO_VERIFY_EVERY', '10')), 1)
+
+
+class PdfExtractionError(Exception):
+    """Text could not be extracted from a PDF."""
+
+
+@lru_cache(maxsize=None)
+def poppler_version() -> str:
+    """Version reported by `pdftotext -v` ('unknown' if it can't be read)."""
+    try:
+        result = subprocess.run(['pdftotext', '-v'], capture_output=True, text=True,
+                                timeout=PDFTOTEXT_TIMEOUT)
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+    match = re.search(r'pdftotext version (\S+)', result.stderr + result.stdout)
+    return match.group(1) if match else 'unknown'
+
+
+@lru_cache(maxsize=None)
+def binding_version() -> str:
+    """Installed version of the `pdftotext` Python binding."""
+    try:
+        return metadata.version('pdftotext')
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+class PdftotextExtractor:
+    """`pdftotext -layout` subprocess per file."""
+
+    name = 'pdftotext_layout'
+
+    @property
+    def method(self) -> str:
+        return f"{self.name}@{poppler_version()}"
+
+    def extract_with_method(self, pdf_path: Path) -> Tuple[str, str]:
+        return self.extract(pdf_path), self.method
+
+    def extract(self, pdf_path: Path) -> str:
+        result = subprocess.run(
+            ['pdftotext', '-layout', str(pdf_path), '-'],
+            capture_output=True, text=True, timeout=PDFTOTEXT_TIMEOUT
+        )
+        if result.returncode != 0:
+            raise PdfExtractionError(f"pdftotext failed: {result.stderr}")
+        return result.stdout
+
+
+class PopplerExtractor:
+    """In-process poppler (libpoppler-cpp) with physical layout."""
+
+    name = 'poppler_layout'
+
+    def __init__(self):
+        if poppler_binding is None:
+            raise PdfExtractionError("pdftotext Python binding not installed")
+
+    @property
+    def method(self) -> str:
+        # The binding builds against the system libpoppler-cpp, which comes
+        # from the same poppler release as the CLI (see deploy/Dockerfile)
+        return f"{self.name}@{poppler_version()}+binding{binding_version()}"
+
+    def extract_with_method(self, pdf_path: Path) -> Tuple[str, str]:
+        return self.extract(pdf_path), self.method
+
+    def extract(self, pdf_path: Path) -> str:
+        try:
+            with open(pdf_path, 'rb') as f:
+                pdf = poppler_binding.PDF(f, physical=True)
+                # pdftotext CLI terminates every page (including the last) with \f
+                return ''.join(page + '\f' for page in pdf)
+        except poppler_binding.Error as e:
+            raise PdfExtractionError(f"poppler failed: {e}")
+
+
+class AutoExtractor:
+    """Poppler in-process when available and verified, pdftotext otherwise.
+
+    The first file and every AUTO_VERIFY_EVERY-th file after it are extracted
+    with both backends; on any difference the in-process backend is dropped
+    for the life of this process and the CLI's text is used from then on.
+
+    Text is labelled with the backend in use (a checked file that matched
+    carries poppler's method), so `method` changes when poppler is dropped.
+    """
+
+    def __init__(self):
+        self.fallback = PdftotextExtractor()
+        self.poppler = PopplerExtractor() if poppler_binding is not None else None
+        self.extracted = 0
+
+    @property
+    def method(self) -> str:
+        """Method of the backend the next file will be extracted with."""
+        return (self.poppler or self.fallback).method
+
+    def extract(self, pdf_path: Path) -> str:
+        return self.extract_with_method(pdf_path)[0]
+
+    def extract_with_method(self, pdf_path: Path) -> Tuple[str, str]:
+        if self.poppler is None:
+            return self.fallback.extract_with_method(pdf_path)
+
+        verify = self.extracted % AUTO_VERIFY_EVERY == 0
+        self.extracted += 1
+        if not verify:
+            return self.poppler.extract_with_method(pdf_path)
+
+        expected = self.fallback.extract(pdf_path)
+        try:
+            candidate = self.poppler.extract(pdf_path)
+        except PdfExtractionError:
+            candidate = None
+        if candidate == expected:
+            return expected, self.poppler.method
+        print(f"  poppler output differs from pdftotext -layout on {pdf_path.name}; using pdftotext")
+        self.poppler = None
+        return expected, self.fallback.method
+
+
+EXTRACTORS = {
+    'auto': AutoExtractor,
+    'poppler': PopplerExtractor,
+    'pdftotext': PdftotextExtractor,
+}
+
+_extractor = None
+
+
+def get_pdf_extractor():
+    """Process-wide extractor selected by PDF_EXTRACTOR (created on first use)."""
+    global _extractor
+    if _extractor is None:
+        if PDF_EXTRACTOR not in EXTRACTORS:
+            raise PdfExtractionError(f"Unknown PDF_EXTRACTOR: {PDF_EXTRACTOR}")
+        _extractor = EXTRACTORS[PDF_EXTRACTOR]()
+    return _extractor
+
+
+def extract_pdf_text(pdf_path: Path) -> str:
+    """Layout-preserving text of a PDF (identical to `pdftotext -layout`)."""
+    return get_pdf_extractor().extract(Path(pdf_path))
+
+
+def extract_pdf_text_with_method(pdf_path: Path) -> Tuple[str, str]:
+    """extract_pdf_text() plus the extraction method (backend@version) that produced it."""
+    return get_pdf_extractor().extract_with_method(Path(pdf_path))
+
+
+def benchmark(pdf_paths: List[Path]) -> Dict[str, Any]:
+    """Time each backend over `pdf_paths` and check output against the CLI.
+
+    Returns: backend name -> seconds (None if unavailable), plus 'mismatches'
+    """
+    reference = PdftotextExtractor()
+    expected = {}
+    start = time.perf_counter()
+    for path in pdf_paths:
+        expected[path] = reference.extract(path)
+    timings = {'pdftotext': time.perf_counter() - start}
+
+    try:
+        poppler = PopplerExtractor()
+    except PdfExtractionError as e:
+        print(f"poppler: unavailable ({e})")
+        timings['poppler'] = None
+        return timings
+
+    mismatches = []
+    start = time.perf_counter()
+    for path in pdf_paths:
+        if poppler.extract(path) != expected[path]:
+            mismatches.append(path.name)
+    timings['poppler'] = time.perf_counter() - start
+
+    if mismatches:
+        print(f"poppler: {len(mismatches)} file(s) differ from pdftotext -layout: {', '.join(mismatches)}")
+    else:
+        print(f"poppler: output identical to pdftotext -layout on {len(pdf_paths)} files")
+    timings['mismatches'] = len(mismatches)
+    return timings
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        paths = [Path(p) for p in sys.argv[1:]]
+    else:
+        data_dir = Path(__file__).resolve().parent.parent.parent / 'data' / 'receipts'
+        paths = sorted(data_dir.glob('*.pdf'))
+    if not paths:
+        print("Usage: python pdf_extract.py [pdf_file ...]")
+        sys.exit(1)
+
+    timings = benchmark(paths)
+    for name in ('pdftotext', 'poppler'):
+        if timings.get(name) is not None:
+            print(f"{name:10s} {timings[name]:.3f}s total, "
+                  f"{timings[name] / len(paths) * 1000:.1f} ms/file ({len(paths)} files)")
+    if timings.get('pdftotext') and timings.get('poppler'):
+        print(f"speedup    {timings['pdftotext'] / timings['poppler']:.1f}x")
+    sys.exit(1 if timings.get('mismatches') else 0)
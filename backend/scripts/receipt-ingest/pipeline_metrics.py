@@ -0,0 +1,258 @@
+"""
+Receipt pipeline instrumentation
+
+Per-stage wall time, item/byte counts, Gmail calls and database round trips
+for one ingest run (or one daemon reporting window):
+
+    fetch      list label / history, whole fetch_receipts_from_gmail()
+    download   Gmail message + attachment gets
+    store      blob store writes + finance.receipts inserts
+    extract    PDF text extraction (or raw-text cache hit)
+    parse      vendor parser over the extracted text
+    persist    writing parse results (raw text, receipt fields, items)
+    link       receipt -> transaction matching and transaction creation
+    finalize   finance.finalize_pending_receipts()
+
+Stages nest (download and store run inside fetch); `seconds` is inclusive
+wall time and `self_seconds` excludes nested stages on the same thread.
+Stages that run in worker threads/processes (download, extract, parse) add
+up the time spent in each worker, so they can exceed the run's wall time.
+
+DB round trips are counted by CountingConnection (pass it as
+psycopg2.connect(connection_factory=...)) and charged to the innermost
+stage active on the calling thread.
+
+With profiling enabled, each stage on the main thread gets its own
+cProfile.Profile (switched on entering/leaving nested stages);
+dump_profile() writes the stage with the most self time.
+"""
+
+import functools
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2.extensions
+
+STAGES = ('fetch', 'download', 'store', 'extract', 'parse', 'persist', 'link', 'finalize')
+
+_COUNTERS = ('seconds', 'self_seconds', 'calls', 'items', 'bytes', 'db_round_trips', 'api_calls')
+
+
+class PipelineMetrics:
+    """Thread-safe per-stage counters for one run."""
+
+    def __init__(self, mode: str = 'cli'):
+        self.mode = mode
+        self.profiling = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._started = time.perf_counter()
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.profiles: Dict[str, Any] = {}
+
+    def _stats(self, stage: str) -> Dict[str, float]:
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = dict.fromkeys(_COUNTERS, 0)
+        return stats
+
+    def _stack(self) -> List[List]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def add(self, stage: str, **counts):
+        """Add to a stage's counters (seconds, items, bytes, db_round_trips, api_calls, ...)."""
+        with self._lock:
+            stats = self._stats(stage)
+            for key, value in counts.items():
+                stats[key] += value
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as stage `name`; DB round trips inside it are charged to it.
+
+        Re-entering the stage that is already innermost is a no-op, so a
+        timed function may call another one timed as the same stage.
+        """
+        stack = self._stack()
+        if stack and stack[-1][0] == name:
+            yield
+            return
+        profiler = None
+        if self.profiling and threading.current_thread() is threading.main_thread():
+            import cProfile
+            with self._lock:
+                profiler = self.profiles.setdefault(name, cProfile.Profile())
+            if stack and stack[-1][2] is not None:
+                stack[-1][2].disable()
+            profiler.enable()
+
+        # [name, nested seconds, profiler]
+        frame = [name, 0.0, profiler]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            if profiler is not None:
+                profiler.disable()
+                if stack and stack[-1][2] is not None:
+                    stack[-1][2].enable()
+            if stack:
+                stack[-1][1] += elapsed
+            self.add(name, seconds=elapsed, self_seconds=elapsed - frame[1], calls=1)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator form of stage()."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def db_round_trip(self, count: int = 1):
+        stack = self._stack()
+        self.add(stack[-1][0] if stack else 'other', db_round_trips=count)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in self.stages.items()}
+
+    def merge(self, snapshot: Dict[str, Dict[str, float]]):
+        """Add counters recorded in another process (see snapshot())."""
+        for stage, stats in snapshot.items():
+            self.add(stage, **stats)
+
+    def report(self, status: str = 'success', error: Optional[str] = None) -> Dict[str, Any]:
+        """JSON-serialisable run report."""
+        elapsed = time.perf_counter() - self._started
+        stages = {}
+        for stage, stats in sorted(self.snapshot().items(),
+                                   key=lambda kv: STAGES.index(kv[0]) if kv[0] in STAGES else len(STAGES)):
+            stats = {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+            if stats['seconds'] > 0 and stats['items']:
+                stats['items_per_second'] = round(stats['items'] / stats['seconds'], 2)
+            stages[stage] = stats
+        return {
+            'mode': self.mode,
+            'status': status,
+            'error': error,
+            'hostname': socket.gethostname(),
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': int(elapsed * 1000),
+            'db_round_trips': sum(s['db_round_trips'] for s in stages.values()),
+            'stages': stages,
+        }
+
+    def write_json(self, path: Path, report: Dict[str, Any]):
+        """Write the report atomically (readers never see a partial file)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(json.dumps(report, indent=2))
+        os.replace(tmp_path, path)
+
+    def save(self, conn, report: Dict[str, Any]):
+        """Insert the report into ops.receipt_pipeline_runs (migration 200) and commit."""
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO ops.receipt_pipeline_runs
+                    (mode, status, error, hostname, started_at, duration_ms, db_round_trips, stages)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                report['mode'], report['status'], report['error'], report['hostname'],
+                report['started_at'], report['duration_ms'], report['db_round_trips'],
+                json.dumps(report['stages'])
+            ))
+        conn.commit()
+
+    def dump_profile(self, path: Path, top: int = 25) -> Optional[str]:
+        """Write the cProfile of the profiled stage with the most self time to `path`.
+
+        Returns: the stage name, or None if nothing was profiled
+        """
+        if not self.profiles:
+            return None
+        import io
+        import pstats
+
+        snapshot = self.snapshot()
+        stage = max(self.profiles, key=lambda name: snapshot.get(name, {}).get('self_seconds', 0))
+        profile = self.profiles[stage]
+        profile.dump_stats(str(path))
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(top)
+        print(f"\n=== Profile: {stage} stage ({snapshot[stage]['self_seconds']:.2f}s self) -> {path} ===")
+        print(out.getvalue())
+        return stage
+
+
+class CountingCursorMixin:
+    """Charges every execute/executemany/callproc to the connection's metrics."""
+
+    def execute(self, query, vars=None):
+        self.connection.metrics.db_round_trip()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        self.connection.metrics.db_round_trip()
+        return super().executemany(query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        self.connection.metrics.db_round_trip()
+        return super().callproc(procname, parameters)
+
+
+_counting_cursors: Dict[type, type] = {}
+
+
+def counting_cursor_class(base: type) -> type:
+    """CountingCursorMixin subclass of a cursor class (RealDictCursor, ...), cached."""
+    cls = _counting_cursors.get(base)
+    if cls is None:
+        cls = _counting_cursors[base] = type(f"Counting{base.__name__}", (CountingCursorMixin, base), {})
+    return cls
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors, commits and rollbacks count round trips.
+
+    Set `metrics` after connecting; until then nothing is counted.
+    """
+
+    metrics = None
+
+    def cursor(self, *args, **kwargs):
+        if self.metrics is None:
+            return super().cursor(*args, **kwargs)
+        base = kwargs.pop('cursor_factory', None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=counting_cursor_class(base), **kwargs)
+
+    def commit(self):
+        if self.metrics is not None:
+            self.metrics.db_round_trip()
+        return super().commit()
+
+    def rollback(self):
+        if self.metrics is not None:
+            self.metrics.db_round_trip()
+        return super().rollback()
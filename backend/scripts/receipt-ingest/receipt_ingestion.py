@@ -7,10 +7,13 @@ Currently supports: Carrefour UAE, Careem Quik
 
 Usage:
     ./receipt_ingestion.py --fetch           # Fetch new receipts from Gmail
+    ./receipt_ingestion.py --from-mbox FILE  # Import receipts from a mailbox export (or --from-dir PATH)
     ./receipt_ingestion.py --parse           # Parse pending receipts
+    ./receipt_ingestion.py --reparse-stale   # Re-parse receipts from older parser versions
     ./receipt_ingestion.py --link            # Link receipts to transactions
     ./receipt_ingestion.py --finalize-pending # Finalize receipts (compute totals, create txns)
     ./receipt_ingestion.py --all             # Do all of the above
+    ./receipt_ingestion.py --daemon          # Keep running, fetch every --interval seconds
 
 Environment variables:
     NEXUS_DB_HOST, NEXUS_DB_USER, NEXUS_DB_PASS, NEXUS_DB_NAME
@@ -20,32 +23,37 @@ Environment variables:
 import os
 import sys
 import json
-import hashlib
 import argparse
 import base64
+import codecs
 import re
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 from pathlib import Path
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterable, Iterator, Union
 
-import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
-
-# Gmail API
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from psycopg2.extras import RealDictCursor, execute_values
 
-# PDF parsing
-from pypdf import PdfReader
-import io
-import subprocess
+from blob_store import BlobStore, StagedBlob
+from brand_index import refresh_brand_index
+from pipeline_metrics import PipelineMetrics, CountingConnection, STAGES
+from receipt_models import LineItem, ParsedReceipt
 
-# Local parsers
-from carrefour_parser import parse_carrefour_receipt, validate_parsed_receipt, PARSE_VERSION
-from careem_parser import parse_careem_html
+# Everything else is imported where it is used, so DB-only subcommands
+# (--link, --report-drift, --finalize-pending, ...) don't pay for the Google
+# client libraries, pypdf, asyncio or the parsers at startup:
+#   Gmail API (googleapiclient, google_auth_oauthlib)   get_gmail_credentials, build_gmail_service
+#   pypdf                                               identify_vendor
+#   email parser                                        scan_email
+#   carrefour_parser / careem_parser / pdf_extract      parsing functions
+#   transaction_matcher                                 match_unlinked_receipts
+#   asyncio                                             IngestDaemon
+# `--import-profile` shows what a given subcommand actually imports.
 
 
 # ============================================================================
@@ -61,10 +69,50 @@ VENDOR_LABELS = {
     'careem_quik': ('LifeOS/Receipts/Careem', 'html'),
 }
 
+# Gmail batch HTTP: requests grouped per round trip (Gmail caps a batch at 100
+# calls and recommends <= 50 to stay under the per-user rate limit)
+GMAIL_BATCH_SIZE = int(os.environ.get('GMAIL_BATCH_SIZE', '50'))
+GMAIL_MAX_BATCH_SIZE = 100
+
+# Attachment download threads (0/1 = download through batch requests instead)
+GMAIL_DOWNLOAD_WORKERS = int(os.environ.get('GMAIL_DOWNLOAD_WORKERS', '0'))
+
+# Attachment bytes (Gmail's declared part sizes) requested per batch round
+# trip, so a batch of large statement PDFs doesn't buffer tens of MB of base64
+GMAIL_BATCH_MAX_BYTES = int(os.environ.get('GMAIL_BATCH_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Base64 characters decoded into the blob store per write (a multiple of 4)
+ATTACHMENT_CHUNK_CHARS = 64 * 1024
+
+# Local backfill (--from-dir / --from-mbox): scanner processes and receipts
+# inserted per commit
+LOCAL_SCAN_WORKERS = int(os.environ.get('LOCAL_SCAN_WORKERS', str(os.cpu_count() or 1)))
+LOCAL_COMMIT_EVERY = 100
+
+# Message IDs / content hashes resolved per "already ingested" query
+DEDUP_PAGE_SIZE = 100
+
+# Parse stage: extraction/parsing processes (0/1 = parse in this process) and
+# receipts written per commit when parsing in a pool
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', '0'))
+PARSE_COMMIT_EVERY = 50
+PARSE_SAVEPOINT = 'receipt_parse'
+
+# Line items per INSERT statement (one statement per receipt in practice)
+ITEM_INSERT_PAGE_SIZE = 1000
+
+# --daemon: seconds between Gmail fetch cycles, and receipts buffered between
+# pipeline stages before the earlier stage waits
+DAEMON_INTERVAL = int(os.environ.get('DAEMON_INTERVAL', '60'))
+DAEMON_QUEUE_SIZE = 100
+
 # PDF storage - configurable for server deployment
 _default_pdf_path = Path.home() / 'Cyber/Infrastructure/Nexus-setup/data/receipts'
 PDF_STORAGE_PATH = Path(os.environ.get('PDF_STORAGE_PATH', str(_default_pdf_path)))
 
+# Receipt files are content-addressed: PDF_STORAGE_PATH/aa/bb/<sha256>
+BLOB_STORE = BlobStore(PDF_STORAGE_PATH)
+
 # Database config (can be overridden by env vars)
 DB_CONFIG = {
     'host': os.environ.get('NEXUS_HOST', '10.0.0.11'),
@@ -74,11 +122,24 @@ DB_CONFIG = {
     'password': os.environ.get('NEXUS_PASSWORD', ''),
 }
 
+# Receipt item inserts skip the per-row auto-match trigger; the parse stage
+# matches each batch of receipts with finance.auto_match_receipt_items (migration 198)
+DB_SESSION_OPTIONS = '-c finance.defer_auto_match=on'
+
 # Secrets/credentials paths - configurable for server deployment
 SCRIPT_DIR = Path(__file__).parent
 SECRETS_DIR = Path(os.environ.get('SECRETS_DIR', str(SCRIPT_DIR)))
 CREDENTIALS_PATH = SECRETS_DIR / 'gmail_client_secret.json'
 TOKEN_PATH = SECRETS_DIR / 'token.pickle'
+# Gmail label name -> ID map, persisted next to the token by default
+GMAIL_LABEL_CACHE_PATH = Path(os.environ.get('GMAIL_LABEL_CACHE', str(SECRETS_DIR / 'gmail_labels.json')))
+
+# Per-stage timings/counts (pipeline_metrics.py): the last run's report is
+# written here as JSON, and every run is recorded in ops.receipt_pipeline_runs
+METRICS = PipelineMetrics()
+PIPELINE_REPORT_PATH = Path(os.environ.get('PIPELINE_REPORT_PATH', str(SCRIPT_DIR / 'pipeline_report.json')))
+# --daemon writes a report row per window of this many seconds
+DAEMON_REPORT_EVERY = 3600
 
 
 # ============================================================================
@@ -90,7 +151,9 @@ def get_db_connection(max_retries=3, backoff_delays=(5, 15, 45)):
     last_error = None
     for attempt in range(max_retries + 1):
         try:
-            conn = psycopg2.connect(**DB_CONFIG, connect_timeout=10)
+            conn = psycopg2.connect(**DB_CONFIG, connect_timeout=10, options=DB_SESSION_OPTIONS,
+                                    connection_factory=CountingConnection)
+            conn.metrics = METRICS
             if attempt > 0:
                 print(f"  Connected to database on attempt {attempt + 1}")
             return conn
@@ -110,9 +173,11 @@ def get_db_connection(max_retries=3, backoff_delays=(5, 15, 45)):
 # Gmail Integration
 # ============================================================================
 
-def get_gmail_service():
-    """Authenticate and return Gmail API service."""
+def get_gmail_credentials():
+    """Load (refreshing or running the OAuth flow if needed) Gmail credentials."""
     import pickle
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
 
     creds = None
 
@@ -142,31 +207,163 @@ def get_gmail_service():
             with open(TOKEN_PATH, 'wb') as token_file:
                 pickle.dump(creds, token_file)
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
 
 
-def get_label_id(service, label_name: str) -> Optional[str]:
-    """Get Gmail label ID by name."""
+_gmail_discovery_doc = None
+
+
+def gmail_discovery_document() -> str:
+    """Gmail v1 discovery document bundled with google-api-python-client (read once).
+
+    build() would read and parse this file for every client (one per
+    download thread); building from the cached copy never touches the
+    network or the discovery cache.
+    """
+    global _gmail_discovery_doc
+    if _gmail_discovery_doc is None:
+        from googleapiclient.discovery_cache import get_static_doc
+        doc = get_static_doc('gmail', 'v1')
+        if doc is None:
+            raise RuntimeError("google-api-python-client has no bundled gmail v1 discovery document")
+        _gmail_discovery_doc = doc
+    return _gmail_discovery_doc
+
+
+def build_gmail_service(creds, http=None):
+    """Build a Gmail API service (one per thread - clients are not thread-safe).
+
+    `http` (e.g. googleapiclient.http.HttpMockSequence) replaces `creds` so
+    a client can be built and exercised offline.
+    """
+    from googleapiclient.discovery import build_from_document
+    if http is not None:
+        return build_from_document(gmail_discovery_document(), http=http)
+    return build_from_document(gmail_discovery_document(), credentials=creds)
+
+
+def get_gmail_service():
+    """Authenticate and return Gmail API service."""
+    return build_gmail_service(get_gmail_credentials())
+
+
+def get_label_id(service, label_name: str, refresh: bool = False) -> Optional[str]:
+    """Get Gmail label ID by name.
+
+    IDs come from GMAIL_LABEL_CACHE_PATH; Gmail's label list is only fetched
+    when the name is missing from the cache (or with refresh=True), and the
+    cache is then rewritten from it.
+    """
+    labels = None
+    if not refresh and GMAIL_LABEL_CACHE_PATH.exists():
+        try:
+            labels = json.loads(GMAIL_LABEL_CACHE_PATH.read_text())
+        except (OSError, ValueError):
+            labels = None
+    if labels is not None and label_name in labels:
+        return labels[label_name]
+
     results = service.users().labels().list(userId='me').execute()
-    for label in results.get('labels', []):
-        if label['name'] == label_name:
-            return label['id']
-    return None
+    labels = {label['name']: label['id'] for label in results.get('labels', [])}
+    try:
+        GMAIL_LABEL_CACHE_PATH.write_text(json.dumps(labels, indent=2, sort_keys=True))
+    except OSError as e:
+        print(f"  Could not write label cache {GMAIL_LABEL_CACHE_PATH}: {e}")
+    return labels.get(label_name)
 
 
-def fetch_receipts_from_gmail(service, label_id: str, conn, vendor: str = 'carrefour_uae',
-                              content_type: str = 'pdf', label: str = None) -> Tuple[int, int, int]:
-    """Fetch receipt emails from Gmail label.
+def fetch_label_receipts(service, conn, gmail_label: str, **fetch_args) -> Optional[Tuple[int, int, int]]:
+    """Resolve a label's (cached) ID and run fetch_receipts_from_gmail for it.
 
-    Returns: (messages_processed, receipts_saved, messages_skipped)
+    If the fetch fails, the ID is re-resolved from Gmail once in case the
+    label was deleted and recreated under the same name; the fetch is
+    retried only if the ID changed.
+
+    Returns: (messages_processed, receipts_saved, messages_skipped), or None
+             if the label does not exist
     """
-    messages_processed = 0
-    receipts_saved = 0
-    messages_skipped = 0
+    label_id = get_label_id(service, gmail_label)
+    for attempt in range(2):
+        if not label_id:
+            print(f"Warning: Label '{gmail_label}' not found in Gmail, skipping")
+            return None
+        print(f"Label ID: {label_id}")
+        try:
+            return fetch_receipts_from_gmail(service, label_id, conn, label=gmail_label, **fetch_args)
+        except Exception:
+            if attempt:
+                raise
+            fresh_id = get_label_id(service, gmail_label, refresh=True)
+            if fresh_id == label_id:
+                raise
+            print(f"Label '{gmail_label}' ID changed ({label_id} -> {fresh_id}), retrying")
+            label_id = fresh_id
+
+
+def execute_gmail_batch(service, requests: List[Tuple[str, Any]],
+                        batch_size: int) -> Tuple[Dict[str, Any], Dict[str, Exception], int]:
+    """Execute Gmail API requests grouped into batch HTTP round trips.
+
+    `requests` is a list of (request_id, HttpRequest). With batch_size <= 1
+    every request is executed on its own, one round trip each. If a batch
+    fails as a whole (transport or batch-level HTTP error), the requests it
+    did not answer are retried on their own, so one bad round trip doesn't
+    abort the label fetch.
+
+    Returns: (responses by request_id, errors by request_id, round_trips)
+    """
+    responses = {}
+    errors = {}
+
+    def execute_each(chunk):
+        for request_id, request in chunk:
+            try:
+                responses[request_id] = request.execute()
+            except Exception as e:
+                errors[request_id] = e
+        return len(chunk)
+
+    if batch_size <= 1:
+        return responses, errors, execute_each(requests)
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            responses[request_id] = response
+
+    round_trips = 0
+    batch_size = min(batch_size, GMAIL_MAX_BATCH_SIZE)
+    for start in range(0, len(requests), batch_size):
+        chunk = requests[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=on_response)
+        for request_id, request in chunk:
+            batch.add(request, request_id=request_id)
+        round_trips += 1
+        try:
+            batch.execute()
+        except Exception as e:
+            unanswered = [(request_id, request) for request_id, request in chunk
+                          if request_id not in responses and request_id not in errors]
+            print(f"  Gmail batch request failed ({e}), retrying {len(unanswered)} call(s) one by one")
+            round_trips += execute_each(unanswered)
+
+    return responses, errors, round_trips
+
 
-    # Get messages with the specified label (paginate to get all)
+def is_gmail_not_found(error: Exception) -> bool:
+    """True for Gmail 404s (expired historyId, message deleted since listing)."""
+    return getattr(getattr(error, 'resp', None), 'status', None) == 404
+
+
+def list_label_messages(service, label_id: str) -> Tuple[List[str], int]:
+    """List every message ID in a label (paginated).
+
+    Returns: (message_ids, round_trips)
+    """
     page_token = None
-    all_messages = []
+    message_ids = []
+    round_trips = 0
 
     while True:
         results = service.users().messages().list(
@@ -175,48 +372,448 @@ def fetch_receipts_from_gmail(service, label_id: str, conn, vendor: str = 'carre
             maxResults=100,
             pageToken=page_token
         ).execute()
+        round_trips += 1
 
-        all_messages.extend(results.get('messages', []))
+        message_ids.extend(m['id'] for m in results.get('messages', []))
         page_token = results.get('nextPageToken')
         if not page_token:
             break
 
-    print(f"Found {len(all_messages)} messages in label")
+    return message_ids, round_trips
 
-    for msg_info in all_messages:
-        msg_id = msg_info['id']
 
-        # Check if already processed (any receipt with this message ID)
-        with conn.cursor() as cur:
+def list_history_messages(service, label_id: str, start_history_id: int) -> Tuple[List[str], int, int]:
+    """List message IDs added to a label since `start_history_id`.
+
+    Covers new mail arriving with the label and existing mail the label is
+    applied to later. Raises the Gmail 404 HttpError when the historyId is
+    too old (see is_gmail_not_found).
+
+    Returns: (message_ids, latest_history_id, round_trips)
+    """
+    page_token = None
+    message_ids = []
+    seen = set()
+    latest_history_id = start_history_id
+    round_trips = 0
+
+    while True:
+        results = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            labelId=label_id,
+            historyTypes=['messageAdded', 'labelAdded'],
+            maxResults=500,
+            pageToken=page_token
+        ).execute()
+        round_trips += 1
+
+        for record in results.get('history', []):
+            added = [a['message'] for a in record.get('messagesAdded', [])
+                     if label_id in a['message'].get('labelIds', [])]
+            added += [a['message'] for a in record.get('labelsAdded', [])
+                      if label_id in a.get('labelIds', [])]
+            for message in added:
+                if message['id'] not in seen:
+                    seen.add(message['id'])
+                    message_ids.append(message['id'])
+
+        latest_history_id = max(latest_history_id, int(results.get('historyId', 0)))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    return message_ids, latest_history_id, round_trips
+
+
+def load_sync_cursor(conn, gmail_label: str) -> Optional[Dict]:
+    """Load the stored historyId checkpoint for a label, if any."""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT gmail_label, label_id, history_id, last_full_sync_at
+            FROM finance.receipt_sync_cursors
+            WHERE gmail_label = %s
+        """, (gmail_label,))
+        return cur.fetchone()
+
+
+def save_sync_cursor(conn, gmail_label: str, label_id: str, history_id: int, full_sync: bool):
+    """Persist the historyId checkpoint for a label."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO finance.receipt_sync_cursors
+                (gmail_label, label_id, history_id, last_full_sync_at, updated_at)
+            VALUES (%s, %s, %s, CASE WHEN %s THEN NOW() END, NOW())
+            ON CONFLICT (gmail_label) DO UPDATE SET
+                label_id = EXCLUDED.label_id,
+                history_id = EXCLUDED.history_id,
+                last_full_sync_at = COALESCE(EXCLUDED.last_full_sync_at,
+                                             finance.receipt_sync_cursors.last_full_sync_at),
+                updated_at = NOW()
+        """, (gmail_label, label_id, history_id, full_sync))
+    conn.commit()
+
+
+class ReceiptDedupIndex:
+    """Run-scoped "already seen" lookups for Gmail message IDs and content hashes.
+
+    A whole page of message IDs or hashes is resolved with one `= ANY(%s)`
+    query; known content hashes stay in memory for the rest of the run, and
+    hashes saved during the run are added as they are inserted.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.known_hashes = set()
+        self.checked_hashes = set()
+
+    def message_receipt_counts(self, message_ids: List[str]) -> Dict[str, int]:
+        """Number of stored receipts per message ID (absent = not ingested)."""
+        if not message_ids:
+            return {}
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT gmail_message_id, COUNT(*)
+                FROM finance.receipts
+                WHERE gmail_message_id = ANY(%s)
+                GROUP BY gmail_message_id
+            """, (list(message_ids),))
+            return dict(cur.fetchall())
+
+    def prime_hashes(self, hashes: List[str]):
+        """Look up every not-yet-checked hash in one query."""
+        unchecked = [h for h in set(hashes) if h not in self.checked_hashes]
+        if not unchecked:
+            return
+        with self.conn.cursor() as cur:
             cur.execute(
-                "SELECT COUNT(*) FROM finance.receipts WHERE gmail_message_id = %s",
-                (msg_id,)
+                "SELECT pdf_hash FROM finance.receipts WHERE pdf_hash = ANY(%s)",
+                (unchecked,)
             )
-            existing_count = cur.fetchone()[0]
+            self.known_hashes.update(row[0] for row in cur.fetchall())
+        self.checked_hashes.update(unchecked)
+
+    def is_duplicate(self, content_hash: str) -> bool:
+        self.prime_hashes([content_hash])
+        return content_hash in self.known_hashes
+
+    def add(self, content_hash: str):
+        self.known_hashes.add(content_hash)
+        self.checked_hashes.add(content_hash)
+
+
+@METRICS.timed('fetch')
+def fetch_receipts_from_gmail(service, label_id: str, conn, vendor: str = 'carrefour_uae',
+                              content_type: str = 'pdf', label: str = None,
+                              batch_size: int = GMAIL_BATCH_SIZE,
+                              incremental: bool = True,
+                              download_workers: int = GMAIL_DOWNLOAD_WORKERS,
+                              service_factory: Optional[Callable[[], Any]] = None) -> Tuple[int, int, int]:
+    """Fetch receipt emails from Gmail label.
+
+    With `incremental`, only messages added since the label's stored historyId
+    cursor are fetched; without a cursor (first run, expired history, or
+    incremental=False) the whole label is listed. The cursor only advances
+    when every listed message was fetched without a retryable error.
+
+    Message and attachment gets are grouped into batch HTTP requests of
+    `batch_size` calls (1 = one round trip per call, the pre-batching behaviour).
+    With `download_workers` > 1, attachments are instead downloaded and hashed
+    on a thread pool (see iter_downloaded_attachments); `service_factory`
+    builds the per-thread Gmail clients.
+
+    Returns: (messages_processed, receipts_saved, messages_skipped)
+    """
+    messages_processed = 0
+    receipts_saved = 0
+    messages_skipped = 0
+    round_trips = 0
+    fetch_errors = 0
+    started = time.monotonic()
+    cursor_key = label or label_id
+
+    # Downloads are staged in the blob store before dedup; drop any a crashed run left
+    BLOB_STORE.clear_staging()
+
+    all_messages = None
+    cursor = load_sync_cursor(conn, cursor_key) if incremental else None
+    if cursor and cursor['label_id'] == label_id:
+        try:
+            all_messages, history_id, trips = list_history_messages(
+                service, label_id, cursor['history_id'])
+            round_trips += trips
+            print(f"Found {len(all_messages)} new messages since history {cursor['history_id']}")
+        except Exception as e:
+            if not is_gmail_not_found(e):
+                raise
+            print(f"History cursor {cursor['history_id']} expired, falling back to full label scan")
+
+    full_sync = all_messages is None
+    if full_sync:
+        # Read the mailbox historyId before listing so mail arriving mid-scan
+        # is picked up by the next incremental run
+        history_id = int(service.users().getProfile(userId='me').execute()['historyId'])
+        all_messages, trips = list_label_messages(service, label_id)
+        round_trips += trips + 1
+        print(f"Found {len(all_messages)} messages in label")
+    # Listing calls only; message/attachment gets are counted under download
+    METRICS.add('fetch', items=len(all_messages), api_calls=round_trips)
+
+    # Check which messages were already processed, one query per page of IDs
+    dedup = ReceiptDedupIndex(conn)
+    pending_ids = []
+    for start in range(0, len(all_messages), DEDUP_PAGE_SIZE):
+        page_ids = all_messages[start:start + DEDUP_PAGE_SIZE]
+        existing = dedup.message_receipt_counts(page_ids)
+        for msg_id in page_ids:
+            existing_count = existing.get(msg_id, 0)
             if existing_count > 0:
                 print(f"  Skipping message {msg_id[:8]}... (already has {existing_count} receipt(s))")
                 messages_skipped += 1
                 continue
-
-        # Get full message
-        msg = service.users().messages().get(
-            userId='me', id=msg_id, format='full'
-        ).execute()
+            pending_ids.append(msg_id)
+
+    step = max(batch_size, 1)
+    for start in range(0, len(pending_ids), step):
+        chunk_ids = pending_ids[start:start + step]
+
+        # Get full messages for this chunk
+        with METRICS.stage('download'):
+            messages, errors, trips = execute_gmail_batch(service, [
+                (msg_id, service.users().messages().get(userId='me', id=msg_id, format='full'))
+                for msg_id in chunk_ids
+            ], batch_size)
+        METRICS.add('download', items=len(messages), api_calls=trips)
+        round_trips += trips
+        for msg_id, e in errors.items():
+            print(f"  Error fetching message {msg_id[:8]}...: {e}")
+            if not is_gmail_not_found(e):
+                fetch_errors += 1
+
+        chunk_messages = [messages[msg_id] for msg_id in chunk_ids if msg_id in messages]
 
         if content_type == 'html':
-            saved = process_html_email(service, msg, conn, vendor, label or '')
+            groups = [[(msg, stage_html_body(msg['payload']), 0) for msg in chunk_messages]]
+        elif download_workers > 1:
+            # Attachments stream back from the download pool in message order
+            groups = iter_downloaded_attachments(service_factory or (lambda: service),
+                                                 chunk_messages, download_workers)
+            round_trips += sum(len(find_pdf_parts(msg['payload'])) for msg in chunk_messages)
         else:
-            saved = process_gmail_message(service, msg, conn)
-        if saved:
-            messages_processed += 1
-            receipts_saved += len(saved)
+            # Download all PDF attachments of the chunk in batch requests,
+            # staging each batch's responses before requesting the next
+            with METRICS.stage('download'):
+                staged = {}
+                downloaded_bytes = 0
+                trips = 0
+                for requests in attachment_batches(service, chunk_messages, batch_size):
+                    attachments, errors, batch_trips = execute_gmail_batch(service, requests, batch_size)
+                    trips += batch_trips
+                    for request_id, e in errors.items():
+                        print(f"  Error downloading attachment {request_id[:10]}...: {e}")
+                        fetch_errors += 1
+                    while attachments:
+                        request_id, attachment = attachments.popitem()
+                        blob = stage_attachment(attachment['data'])
+                        staged[request_id] = blob
+                        downloaded_bytes += blob.size
+                round_trips += trips
+
+                group = []
+                for msg in chunk_messages:
+                    pdfs = []
+                    for idx, part in enumerate(find_pdf_parts(msg['payload'])):
+                        blob = staged.get(f"{msg['id']}/{idx}")
+                        if blob:
+                            pdfs.append((part['filename'], blob))
+                    group.append((msg, pdfs, 0))
+                groups = [group]
+            METRICS.add('download', bytes=downloaded_bytes, api_calls=trips)
+
+        for group in groups:
+            # Resolve duplicates for everything downloaded so far in one query
+            if content_type == 'html':
+                dedup.prime_hashes([blob.content_hash for _, blob, _ in group if blob])
+            else:
+                dedup.prime_hashes([blob.content_hash for _, pdfs, _ in group for _, blob in pdfs])
+
+            for msg, content, download_errors in group:
+                fetch_errors += download_errors
+                if content_type == 'html':
+                    saved = process_html_email(service, msg, conn, vendor, label or '',
+                                               dedup=dedup, html_blob=content)
+                else:
+                    saved = process_gmail_message(service, msg, conn, pdfs=content, dedup=dedup)
+                if saved:
+                    messages_processed += 1
+                    receipts_saved += len(saved)
+
+    elapsed = time.monotonic() - started
+    fetched = len(pending_ids)
+    rate = fetched / elapsed if elapsed > 0 else 0.0
+    print(f"Fetched {fetched} messages in {elapsed:.1f}s "
+          f"({rate:.1f} msg/s, {round_trips} Gmail round trips, batch size {batch_size})")
+
+    if fetch_errors:
+        print(f"History cursor not advanced: {fetch_errors} fetch error(s) will be retried next run")
+    else:
+        save_sync_cursor(conn, cursor_key, label_id, history_id, full_sync)
 
     return messages_processed, receipts_saved, messages_skipped
 
 
-def process_gmail_message(service, msg: Dict, conn) -> List[Dict]:
+def find_pdf_parts(payload: Dict) -> List[Dict]:
+    """Find all PDF attachment parts in a message payload (depth-first, in order)."""
+    found = []
+
+    def walk(parts):
+        for part in parts:
+            mime_type = part.get('mimeType', '')
+            if mime_type == 'application/pdf' or (mime_type == 'application/octet-stream' and part.get('filename', '').lower().endswith('.pdf')):
+                attachment_id = part.get('body', {}).get('attachmentId')
+                if attachment_id:
+                    found.append({
+                        'attachment_id': attachment_id,
+                        'filename': part.get('filename', 'receipt.pdf'),
+                        'size': part['body'].get('size', 0),
+                    })
+            if 'parts' in part:
+                walk(part['parts'])
+
+    if 'parts' in payload:
+        walk(payload['parts'])
+    return found
+
+
+def attachment_batches(service, messages: List[Dict], batch_size: int,
+                       max_bytes: int = GMAIL_BATCH_MAX_BYTES) -> Iterator[List[Tuple[str, Any]]]:
+    """Group attachment gets for `messages` into batches for execute_gmail_batch().
+
+    A batch closes at `batch_size` requests or once the attachments' declared
+    sizes would exceed `max_bytes`; an attachment larger than that goes alone.
+    Request IDs are "<message id>/<attachment index>".
+    """
+    limit = min(max(batch_size, 1), GMAIL_MAX_BATCH_SIZE)
+    batch = []
+    batch_bytes = 0
+    for msg in messages:
+        for idx, part in enumerate(find_pdf_parts(msg['payload'])):
+            if batch and (len(batch) >= limit or batch_bytes + part['size'] > max_bytes):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append((f"{msg['id']}/{idx}", service.users().messages().attachments().get(
+                userId='me', messageId=msg['id'], id=part['attachment_id']
+            )))
+            batch_bytes += part['size']
+    if batch:
+        yield batch
+
+
+def iter_base64_chunks(data: str, chunk_chars: int = ATTACHMENT_CHUNK_CHARS) -> Iterator[bytes]:
+    """Decode Gmail's URL-safe base64 body data one slice at a time."""
+    for start in range(0, len(data), chunk_chars):
+        yield base64.urlsafe_b64decode(data[start:start + chunk_chars])
+
+
+def stage_attachment(data: str) -> StagedBlob:
+    """Decode an attachment's body data into the blob store's staging area.
+
+    Returns: the staged blob (hashed, not yet committed)
+    """
+    return BLOB_STORE.stage(iter_base64_chunks(data))
+
+
+@METRICS.timed('download')
+def download_pdf_attachments(service, msg: Dict) -> List[Tuple[str, StagedBlob]]:
+    """Download every PDF attachment of a message, one round trip each.
+
+    Returns list of (filename, staged blob).
+    """
+    pdfs = []
+    for part in find_pdf_parts(msg['payload']):
+        try:
+            attachment = service.users().messages().attachments().get(
+                userId='me', messageId=msg['id'], id=part['attachment_id']
+            ).execute()
+            pdfs.append((part['filename'], stage_attachment(attachment['data'])))
+        except Exception as e:
+            print(f"  Error downloading attachment: {e}")
+    METRICS.add('download', bytes=sum(blob.size for _, blob in pdfs), api_calls=len(pdfs))
+    return pdfs
+
+
+def iter_downloaded_attachments(service_factory: Callable[[], Any], messages: List[Dict],
+                                workers: int) -> Iterator[List[Tuple[Dict, List[Tuple[str, StagedBlob]], int]]]:
+    """Download PDF attachments for many messages on a bounded thread pool.
+
+    Each worker fetches one message's attachments, decoding and hashing each
+    one into the blob store's staging area as soon as it arrives. Completed
+    messages are handed to the caller (the DB writer) through an in-order
+    queue: every yielded group is the finished prefix of that queue, so
+    messages keep their listing order. At most 2 * workers messages are in
+    flight at once.
+
+    googleapiclient service objects are not thread-safe, so every worker
+    thread builds its own from `service_factory`.
+
+    Yields lists of (msg, [(filename, staged blob)], error_count).
+    """
+    local = threading.local()
+
+    def download(msg):
+        if not hasattr(local, 'service'):
+            local.service = service_factory()
+        errors = 0
+        pdfs = []
+        with METRICS.stage('download'):
+            for part in find_pdf_parts(msg['payload']):
+                try:
+                    attachment = local.service.users().messages().attachments().get(
+                        userId='me', messageId=msg['id'], id=part['attachment_id']
+                    ).execute()
+                    pdfs.append((part['filename'], stage_attachment(attachment['data'])))
+                except Exception as e:
+                    print(f"  Error downloading attachment of {msg['id'][:8]}...: {e}")
+                    errors += 1
+        METRICS.add('download', bytes=sum(blob.size for _, blob in pdfs), api_calls=len(pdfs) + errors)
+        return pdfs, errors
+
+    max_in_flight = workers * 2
+    queue = deque()
+    remaining = iter(messages)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gmail-download') as pool:
+        def refill():
+            while len(queue) < max_in_flight:
+                msg = next(remaining, None)
+                if msg is None:
+                    return
+                queue.append((msg, pool.submit(download, msg)))
+
+        refill()
+        while queue:
+            # Block on the head, then take every already-finished entry behind it
+            group = []
+            while queue and (not group or queue[0][1].done()):
+                msg, future = queue.popleft()
+                pdfs, errors = future.result()
+                group.append((msg, pdfs, errors))
+            refill()
+            yield group
+
+
+@METRICS.timed('store')
+def process_gmail_message(service, msg: Dict, conn,
+                          pdfs: Optional[List[Tuple[str, StagedBlob]]] = None,
+                          dedup: Optional[ReceiptDedupIndex] = None) -> List[Dict]:
     """Process a single Gmail message, extract ALL PDF attachments.
 
+    `pdfs` holds (filename, staged blob) already downloaded by a batched
+    fetch; when omitted the attachments are downloaded here. New PDFs are
+    committed into the blob store, duplicates discarded. `dedup` carries
+    the run's known content hashes (a fresh index is used when omitted).
+
     Returns list of saved receipts (one per PDF).
     """
     headers = {h['name'].lower(): h['value'] for h in msg['payload']['headers']}
@@ -237,28 +834,7 @@ def process_gmail_message(service, msg: Dict, conn) -> List[Dict]:
     print(f"Processing: {subject[:60]}...")
 
     # Find ALL PDF attachments
-    pdfs_found = []
-
-    def find_pdfs_in_parts(parts):
-        for part in parts:
-            mime_type = part.get('mimeType', '')
-            if mime_type == 'application/pdf' or (mime_type == 'application/octet-stream' and part.get('filename', '').lower().endswith('.pdf')):
-                attachment_id = part.get('body', {}).get('attachmentId')
-                if attachment_id:
-                    try:
-                        attachment = service.users().messages().attachments().get(
-                            userId='me', messageId=msg_id, id=attachment_id
-                        ).execute()
-                        pdf_data = base64.urlsafe_b64decode(attachment['data'])
-                        pdf_filename = part.get('filename', 'receipt.pdf')
-                        pdfs_found.append((pdf_filename, pdf_data))
-                    except Exception as e:
-                        print(f"  Error downloading attachment: {e}")
-            if 'parts' in part:
-                find_pdfs_in_parts(part['parts'])
-
-    if 'parts' in msg['payload']:
-        find_pdfs_in_parts(msg['payload']['parts'])
+    pdfs_found = pdfs if pdfs is not None else download_pdf_attachments(service, msg)
 
     if not pdfs_found:
         print(f"  No PDF attachments found")
@@ -267,65 +843,110 @@ def process_gmail_message(service, msg: Dict, conn) -> List[Dict]:
     print(f"  Found {len(pdfs_found)} PDF(s)")
 
     saved_receipts = []
+    if dedup is None:
+        dedup = ReceiptDedupIndex(conn)
+    dedup.prime_hashes([blob.content_hash for _, blob in pdfs_found])
 
-    for pdf_filename, pdf_data in pdfs_found:
-        # Calculate PDF hash
-        pdf_hash = hashlib.sha256(pdf_data).hexdigest()
+    try:
+        for pdf_filename, blob in pdfs_found:
+            pdf_hash = blob.content_hash
 
-        # Check for duplicate by hash
-        with conn.cursor() as cur:
-            cur.execute(
-                "SELECT id FROM finance.receipts WHERE pdf_hash = %s",
-                (pdf_hash,)
-            )
-            if cur.fetchone():
+            # Check for duplicate by hash
+            if dedup.is_duplicate(pdf_hash):
                 print(f"    Skipping {pdf_filename} (duplicate PDF hash)")
+                blob.discard()
                 continue
 
-        # Save PDF to storage
-        PDF_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
-        safe_filename = re.sub(r'[^\w\-.]', '_', pdf_filename)
-        pdf_path = PDF_STORAGE_PATH / f"{pdf_hash[:16]}_{safe_filename}"
-        pdf_path.write_bytes(pdf_data)
+            # Move the staged PDF into the blob store (atomic, no-op if already stored)
+            pdf_path, _ = blob.commit()
 
-        # Determine vendor from label (ingestion only - no PDF parsing)
-        vendor = 'carrefour_uae'  # We know this from the label
+            # Determine vendor from label (ingestion only - no PDF parsing)
+            vendor = 'carrefour_uae'  # We know this from the label
 
-        # Insert receipt record (metadata only, no parsing)
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO finance.receipts (
-                    gmail_message_id, gmail_thread_id, gmail_label,
-                    email_from, email_subject, email_received_at,
-                    pdf_hash, pdf_filename, pdf_size_bytes, pdf_storage_path,
-                    vendor, parse_status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending')
-                RETURNING id
-            """, (
-                msg_id, thread_id, GMAIL_LABEL,
-                from_addr, subject, email_received_at,
-                pdf_hash, pdf_filename, len(pdf_data), str(pdf_path.relative_to(PDF_STORAGE_PATH.parent)),
-                vendor
-            ))
-            receipt_id = cur.fetchone()[0]
+            # Insert receipt record (metadata only, no parsing)
+            receipt_id = insert_receipt(conn, {
+                'gmail_message_id': msg_id, 'gmail_thread_id': thread_id, 'gmail_label': GMAIL_LABEL,
+                'email_from': from_addr, 'email_subject': subject, 'email_received_at': email_received_at,
+            }, blob, pdf_filename, vendor)
             conn.commit()
+            dedup.add(pdf_hash)
+            METRICS.add('store', items=1, bytes=blob.size)
+
+            print(f"    Saved: ID {receipt_id}, {pdf_filename} ({blob.size} bytes)")
+
+            saved_receipts.append({
+                'id': receipt_id,
+                'pdf_path': pdf_path,
+                'pdf_hash': pdf_hash,
+                'filename': pdf_filename,
+                'size': blob.size
+            })
+    finally:
+        # Don't leave staged files behind if an insert fails part way
+        for _, blob in pdfs_found:
+            blob.discard()
 
-        print(f"    Saved: ID {receipt_id}, {pdf_filename} ({len(pdf_data)} bytes)")
+    return saved_receipts
 
-        saved_receipts.append({
-            'id': receipt_id,
-            'pdf_path': pdf_path,
-            'pdf_hash': pdf_hash,
-            'filename': pdf_filename,
-            'size': len(pdf_data)
-        })
 
-    return saved_receipts
+def find_html_body_data(payload: Dict) -> Optional[str]:
+    """Base64 data of the first text/html body of a message payload."""
+    html_data = None
 
+    def find_html_in_parts(parts):
+        nonlocal html_data
+        for part in parts:
+            mime_type = part.get('mimeType', '')
+            if mime_type == 'text/html' and not html_data:
+                html_data = part.get('body', {}).get('data', '')
+            if 'parts' in part:
+                find_html_in_parts(part['parts'])
 
-def process_html_email(service, msg: Dict, conn, vendor: str, label: str) -> List[Dict]:
+    if 'parts' in payload:
+        find_html_in_parts(payload['parts'])
+    elif payload.get('mimeType') == 'text/html':
+        html_data = payload.get('body', {}).get('data', '')
+
+    return html_data or None
+
+
+def iter_utf8_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Re-encode a byte stream as valid UTF-8, replacing invalid sequences.
+
+    Same output as bytes.decode('utf-8', errors='replace').encode('utf-8'),
+    with sequences split across chunks handled by an incremental decoder.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in chunks:
+        yield decoder.decode(chunk).encode('utf-8')
+    yield decoder.decode(b'', final=True).encode('utf-8')
+
+
+def stage_html_body(payload: Dict) -> Optional[StagedBlob]:
+    """Decode the first text/html body of a message payload into the staging area.
+
+    Returns: the staged blob, or None if the message has no HTML body
+    """
+    html_data = find_html_body_data(payload)
+    if not html_data:
+        return None
+    blob = BLOB_STORE.stage(iter_utf8_chunks(iter_base64_chunks(html_data)))
+    if not blob.size:
+        blob.discard()
+        return None
+    return blob
+
+
+@METRICS.timed('store')
+def process_html_email(service, msg: Dict, conn, vendor: str, label: str,
+                       dedup: Optional[ReceiptDedupIndex] = None,
+                       html_blob: Optional[StagedBlob] = None) -> List[Dict]:
     """Process a Gmail message with HTML body (e.g., Careem Quik receipts).
 
+    `html_blob` may be passed when the caller already staged the body (see
+    stage_html_body); it is committed to the blob store, or discarded for a
+    duplicate. `dedup` carries the run's known content hashes.
+
     Returns list of saved receipts (one per email).
     """
     headers = {h['name'].lower(): h['value'] for h in msg['payload']['headers']}
@@ -345,45 +966,50 @@ def process_html_email(service, msg: Dict, conn, vendor: str, label: str) -> Lis
     print(f"Processing: {subject[:60]}...")
 
     # Extract HTML body
-    html_body = None
+    if html_blob is None:
+        html_blob = stage_html_body(msg['payload'])
 
-    def find_html_in_parts(parts):
-        nonlocal html_body
-        for part in parts:
-            mime_type = part.get('mimeType', '')
-            if mime_type == 'text/html' and not html_body:
-                body_data = part.get('body', {}).get('data', '')
-                if body_data:
-                    html_body = base64.urlsafe_b64decode(body_data).decode('utf-8', errors='replace')
-            if 'parts' in part:
-                find_html_in_parts(part['parts'])
-
-    if 'parts' in msg['payload']:
-        find_html_in_parts(msg['payload']['parts'])
-    elif msg['payload'].get('mimeType') == 'text/html':
-        body_data = msg['payload'].get('body', {}).get('data', '')
-        if body_data:
-            html_body = base64.urlsafe_b64decode(body_data).decode('utf-8', errors='replace')
-
-    if not html_body:
+    if html_blob is None:
         print(f"  No HTML body found")
         return []
 
-    # Hash the HTML content for dedup
-    content_hash = hashlib.sha256(html_body.encode('utf-8')).hexdigest()
+    # The staged body was hashed while it was written
+    content_hash = html_blob.content_hash
 
-    with conn.cursor() as cur:
-        cur.execute("SELECT id FROM finance.receipts WHERE pdf_hash = %s", (content_hash,))
-        if cur.fetchone():
-            print(f"  Skipping (duplicate content hash)")
-            return []
+    if dedup is None:
+        dedup = ReceiptDedupIndex(conn)
+    if dedup.is_duplicate(content_hash):
+        print(f"  Skipping (duplicate content hash)")
+        html_blob.discard()
+        return []
 
-    # Save HTML to storage
-    PDF_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
+    # Move HTML into the blob store
     safe_subject = re.sub(r'[^\w\-.]', '_', subject[:50])
-    html_path = PDF_STORAGE_PATH / f"{content_hash[:16]}_{safe_subject}.html"
-    html_path.write_text(html_body, encoding='utf-8')
+    html_filename = f"{content_hash[:16]}_{safe_subject}.html"
+    html_path, _ = html_blob.commit()
+
+    receipt_id = insert_receipt(conn, {
+        'gmail_message_id': msg_id, 'gmail_thread_id': thread_id, 'gmail_label': label,
+        'email_from': from_addr, 'email_subject': subject, 'email_received_at': email_received_at,
+    }, html_blob, html_filename, vendor)
+    conn.commit()
+    dedup.add(content_hash)
+    METRICS.add('store', items=1, bytes=html_blob.size)
+
+    print(f"  Saved: ID {receipt_id}, {html_filename} ({html_blob.size} bytes)")
+
+    return [{'id': receipt_id, 'pdf_path': html_path, 'pdf_hash': content_hash,
+             'filename': html_filename, 'size': html_blob.size}]
+
+
+def insert_receipt(conn, source: Dict[str, Any], blob: StagedBlob, filename: str, vendor: str) -> int:
+    """Insert a pending finance.receipts row for a file in the blob store (no commit).
 
+    `source` holds the gmail_message_id, gmail_thread_id, gmail_label,
+    email_from, email_subject and email_received_at columns (missing = NULL).
+
+    Returns: the receipt ID
+    """
     with conn.cursor() as cur:
         cur.execute("""
             INSERT INTO finance.receipts (
@@ -394,19 +1020,12 @@ def process_html_email(service, msg: Dict, conn, vendor: str, label: str) -> Lis
             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'pending')
             RETURNING id
         """, (
-            msg_id, thread_id, label,
-            from_addr, subject, email_received_at,
-            content_hash, html_path.name, len(html_body.encode('utf-8')),
-            str(html_path.relative_to(PDF_STORAGE_PATH.parent)),
+            source.get('gmail_message_id'), source.get('gmail_thread_id'), source.get('gmail_label'),
+            source.get('email_from'), source.get('email_subject'), source.get('email_received_at'),
+            blob.content_hash, filename, blob.size, BLOB_STORE.relative_path(blob.content_hash),
             vendor
         ))
-        receipt_id = cur.fetchone()[0]
-        conn.commit()
-
-    print(f"  Saved: ID {receipt_id}, {html_path.name} ({len(html_body)} chars)")
-
-    return [{'id': receipt_id, 'pdf_path': html_path, 'pdf_hash': content_hash,
-             'filename': html_path.name, 'size': len(html_body)}]
+        return cur.fetchone()[0]
 
 
 def parse_email_date(date_str: str) -> datetime:
@@ -431,13 +1050,15 @@ def parse_email_date(date_str: str) -> datetime:
     return datetime.now()
 
 
-def identify_vendor(from_addr: str, subject: str, pdf_data: bytes) -> str:
-    """Identify vendor from email metadata and PDF content."""
+def identify_vendor(from_addr: str, subject: str, pdf_data: Union[bytes, Path]) -> str:
+    """Identify vendor from email metadata and PDF content (bytes or a file path)."""
     text = from_addr.lower() + ' ' + subject.lower()
 
     # Extract some PDF text for identification
     try:
-        reader = PdfReader(io.BytesIO(pdf_data))
+        import io
+        from pypdf import PdfReader
+        reader = PdfReader(io.BytesIO(pdf_data) if isinstance(pdf_data, bytes) else pdf_data)
         if reader.pages:
             pdf_text = reader.pages[0].extract_text().lower()
             text += ' ' + pdf_text[:1000]
@@ -451,22 +1072,460 @@ def identify_vendor(from_addr: str, subject: str, pdf_data: bytes) -> str:
 
 
 # ============================================================================
-# PDF Parsing
+# Local Backfill (--from-dir / --from-mbox)
+# ============================================================================
+
+# Files picked up by --from-dir, by suffix
+LOCAL_SOURCE_KINDS = {'.eml': 'eml', '.mbox': 'mbox', '.pdf': 'pdf', '.html': 'html', '.htm': 'html'}
+
+# Sender/subject keywords of each vendor's receipt emails, for mail without
+# one of the VENDOR_LABELS labels in X-Gmail-Labels (Takeout exports have it)
+VENDOR_EMAIL_KEYWORDS = {
+    'carrefour_uae': ('carrefour', 'maf retail', 'majid al futtaim'),
+    'careem_quik': ('careem quik',),
+}
+
+# gmail_label of receipts imported from disk (gmail_message_id is NULL)
+LOCAL_IMPORT_LABEL = 'local-import'
+
+LOCAL_READ_CHUNK = 1024 * 1024
+
+
+@METRICS.timed('fetch')
+def import_local_receipts(conn, from_dir: Optional[Path] = None, from_mbox: Optional[Path] = None,
+                          workers: int = LOCAL_SCAN_WORKERS) -> Tuple[int, int, int]:
+    """Ingest receipts from .eml/.pdf/.html files and mbox exports on disk.
+
+    Files and mbox messages are scanned on a process pool (scan_local_source):
+    receipt emails are recognised by label or sender, their PDFs / HTML body
+    are staged in the blob store and hashed. This process then drops content
+    already in finance.receipts and inserts the rest as pending receipts,
+    committing every LOCAL_COMMIT_EVERY, for the usual --parse.
+
+    Returns: (receipts_saved, duplicates, read_errors)
+    """
+    BLOB_STORE.clear_staging()
+    tasks = list(iter_local_sources(from_dir, from_mbox))
+    print(f"Scanning {len(tasks)} files/messages on {max(workers, 1)} process(es)")
+    METRICS.add('fetch', items=len(tasks))
+
+    dedup = ReceiptDedupIndex(conn)
+    saved = duplicates = errors = ignored = 0
+    pending = []
+    for records, error in iter_scanned_sources(tasks, workers):
+        if error:
+            print(f"  Error reading {error}")
+            errors += 1
+        elif not records:
+            ignored += 1
+        pending.extend(records)
+        if len(pending) >= LOCAL_COMMIT_EVERY:
+            stored = store_local_receipts(conn, pending, dedup)
+            saved += stored
+            duplicates += len(pending) - stored
+            pending = []
+    stored = store_local_receipts(conn, pending, dedup)
+    saved += stored
+    duplicates += len(pending) - stored
+
+    print(f"Imported {saved} receipts ({duplicates} duplicates, "
+          f"{ignored} files/messages without receipts, {errors} unreadable)")
+    return saved, duplicates, errors
+
+
+def iter_local_sources(from_dir: Optional[Path], from_mbox: Optional[Path]) -> Iterator[Tuple[str, str, int, int]]:
+    """Scan tasks (kind, path, offset, length) for scan_local_source(); length -1 = whole file."""
+    paths = []
+    if from_dir:
+        paths.extend(path for path in sorted(from_dir.rglob('*'))
+                     if path.suffix.lower() in LOCAL_SOURCE_KINDS and path.is_file())
+    if from_mbox:
+        paths.append(from_mbox)
+
+    for path in paths:
+        kind = LOCAL_SOURCE_KINDS.get(path.suffix.lower(), 'mbox')
+        if kind == 'mbox':
+            for offset, length in mbox_message_spans(path):
+                yield kind, str(path), offset, length
+        else:
+            yield kind, str(path), 0, -1
+
+
+def mbox_message_spans(path: Path) -> Iterator[Tuple[int, int]]:
+    """(offset, length) of each message in an mbox file, its "From " line included.
+
+    Splits where the mailbox module does (any line starting with "From "),
+    without parsing the messages.
+    """
+    start = None
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'From '):
+                if start is not None:
+                    yield start, offset - start
+                start = offset
+            offset += len(line)
+    if start is not None:
+        yield start, offset - start
+
+
+def iter_scanned_sources(tasks: List[Tuple[str, str, int, int]],
+                         workers: int) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """scan_local_source() results in task order, on a process pool when workers > 1."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(scan_local_source, tasks)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(scan_local_source, tasks, chunksize=chunksize)
+
+
+def scan_local_source(task: Tuple[str, str, int, int]) -> Tuple[List[Dict], Optional[str]]:
+    """Stage the receipts found in one file or mbox message. No database access.
+
+    Returns: (records of vendor, filename, staged blob and finance.receipts
+              source columns, error message or None)
+    """
+    kind, path, offset, length = task
+    try:
+        if kind == 'pdf':
+            return scan_pdf_file(Path(path)), None
+        if kind == 'html':
+            return scan_html_file(Path(path)), None
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        if kind == 'mbox':
+            # Drop the "From " separator line
+            data = data.partition(b'\n')[2]
+        return scan_email(data), None
+    except Exception as e:
+        return [], f"{path}" + (f" (message at byte {offset})" if kind == 'mbox' else '') + f": {e}"
+
+
+def iter_file_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(LOCAL_READ_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+
+def scan_pdf_file(path: Path) -> List[Dict]:
+    """A standalone PDF, if its first page identifies a PDF vendor."""
+    vendor = identify_vendor('', path.name, path)
+    if VENDOR_LABELS.get(vendor, (None, None))[1] != 'pdf':
+        return []
+    return [{'vendor': vendor, 'filename': path.name, 'blob': BLOB_STORE.stage(iter_file_chunks(path)),
+             'source': {'gmail_label': LOCAL_IMPORT_LABEL}}]
+
+
+def scan_html_file(path: Path) -> List[Dict]:
+    """A standalone HTML receipt (Careem Quik, saved from the email)."""
+    data = path.read_bytes()
+    if b'careem' not in data.lower():
+        return []
+    blob = BLOB_STORE.stage(iter_utf8_chunks([data]))
+    return [{'vendor': 'careem_quik', 'filename': path.name, 'blob': blob,
+             'source': {'gmail_label': LOCAL_IMPORT_LABEL}}]
+
+
+def identify_email_vendor(from_addr: str, subject: str, gmail_labels: str) -> Optional[str]:
+    """Vendor of a receipt email, by Gmail label (X-Gmail-Labels) or sender/subject keywords."""
+    labels = {label.strip() for label in gmail_labels.split(',')}
+    for vendor, (gmail_label, _) in VENDOR_LABELS.items():
+        if gmail_label in labels:
+            return vendor
+    text = f"{from_addr} {subject}".lower()
+    for vendor, keywords in VENDOR_EMAIL_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return vendor
+    return None
+
+
+def scan_email(data: bytes) -> List[Dict]:
+    """Receipts in one RFC 822 message: its PDF attachments or HTML body, by vendor.
+
+    Only the headers are parsed for mail that isn't a receipt. The stored
+    content is the transfer-decoded part, as the Gmail API returns it, so a
+    receipt imported from disk has the same hash as one fetched from Gmail.
+    """
+    from email import policy
+    from email.parser import BytesHeaderParser, BytesParser
+
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(data)
+    from_addr = str(headers.get('From', ''))
+    subject = str(headers.get('Subject', ''))
+    vendor = identify_email_vendor(from_addr, subject, str(headers.get('X-Gmail-Labels', '')))
+    if vendor is None:
+        return []
+
+    # Takeout's X-GM-THRID is the decimal form of the API's hex thread ID
+    thread_id = str(headers.get('X-GM-THRID', ''))
+    date_str = str(headers.get('Date', ''))
+    source = {
+        'gmail_thread_id': format(int(thread_id), 'x') if thread_id.isdigit() else None,
+        'gmail_label': LOCAL_IMPORT_LABEL,
+        'email_from': from_addr,
+        'email_subject': subject,
+        'email_received_at': parse_email_date(date_str) if date_str else None,
+    }
+
+    msg = BytesParser(policy=policy.default).parsebytes(data)
+    records = []
+    for part in msg.walk():
+        mime_type = part.get_content_type()
+        filename = part.get_filename() or ''
+        if VENDOR_LABELS[vendor][1] == 'html':
+            if mime_type != 'text/html':
+                continue
+            body = part.get_payload(decode=True)
+            if not body:
+                continue
+            blob = BLOB_STORE.stage(iter_utf8_chunks([body]))
+            safe_subject = re.sub(r'[^\w\-.]', '_', subject[:50])
+            records.append({'vendor': vendor, 'filename': f"{blob.content_hash[:16]}_{safe_subject}.html",
+                            'blob': blob, 'source': source})
+            break
+        if mime_type == 'application/pdf' or (mime_type == 'application/octet-stream'
+                                              and filename.lower().endswith('.pdf')):
+            pdf_data = part.get_payload(decode=True)
+            if pdf_data:
+                records.append({'vendor': vendor, 'filename': filename or 'receipt.pdf',
+                                'blob': BLOB_STORE.stage([pdf_data]), 'source': source})
+    return records
+
+
+@METRICS.timed('store')
+def store_local_receipts(conn, records: List[Dict], dedup: ReceiptDedupIndex) -> int:
+    """Commit the staged files of new receipts and insert them in one transaction.
+
+    Returns: number of receipts inserted (the rest were duplicates)
+    """
+    if not records:
+        return 0
+    dedup.prime_hashes([record['blob'].content_hash for record in records])
+    saved = 0
+    try:
+        for record in records:
+            blob = record['blob']
+            if dedup.is_duplicate(blob.content_hash):
+                blob.discard()
+                continue
+            blob.commit()
+            insert_receipt(conn, record['source'], blob, record['filename'], record['vendor'])
+            dedup.add(blob.content_hash)
+            METRICS.add('store', items=1, bytes=blob.size)
+            saved += 1
+        conn.commit()
+    finally:
+        for record in records:
+            record['blob'].discard()
+    return saved
+
+
+# ============================================================================
+# Blob Store Migration
 # ============================================================================
 
-def parse_pending_receipts(conn) -> int:
-    """Parse all pending receipts."""
+def legacy_storage_path(receipt: Dict) -> Optional[Path]:
+    """Absolute path recorded in finance.receipts.pdf_storage_path (pre blob store layout)."""
+    if not receipt.get('pdf_storage_path'):
+        return None
+    return PDF_STORAGE_PATH.parent / receipt['pdf_storage_path']
+
+
+def migrate_legacy_blobs(conn) -> Tuple[int, int]:
+    """Move flat-layout receipt files into the sharded blob store.
+
+    Each file is hash-verified before it is moved; pdf_storage_path is
+    repointed at the shard and the legacy file removed only after commit.
+    Files that are missing or whose content no longer matches pdf_hash are
+    reported and left untouched.
+
+    Returns: (migrated_count, failed_count)
+    """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("""
-            SELECT id, vendor, pdf_storage_path, pdf_hash
+            SELECT id, pdf_hash, pdf_storage_path
             FROM finance.receipts
-            WHERE parse_status = 'pending'
-            ORDER BY created_at
+            WHERE pdf_storage_path IS NOT NULL
+            ORDER BY id
         """)
-        pending = cur.fetchall()
+        receipts = cur.fetchall()
+
+    migrated = 0
+    failed = 0
+    for receipt in receipts:
+        blob_rel = BLOB_STORE.relative_path(receipt['pdf_hash'])
+        if receipt['pdf_storage_path'] == blob_rel:
+            continue
+
+        legacy_path = legacy_storage_path(receipt)
+        if BLOB_STORE.adopt_legacy_blob(receipt['pdf_hash'], legacy_path) is None:
+            print(f"  Receipt {receipt['id']}: cannot migrate {legacy_path} (missing or hash mismatch)")
+            failed += 1
+            continue
+
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE finance.receipts SET pdf_storage_path = %s, updated_at = NOW()
+                WHERE id = %s
+            """, (blob_rel, receipt['id']))
+        conn.commit()
+        if legacy_path.is_file():
+            legacy_path.unlink()
+        migrated += 1
+
+    return migrated, failed
+
+
+# ============================================================================
+# Template Registry
+# ============================================================================
+
+class TemplateRegistry:
+    """In-memory finance.receipt_templates statuses for drift detection.
+
+    Loaded once per connection; kept current through LISTEN receipt_templates
+    (migration 199) so approvals made elsewhere are seen without re-querying.
+    Newly seen hashes are answered as needs_review immediately, inserted in
+    one statement by flush() and cached only once commit() has committed
+    them; until then a rollback leaves them pending for the next commit().
+    """
+
+    CHANNEL = 'receipt_templates'
+
+    def __init__(self):
+        self.statuses: Optional[Dict[str, str]] = None
+        self.new_templates: Dict[str, Tuple[str, str, int]] = {}
+        self.conn = None
+        self.listening = False
+
+    def load(self, conn):
+        """Subscribe to changes and read all template statuses.
+
+        LISTEN only takes effect when its transaction commits, so it is issued
+        in autocommit mode, which needs an idle connection. Loaded inside an
+        open transaction, the registry isn't subscribed and re-reads the
+        statuses on every lookup until a load() finds the connection idle.
+        """
+        self.listening = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        if self.listening:
+            autocommit = conn.autocommit
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.CHANNEL}")
+            finally:
+                conn.autocommit = autocommit
+        with conn.cursor() as cur:
+            cur.execute("SELECT template_hash, status FROM finance.receipt_templates")
+            self.statuses = dict(cur.fetchall())
+        self.conn = conn
+
+    def refresh(self, conn):
+        """Apply pending NOTIFYs ('<hash>:<status>', empty status = deleted)."""
+        if self.statuses is None or self.conn is not conn or not self.listening:
+            self.load(conn)
+            return
+        conn.poll()
+        for notify in conn.notifies:
+            if notify.channel != self.CHANNEL:
+                continue
+            template_hash, _, status = notify.payload.partition(':')
+            if status:
+                self.statuses[template_hash] = status
+            else:
+                self.statuses.pop(template_hash, None)
+        conn.notifies.clear()
+
+    def status(self, conn, template_hash: str) -> Optional[str]:
+        """Template status, or None if the hash has never been seen."""
+        self.refresh(conn)
+        status = self.statuses.get(template_hash)
+        if status is None and template_hash in self.new_templates:
+            return 'needs_review'
+        return status
+
+    def set_status(self, template_hash: str, status: str):
+        if self.statuses is not None:
+            self.statuses[template_hash] = status
+
+    def register(self, template_hash: str, vendor: str, parse_version: str, sample_receipt_id: int):
+        """Record a new template as needs_review; inserted by the next flush()/commit()."""
+        self.new_templates.setdefault(template_hash, (vendor, parse_version, sample_receipt_id))
+
+    def commit(self, conn):
+        """flush(), commit the connection, then cache the inserted templates."""
+        self.flush(conn)
+        conn.commit()
+        if self.statuses is not None:
+            for template_hash in self.new_templates:
+                self.statuses.setdefault(template_hash, 'needs_review')
+        self.new_templates.clear()
+
+    def flush(self, conn):
+        """Insert the templates registered since the last commit() (caller commits).
+
+        They stay pending until commit(), so a rollback after this doesn't
+        lose them: the next flush inserts them again (ON CONFLICT DO NOTHING).
+        """
+        if not self.new_templates:
+            return
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO finance.receipt_templates
+                    (vendor, template_hash, parse_version, sample_receipt_id, status, notes)
+                VALUES %s
+                ON CONFLICT (template_hash) DO NOTHING
+            """, [
+                (vendor, template_hash, parse_version, sample_receipt_id)
+                for template_hash, (vendor, parse_version, sample_receipt_id) in self.new_templates.items()
+            ], template="(%s, %s, %s, %s, 'needs_review', 'Auto-detected new template')")
+
+
+TEMPLATE_REGISTRY = TemplateRegistry()
+
+
+# ============================================================================
+# PDF Parsing
+# ============================================================================
+
+# Receipt columns needed to parse, plus any previously extracted text
+PENDING_RECEIPTS_SQL = """
+    SELECT r.id, r.vendor, r.pdf_storage_path, r.pdf_hash, r.parse_status,
+           rt.raw_text AS cached_raw_text,
+           rt.extraction_method AS cached_extraction_method
+    FROM finance.receipts r
+    LEFT JOIN finance.receipt_raw_text rt ON rt.receipt_id = r.id
+"""
+
+
+def parse_pending_receipts(conn, workers: int = PARSE_WORKERS) -> int:
+    """Parse all pending receipts.
+
+    With workers > 1, text extraction and vendor parsing run in a process
+    pool while this process writes the results, committing every
+    PARSE_COMMIT_EVERY receipts.
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(PENDING_RECEIPTS_SQL + """
+            WHERE r.parse_status = 'pending'
+            ORDER BY r.created_at
+        """)
+        pending = [dict(r) for r in cur.fetchall()]
 
     print(f"Found {len(pending)} receipts to parse")
 
+    if workers > 1 and len(pending) > 1:
+        return parse_receipts_pooled(conn, pending, workers)
+
     parsed_count = 0
     for receipt in pending:
         success = parse_receipt(conn, receipt)
@@ -476,64 +1535,227 @@ def parse_pending_receipts(conn) -> int:
     return parsed_count
 
 
+def parse_receipts_pooled(conn, receipts: List[Dict], workers: int) -> int:
+    """Extract/parse receipts in a process pool; single writer, batched commits.
+
+    Returns: number of receipts parsed successfully
+    """
+    parsed_count = 0
+    batch = []
+    for receipt, extracted in iter_extracted_receipts(receipts, workers):
+        batch.append((receipt, extracted))
+        if len(batch) >= PARSE_COMMIT_EVERY:
+            parsed_count += store_parsed_batch(conn, batch)
+            batch = []
+    parsed_count += store_parsed_batch(conn, batch)
+
+    return parsed_count
+
+
+def iter_extracted_receipts(receipts: List[Dict], workers: int) -> Iterator[Tuple[Dict, Dict]]:
+    """Yield (receipt, extract_receipt() result) in order, on a process pool when workers > 1."""
+    if workers <= 1 or len(receipts) <= 1:
+        for receipt in receipts:
+            yield receipt, extract_receipt(receipt)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, min(8, len(receipts) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for receipt, (extracted, metrics) in zip(receipts, pool.map(extract_receipt_measured, receipts,
+                                                                    chunksize=chunksize)):
+            METRICS.merge(metrics)
+            yield receipt, extracted
+
+
+@METRICS.timed('persist')
+def store_parsed_batch(conn, batch: List[Tuple[Dict, Dict]]) -> int:
+    """Write (receipt, extract_receipt() result) pairs in one transaction.
+
+    Each receipt is written under a savepoint so a failure only rolls back
+    (and marks failed) that receipt, not the rest of the batch. Item
+    auto-matching runs once for the batch, then it is committed.
+
+    Returns: number of receipts parsed successfully
+    """
+    parsed_count = 0
+    for receipt, extracted in batch:
+        try:
+            if store_parsed_receipt(conn, receipt, extracted, commit=False):
+                parsed_count += 1
+        except Exception as e:
+            mark_parse_failed(conn, receipt['id'], f"Store error: {e}", commit=False)
+        with conn.cursor() as cur:
+            cur.execute(f"RELEASE SAVEPOINT {PARSE_SAVEPOINT}")
+    auto_match_receipt_items(conn, [receipt['id'] for receipt, _ in batch])
+    TEMPLATE_REGISTRY.commit(conn)
+    return parsed_count
+
+
 def parse_receipt(conn, receipt: Dict) -> bool:
     """Parse a single receipt based on vendor."""
+    return store_parsed_receipt(conn, receipt, extract_receipt(receipt))
+
+
+@METRICS.timed('extract')
+def extract_receipt(receipt: Dict) -> Dict:
+    """Resolve a receipt's file, extract its text and run the vendor parser.
+
+    No database access, so it can run in a worker process.
+
+    PDF text cached in finance.receipt_raw_text (cached_raw_text /
+    cached_extraction_method, see PENDING_RECEIPTS_SQL) is reused when it was
+    produced by the current extractor backend and poppler version, so
+    re-parsing reads no PDFs.
+
+    Returns: dict with file_path, raw_text, extraction_method, cached, parsed,
+             error (first failure message)
+    """
+    from pdf_extract import extract_pdf_text_with_method, get_pdf_extractor
+
+    vendor = receipt['vendor']
+    result = {'file_path': None, 'raw_text': None, 'extraction_method': None,
+              'cached': False, 'parsed': None, 'error': None}
+    METRICS.add('extract', items=1)
+
+    if (vendor != 'careem_quik' and receipt.get('cached_raw_text') is not None
+            and receipt.get('cached_extraction_method') == get_pdf_extractor().method):
+        result['raw_text'] = receipt['cached_raw_text']
+        result['extraction_method'] = receipt['cached_extraction_method']
+        result['cached'] = True
+        return parse_extracted_text(vendor, result)
+
+    # Resolve file path (blob store shard, falling back to the legacy flat path)
+    legacy_path = legacy_storage_path(receipt)
+    file_path = BLOB_STORE.locate(receipt['pdf_hash'], legacy_path)
+    if file_path is None:
+        result['error'] = f"File not found: {legacy_path or receipt['pdf_hash']}"
+        return result
+    result['file_path'] = file_path
+    METRICS.add('extract', bytes=file_path.stat().st_size)
+
+    # Careem uses HTML, skip PDF extraction
+    if vendor == 'careem_quik':
+        with METRICS.stage('parse'):
+            try:
+                from careem_parser import parse_careem_html
+                result['parsed'] = parse_careem_html(file_path.read_text(encoding='utf-8'))
+            except Exception as e:
+                result['error'] = f"Careem parse error: {e}"
+        METRICS.add('parse', items=1)
+        return result
+
+    # Extract raw text with layout preservation (see pdf_extract.py)
+    try:
+        result['raw_text'], result['extraction_method'] = extract_pdf_text_with_method(file_path)
+    except Exception as e:
+        result['error'] = f"PDF text extraction error: {e}"
+        return result
+
+    return parse_extracted_text(vendor, result)
+
+
+def extract_receipt_measured(receipt: Dict) -> Tuple[Dict, Dict]:
+    """extract_receipt() for a worker process, plus the stage metrics it recorded.
+
+    The caller merges the metrics into its own METRICS (see PipelineMetrics.merge).
+    """
+    METRICS.reset()
+    METRICS.profiling = False
+    return extract_receipt(receipt), METRICS.snapshot()
+
+
+@METRICS.timed('parse')
+def parse_extracted_text(vendor: str, result: Dict) -> Dict:
+    """Run the vendor parser over result['raw_text'] (extract_receipt helper)."""
+    METRICS.add('parse', items=1)
+    if vendor == 'carrefour_uae':
+        try:
+            from carrefour_parser import parse_carrefour_receipt
+            result['parsed'] = parse_carrefour_receipt(result['raw_text'])
+        except Exception as e:
+            import traceback
+            result['error'] = f"{e}\n{traceback.format_exc()}"
+
+    return result
+
+
+@METRICS.timed('persist')
+def store_parsed_receipt(conn, receipt: Dict, extracted: Dict, commit: bool = True) -> bool:
+    """Write the output of extract_receipt() for one receipt.
+
+    With commit=False the caller owns the transaction: writes happen under
+    the PARSE_SAVEPOINT savepoint and mark_parse_failed() rolls back to it.
+    """
     receipt_id = receipt['id']
     vendor = receipt['vendor']
 
-    # Resolve file path
-    file_path = PDF_STORAGE_PATH.parent / receipt['pdf_storage_path']
-    if not file_path.exists():
-        mark_parse_failed(conn, receipt_id, f"File not found: {file_path}")
+    if not commit:
+        with conn.cursor() as cur:
+            cur.execute(f"SAVEPOINT {PARSE_SAVEPOINT}")
+
+    if extracted['file_path'] is None and not extracted['cached']:
+        mark_parse_failed(conn, receipt_id, extracted['error'], commit=commit)
         return False
 
-    print(f"Parsing receipt {receipt_id} (vendor: {vendor})")
+    print(f"Parsing receipt {receipt_id} (vendor: {vendor})"
+          + (" from cached text" if extracted['cached'] else ""))
 
-    # Careem uses HTML, skip PDF extraction
     if vendor == 'careem_quik':
-        return parse_careem_quik(conn, receipt_id, str(file_path))
+        if extracted['error']:
+            mark_parse_failed(conn, receipt_id, extracted['error'], commit=commit)
+            return False
+        return parse_careem_quik(conn, receipt_id, extracted['file_path'],
+                                 parsed=extracted['parsed'], commit=commit)
 
-    # Extract raw text using pdftotext with layout preservation
-    try:
-        result = subprocess.run(
-            ['pdftotext', '-layout', str(file_path), '-'],
-            capture_output=True, text=True, timeout=30
-        )
-        if result.returncode != 0:
-            raise Exception(f"pdftotext failed: {result.stderr}")
-        raw_text = result.stdout
-    except Exception as e:
-        mark_parse_failed(conn, receipt_id, f"PDF text extraction error: {e}")
+    if extracted['raw_text'] is None:
+        mark_parse_failed(conn, receipt_id, extracted['error'], commit=commit)
         return False
 
-    # Store raw text
-    with conn.cursor() as cur:
-        cur.execute("""
-            INSERT INTO finance.receipt_raw_text (receipt_id, raw_text, extraction_method)
-            VALUES (%s, %s, 'pdftotext_layout')
-            ON CONFLICT (receipt_id) DO UPDATE SET
-                raw_text = EXCLUDED.raw_text,
-                created_at = NOW()
-        """, (receipt_id, raw_text))
+    # Store raw text (unless it came from the cache)
+    if not extracted['cached']:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO finance.receipt_raw_text (receipt_id, raw_text, extraction_method)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (receipt_id) DO UPDATE SET
+                    raw_text = EXCLUDED.raw_text,
+                    extraction_method = EXCLUDED.extraction_method,
+                    created_at = NOW()
+            """, (receipt_id, extracted['raw_text'], extracted['extraction_method']))
 
     # Parse based on vendor
     if vendor == 'carrefour_uae':
-        return parse_carrefour_uae(conn, receipt_id, raw_text, str(file_path))
+        if extracted['error']:
+            mark_parse_failed(conn, receipt_id, extracted['error'], commit=commit)
+            return False
+        pdf_path = str(extracted['file_path']) if extracted['file_path'] else None
+        return parse_carrefour_uae(conn, receipt_id, extracted['raw_text'], pdf_path,
+                                   parsed=extracted['parsed'], commit=commit)
     else:
-        mark_parse_failed(conn, receipt_id, f"Unknown vendor: {vendor}")
+        mark_parse_failed(conn, receipt_id, f"Unknown vendor: {vendor}", commit=commit)
         return False
 
 
-def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = None) -> bool:
-    """Parse Carrefour UAE receipt format using dedicated parser module."""
+def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = None,
+                        parsed: Optional[ParsedReceipt] = None, commit: bool = True) -> bool:
+    """Parse Carrefour UAE receipt format using dedicated parser module.
+
+    `parsed` skips re-parsing when the text was already parsed in a worker;
+    commit=False leaves the commit to the caller (see store_parsed_receipt).
+    """
+    from carrefour_parser import parse_carrefour_receipt, validate_parsed_receipt, PARSE_VERSION
+
     try:
         # Use the carrefour_parser module
-        parsed = parse_carrefour_receipt(raw_text)
+        if parsed is None:
+            parsed = parse_carrefour_receipt(raw_text)
 
         # Check if document should be skipped (tips, refunds, etc.)
         if parsed.get('skip_reason'):
             doc_type = parsed.get('doc_type', 'unknown')
-            mark_parse_skipped(conn, receipt_id, doc_type, parsed['skip_reason'])
+            mark_parse_skipped(conn, receipt_id, doc_type, parsed['skip_reason'], commit=commit)
             return True  # Not a failure, just skipped
 
         # Validate parsed data
@@ -543,7 +1765,7 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
 
         # Check for critical parse errors
         if parsed.get('parse_errors') and not parsed.get('invoice_no'):
-            mark_parse_failed(conn, receipt_id, f"Parse errors: {parsed['parse_errors']}")
+            mark_parse_failed(conn, receipt_id, f"Parse errors: {parsed['parse_errors']}", commit=commit)
             return False
 
         # Extract key fields
@@ -569,25 +1791,14 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
         # Check if this template_hash is known/approved
         is_known_template = False
         if template_hash:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, status FROM finance.receipt_templates
-                    WHERE template_hash = %s
-                """, (template_hash,))
-                template_row = cur.fetchone()
-
-                if template_row:
-                    # Template exists - check if approved
-                    is_known_template = (template_row[1] == 'approved')
-                else:
-                    # New template - register it as needs_review
-                    cur.execute("""
-                        INSERT INTO finance.receipt_templates
-                            (vendor, template_hash, parse_version, sample_receipt_id, status, notes)
-                        VALUES ('carrefour_uae', %s, %s, %s, 'needs_review', 'Auto-detected new template')
-                        ON CONFLICT (template_hash) DO NOTHING
-                    """, (template_hash, parse_version, receipt_id))
-                    print(f"  New template detected: {template_hash[:16]}...")
+            template_status = TEMPLATE_REGISTRY.status(conn, template_hash)
+            if template_status is not None:
+                # Template exists - check if approved
+                is_known_template = (template_status == 'approved')
+            else:
+                # New template - register it as needs_review (inserted on flush)
+                TEMPLATE_REGISTRY.register(template_hash, 'carrefour_uae', parse_version, receipt_id)
+                print(f"  New template detected: {template_hash[:16]}...")
 
         # If template is not approved, mark for review and skip item insertion
         if template_hash and not is_known_template:
@@ -612,11 +1823,12 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
                     invoice_number, store_name, receipt_date,
                     subtotal, vat_amount, total_amount,
                     template_hash, parse_version,
-                    json.dumps(parsed, ensure_ascii=False),
+                    parsed.to_json(),
                     receipt_id
                 ))
-            conn.commit()
-            print(f"  Needs review: unknown template, {len(parsed.get('line_items', []))} items parsed but not inserted")
+            if commit:
+                TEMPLATE_REGISTRY.commit(conn)
+            print(f"  Needs review: unknown template, {len(parsed.line_items)} items parsed but not inserted")
             return True  # Not a failure, just needs review
 
         # Update receipt record with parsed data
@@ -640,7 +1852,7 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
                 invoice_number, store_name, receipt_date,
                 subtotal, vat_amount, total_amount,
                 template_hash, parse_version,
-                json.dumps(parsed, ensure_ascii=False),
+                parsed.to_json(),
                 receipt_id
             ))
 
@@ -649,30 +1861,10 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
             cur.execute("DELETE FROM finance.receipt_items WHERE receipt_id = %s", (receipt_id,))
 
         # Insert parsed line items
-        line_items = parsed.get('line_items', [])
-        items_sum = 0.0
+        line_items = parsed.line_items
+        items_sum = sum(item.total_incl_vat or 0 for item in line_items)
         with conn.cursor() as cur:
-            for idx, item in enumerate(line_items, 1):
-                line_total = item.get('total_incl_vat', 0) or 0
-                items_sum += line_total
-                cur.execute("""
-                    INSERT INTO finance.receipt_items (
-                        receipt_id, line_number, item_code, item_description,
-                        item_description_clean, quantity, unit_price,
-                        line_total, discount_amount, is_promotional
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    receipt_id,
-                    idx,
-                    item.get('barcode'),
-                    item.get('description'),
-                    clean_item_description(item.get('description', '')),
-                    item.get('qty_delivered', 1),
-                    item.get('unit_price_incl_vat'),
-                    line_total,
-                    item.get('discount', 0),
-                    item.get('voucher_discount') is not None
-                ))
+            insert_receipt_items(cur, CARREFOUR_ITEM_COLUMNS, carrefour_item_rows(receipt_id, line_items))
 
         # Reconciliation check: verify items sum matches total
         reconciliation_tolerance = 0.10  # 10 fils
@@ -688,20 +1880,52 @@ def parse_carrefour_uae(conn, receipt_id: int, raw_text: str, pdf_path: str = No
                     f"Reconciliation failed: items sum {items_sum:.2f} != total {total_amount:.2f} (diff: {abs(items_sum - total_amount):.2f})",
                     receipt_id
                 ))
-            conn.commit()
+            if commit:
+                auto_match_receipt_items(conn, [receipt_id])
+                conn.commit()
             print(f"  Needs review: items sum {items_sum:.2f} != total {total_amount:.2f}")
             return True  # Not a failure, just needs review
 
-        conn.commit()
+        if commit:
+            auto_match_receipt_items(conn, [receipt_id])
+            conn.commit()
         print(f"  Parsed: {len(line_items)} items, total: {total_amount} AED (verified)")
         return True
 
     except Exception as e:
         import traceback
-        mark_parse_failed(conn, receipt_id, f"{e}\n{traceback.format_exc()}")
+        mark_parse_failed(conn, receipt_id, f"{e}\n{traceback.format_exc()}", commit=commit)
         return False
 
 
+CARREFOUR_ITEM_COLUMNS = (
+    'receipt_id', 'line_number', 'item_code', 'item_description',
+    'item_description_clean', 'quantity', 'unit_price',
+    'line_total', 'discount_amount', 'is_promotional'
+)
+
+
+def carrefour_item_rows(receipt_id: int, line_items: Iterable[LineItem]) -> Iterator[tuple]:
+    """finance.receipt_items rows (CARREFOUR_ITEM_COLUMNS) for parsed Carrefour line items.
+
+    Rows are produced as the items are consumed, so `line_items` can be
+    carrefour_parser.iter_carrefour_line_items() output.
+    """
+    for idx, item in enumerate(line_items, 1):
+        yield (
+            receipt_id,
+            idx,
+            item.barcode,
+            item.description,
+            clean_item_description(item.description or ''),
+            item.qty_delivered,
+            item.unit_price_incl_vat,
+            item.total_incl_vat or 0,
+            item.discount,
+            item.voucher_discount is not None
+        )
+
+
 def parse_carrefour_line_items(raw_text: str) -> List[Dict]:
     """Parse Carrefour receipt line items."""
     items = []
@@ -772,14 +1996,18 @@ def clean_item_description(desc: str) -> str:
     return desc.strip()
 
 
-def parse_careem_quik(conn, receipt_id: int, html_path: str) -> bool:
+def parse_careem_quik(conn, receipt_id: int, html_path: Path,
+                      parsed: Optional[ParsedReceipt] = None, commit: bool = True) -> bool:
     """Parse Careem Quik HTML receipt using the careem_parser module."""
+    from careem_parser import parse_careem_html
+
     try:
-        html_content = Path(html_path).read_text(encoding='utf-8')
-        parsed = parse_careem_html(html_content)
+        if parsed is None:
+            html_content = html_path.read_text(encoding='utf-8')
+            parsed = parse_careem_html(html_content)
 
-        if not parsed or not parsed.get('line_items'):
-            mark_parse_failed(conn, receipt_id, "No line items found in Careem HTML")
+        if not parsed or not parsed.line_items:
+            mark_parse_failed(conn, receipt_id, "No line items found in Careem HTML", commit=commit)
             return False
 
         order_date = parsed.get('order_date')
@@ -802,6 +2030,7 @@ def parse_careem_quik(conn, receipt_id: int, html_path: str) -> bool:
                     total_amount = %s,
                     vat_amount = %s,
                     currency = %s,
+                    parse_version = %s,
                     parse_status = 'success',
                     parsed_json = %s,
                     parsed_at = NOW(),
@@ -809,37 +2038,72 @@ def parse_careem_quik(conn, receipt_id: int, html_path: str) -> bool:
                 WHERE id = %s
             """, (
                 receipt_date, total_amount, vat_amount, currency,
-                json.dumps(parsed), receipt_id
+                parsed.get('parse_version'), parsed.to_json(), receipt_id
             ))
 
-            # Insert line items
-            for i, item in enumerate(parsed.get('line_items', []), 1):
-                desc = item.get('description', '')
-                qty = item.get('qty', 1)
-                unit_price = item.get('unit_price', 0)
-                line_total = item.get('total', unit_price * qty)
-
-                cur.execute("""
-                    INSERT INTO finance.receipt_items (
-                        receipt_id, line_number, item_description, item_description_clean,
-                        quantity, unit_price, line_total
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT DO NOTHING
-                """, (receipt_id, i, desc, desc, qty, unit_price, line_total))
+            # Replace line items (receipt_items has no unique key to conflict on)
+            cur.execute("DELETE FROM finance.receipt_items WHERE receipt_id = %s", (receipt_id,))
+            insert_receipt_items(cur, CAREEM_ITEM_COLUMNS,
+                                 careem_item_rows(receipt_id, parsed.line_items))
 
-        conn.commit()
-        item_count = len(parsed.get('line_items', []))
+        if commit:
+            auto_match_receipt_items(conn, [receipt_id])
+            conn.commit()
+        item_count = len(parsed.line_items)
         print(f"  Parsed: Careem Quik, {item_count} items, total {currency} {total_amount}")
         return True
 
     except Exception as e:
-        mark_parse_failed(conn, receipt_id, f"Careem parse error: {e}")
+        mark_parse_failed(conn, receipt_id, f"Careem parse error: {e}", commit=commit)
         return False
 
 
-def mark_parse_failed(conn, receipt_id: int, error: str):
-    """Mark receipt parsing as failed."""
+CAREEM_ITEM_COLUMNS = (
+    'receipt_id', 'line_number', 'item_description', 'item_description_clean',
+    'quantity', 'unit_price', 'line_total'
+)
+
+
+def careem_item_rows(receipt_id: int, line_items: Iterable[LineItem]) -> Iterator[tuple]:
+    """finance.receipt_items rows (CAREEM_ITEM_COLUMNS) for parsed Careem line items."""
+    for i, item in enumerate(line_items, 1):
+        desc = item.description
+        yield (receipt_id, i, desc, desc, item.qty, item.unit_price, item.total)
+
+
+def insert_receipt_items(cur, columns: Tuple[str, ...], rows: Iterable[tuple], on_conflict: str = ''):
+    """Insert a receipt's line items in multi-row INSERTs of ITEM_INSERT_PAGE_SIZE.
+
+    `rows` may be a generator; it is consumed one page at a time (nothing is
+    sent when it is empty).
+    """
+    execute_values(cur, f"""
+        INSERT INTO finance.receipt_items ({', '.join(columns)})
+        VALUES %s {on_conflict}
+    """, rows, page_size=ITEM_INSERT_PAGE_SIZE)
+
+
+def auto_match_receipt_items(conn, receipt_ids: List[int]):
+    """Match new items of a batch of receipts to nutrition.foods in one pass.
+
+    Stands in for the per-row trigger, which is skipped on this connection
+    (DB_SESSION_OPTIONS). Runs inside the caller's transaction, before commit.
+    """
+    if not receipt_ids:
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM finance.auto_match_receipt_items(%s)", (list(receipt_ids),))
+
+
+def mark_parse_failed(conn, receipt_id: int, error: str, commit: bool = True):
+    """Mark receipt parsing as failed.
+
+    With commit=False, first rolls back this receipt's partial writes to
+    PARSE_SAVEPOINT (pooled writer) and leaves the commit to the caller.
+    """
     with conn.cursor() as cur:
+        if not commit:
+            cur.execute(f"ROLLBACK TO SAVEPOINT {PARSE_SAVEPOINT}")
         cur.execute("""
             UPDATE finance.receipts SET
                 parse_status = 'failed',
@@ -847,11 +2111,12 @@ def mark_parse_failed(conn, receipt_id: int, error: str):
                 updated_at = NOW()
             WHERE id = %s
         """, (error, receipt_id))
-    conn.commit()
+    if commit:
+        conn.commit()
     print(f"  Parse failed: {error}")
 
 
-def mark_parse_skipped(conn, receipt_id: int, doc_type: str, reason: str):
+def mark_parse_skipped(conn, receipt_id: int, doc_type: str, reason: str, commit: bool = True):
     """Mark receipt as skipped (not a parsing failure, just unsupported doc type)."""
     with conn.cursor() as cur:
         cur.execute("""
@@ -863,25 +2128,190 @@ def mark_parse_skipped(conn, receipt_id: int, doc_type: str, reason: str):
                 updated_at = NOW()
             WHERE id = %s
         """, (doc_type, reason, receipt_id))
-    conn.commit()
+    if commit:
+        conn.commit()
     print(f"  Skipped: {doc_type} - {reason}")
 
 
 # ============================================================================
-# Transaction Creation (for receipts without SMS)
+# Stale Re-parse
 # ============================================================================
 
-def create_transaction_for_receipt(conn, receipt: Dict) -> Optional[int]:
+# Parsed receipts written by an older parser version (see current_parse_versions)
+STALE_RECEIPTS_SQL = """
+    SELECT r.id, r.vendor, r.pdf_storage_path, r.pdf_hash, r.parse_status,
+           r.parse_version, r.parsed_json,
+           rt.raw_text AS cached_raw_text,
+           rt.extraction_method AS cached_extraction_method
+    FROM finance.receipts r
+    JOIN unnest(%s::text[], %s::text[]) AS v(vendor, parse_version) ON v.vendor = r.vendor
+    LEFT JOIN finance.receipt_raw_text rt ON rt.receipt_id = r.id
+    WHERE r.parse_status IN ('success', 'needs_review')
+      AND r.parse_version IS DISTINCT FROM v.parse_version
+    ORDER BY r.id
+"""
+
+# parsed_json keys that change with every parser release (or receipt_models
+# layout), ignored by the diff
+PARSED_VERSION_KEYS = ('parse_version', 'parser_version', 'schema_version')
+
+# Item columns and the scale PostgreSQL rounds them to
+ITEM_NUMERIC_SCALES = {'quantity': 3, 'unit_price': 2, 'line_total': 2, 'discount_amount': 2}
+
+
+def current_parse_versions() -> Dict[str, str]:
+    """PARSE_VERSION of each vendor parser, by vendor."""
+    from carrefour_parser import PARSE_VERSION as CARREFOUR_PARSE_VERSION
+    from careem_parser import PARSE_VERSION as CAREEM_PARSE_VERSION
+
+    return {'carrefour_uae': CARREFOUR_PARSE_VERSION, 'careem_quik': CAREEM_PARSE_VERSION}
+
+
+def reparse_stale_receipts(conn, workers: int = PARSE_WORKERS) -> Tuple[int, int]:
+    """Re-parse receipts whose parse_version is older than the current parser's.
+
+    Receipts are re-parsed from their cached raw text (extract_receipt, on a
+    process pool with workers > 1) and the result is diffed against the
+    stored parsed_json and line items. Only receipts whose output changed
+    are rewritten, through the pooled writer (store_parsed_batch). The rest
+    just get the new parse_version, in one UPDATE, so their receipt_items
+    and the triggers behind them are left alone.
+
+    Failed, skipped and pending receipts are not re-parsed here (use --parse,
+    or --receipt-id N --reparse).
+
+    Returns: (receipts rewritten, receipts unchanged)
+    """
+    versions = current_parse_versions()
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(STALE_RECEIPTS_SQL, (list(versions), list(versions.values())))
+        stale = [dict(r) for r in cur.fetchall()]
+
+    print(f"Found {len(stale)} receipts parsed by an older parser version")
+    if not stale:
+        return 0, 0
+
+    stored_items = load_receipt_items(conn, [receipt['id'] for receipt in stale])
+
+    rewritten = 0
+    unchanged = []
+    batch = []
+    for receipt, extracted in iter_extracted_receipts(stale, workers):
+        changes = parsed_output_changes(receipt, extracted, stored_items.get(receipt['id'], []))
+        if not changes:
+            unchanged.append(receipt)
+            continue
+        print(f"Receipt {receipt['id']} ({receipt['parse_version']} -> "
+              f"{versions[receipt['vendor']]}): {', '.join(changes)} changed")
+        batch.append((receipt, extracted))
+        rewritten += 1
+        if len(batch) >= PARSE_COMMIT_EVERY:
+            store_parsed_batch(conn, batch)
+            batch = []
+    store_parsed_batch(conn, batch)
+
+    mark_parse_version_current(conn, unchanged, versions)
+    return rewritten, len(unchanged)
+
+
+def load_receipt_items(conn, receipt_ids: List[int]) -> Dict[int, List[Dict]]:
+    """Stored line items of many receipts, by receipt ID, in line order."""
+    items: Dict[int, List[Dict]] = {}
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT receipt_id, line_number, item_code, item_description,
+                   item_description_clean, quantity, unit_price, line_total,
+                   discount_amount, is_promotional
+            FROM finance.receipt_items
+            WHERE receipt_id = ANY(%s)
+            ORDER BY receipt_id, line_number, id
+        """, (receipt_ids,))
+        for row in cur.fetchall():
+            items.setdefault(row['receipt_id'], []).append(dict(row))
+    return items
+
+
+def parsed_output_changes(receipt: Dict, extracted: Dict, stored_items: List[Dict]) -> List[str]:
+    """What re-parsing a receipt would change (extract_receipt() result vs stored output).
+
+    parsed_json is compared key by key, ignoring PARSED_VERSION_KEYS, and
+    the line items by the rows the vendor's writer would insert.
+
+    Returns: names of the changed parsed_json keys, plus 'items' and/or
+             'error'; empty when the stored output is current
     """
-    Create a finance.transactions record for a receipt that has no linked SMS transaction.
+    parsed = extracted['parsed']
+    if extracted['error'] or parsed is None:
+        return ['error']
+
+    vendor = receipt['vendor']
+    if vendor == 'carrefour_uae':
+        from carrefour_parser import validate_parsed_receipt
+        # parse_carrefour_uae stores the validation errors in parsed_json
+        if not parsed.get('skip_reason'):
+            validation_errors = validate_parsed_receipt(parsed)
+            if validation_errors:
+                parsed['validation_errors'] = validation_errors
+        columns, rows = CARREFOUR_ITEM_COLUMNS, carrefour_item_rows(receipt['id'], parsed.line_items)
+    else:
+        columns, rows = CAREEM_ITEM_COLUMNS, careem_item_rows(receipt['id'], parsed.line_items)
+
+    changes = []
+    stored = receipt['parsed_json']
+    if stored is None:
+        changes.append('parsed_json')
+    else:
+        new = json.loads(parsed.to_json())
+        changes.extend(sorted(
+            key for key in set(stored) | set(new)
+            if key not in PARSED_VERSION_KEYS and stored.get(key) != new.get(key)
+        ))
+
+    def normalized(row):
+        return tuple(normalize_item_value(column, row[i]) for i, column in enumerate(columns))
+
+    stored_rows = [normalized([item[column] for column in columns]) for item in stored_items]
+    if stored_rows != [normalized(row) for row in rows]:
+        changes.append('items')
+    return changes
+
+
+def normalize_item_value(column: str, value: Any) -> Any:
+    """A receipt_items value as PostgreSQL would store it (numerics rounded to the column scale)."""
+    from decimal import Decimal, ROUND_HALF_UP
+
+    scale = ITEM_NUMERIC_SCALES.get(column)
+    if scale is None or value is None or isinstance(value, bool):
+        return value
+    return Decimal(str(value)).quantize(Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP)
+
 
-    Uses client_id = 'receipt:<pdf_hash>' for idempotency.
+def mark_parse_version_current(conn, receipts: List[Dict], versions: Dict[str, str]):
+    """Stamp receipts whose re-parse changed nothing with the current parse_version."""
+    if not receipts:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE finance.receipts r SET
+                parse_version = v.parse_version,
+                parsed_json = jsonb_set(r.parsed_json, '{parse_version}', to_jsonb(v.parse_version))
+            FROM unnest(%s::int[], %s::text[]) AS v(id, parse_version)
+            WHERE r.id = v.id
+        """, ([receipt['id'] for receipt in receipts],
+              [versions[receipt['vendor']] for receipt in receipts]))
+    conn.commit()
+
+
+# ============================================================================
+# Transaction Creation (for receipts without SMS)
+# ============================================================================
+
+def receipt_transaction_row(receipt: Dict) -> Tuple:
+    """finance.transactions values (date, merchant_name, amount, client_id, notes) for a receipt.
 
-    Returns: transaction_id if created, None if already exists or error
+    Uses client_id = 'rcpt:<pdf_hash prefix>' for idempotency.
     """
     receipt_id = receipt['id']
-    pdf_hash = receipt['pdf_hash']
-    total_amount = receipt['total_amount']
     receipt_date = receipt['receipt_date']
     if receipt_date is None:
         receipt_date = receipt.get('created_at')
@@ -892,30 +2322,37 @@ def create_transaction_for_receipt(conn, receipt: Dict) -> Optional[int]:
 
     # Generate idempotent client_id from PDF hash
     # varchar(36) limit: "rcpt:" (5) + 31 hex chars = 36
-    client_id = f"rcpt:{pdf_hash[:31]}"
+    client_id = f"rcpt:{receipt['pdf_hash'][:31]}"
 
-    # Check if transaction already exists (idempotency)
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT id FROM finance.transactions
-            WHERE client_id = %s
-        """, (client_id,))
-        existing = cur.fetchone()
-        if existing:
-            print(f"  Transaction already exists for receipt {receipt_id}: txn {existing[0]}")
-            # Link the receipt if not already linked
-            cur.execute("""
-                UPDATE finance.receipts
-                SET linked_transaction_id = %s, updated_at = NOW()
-                WHERE id = %s AND linked_transaction_id IS NULL
-            """, (existing[0], receipt_id))
-            conn.commit()
-            return existing[0]
+    return (
+        receipt_date,
+        'Careem Quik' if receipt.get('vendor') == 'careem_quik' else (f"Carrefour {store_name}" if store_name else 'Carrefour'),
+        -abs(receipt['total_amount']),  # Expenses are negative
+        client_id,
+        f"Auto-created from receipt #{receipt_id}"
+    )
+
+
+def create_transactions_for_receipts(conn, receipts: List[Dict]) -> int:
+    """
+    Create finance.transactions records for receipts that have no linked SMS transaction.
+
+    All rows go in one multi-row INSERT ... ON CONFLICT (client_id) DO NOTHING;
+    transactions that already existed for a client_id are looked up and reused.
+    Receipts are then linked with a single UPDATE. The caller commits, so the
+    refresh triggers see one transaction per run rather than one per receipt.
+
+    Returns: number of receipts linked to a created or existing transaction
+    """
+    if not receipts:
+        return 0
+
+    rows = [receipt_transaction_row(r) for r in receipts]
+    receipt_by_client_id = {row[3]: r for row, r in zip(rows, receipts)}
 
-    # Create transaction
     # Schema: date, merchant_name, amount, currency, category, is_grocery, client_id, notes
     with conn.cursor() as cur:
-        cur.execute("""
+        created = execute_values(cur, """
             INSERT INTO finance.transactions (
                 date,
                 merchant_name,
@@ -925,131 +2362,520 @@ def create_transaction_for_receipt(conn, receipt: Dict) -> Optional[int]:
                 is_grocery,
                 client_id,
                 notes
-            ) VALUES (
-                %s,
-                %s,
-                %s,
-                'AED',
-                'Groceries',
-                true,
-                %s,
-                %s
-            )
-            RETURNING id
-        """, (
-            receipt_date,
-            'Careem Quik' if receipt.get('vendor') == 'careem_quik' else (f"Carrefour {store_name}" if store_name else 'Carrefour'),
-            -abs(total_amount),  # Expenses are negative
-            client_id,
-            f"Auto-created from receipt #{receipt_id}"
-        ))
-        txn_id = cur.fetchone()[0]
+            ) VALUES %s
+            ON CONFLICT (client_id) WHERE client_id IS NOT NULL DO NOTHING
+            RETURNING id, client_id
+        """, rows, template="(%s, %s, %s, 'AED', 'Groceries', true, %s, %s)",
+            page_size=len(rows), fetch=True)
+        txn_by_client_id = {client_id: txn_id for txn_id, client_id in created}
+
+        # Check if transaction already exists (idempotency)
+        existing_client_ids = [c for c in receipt_by_client_id if c not in txn_by_client_id]
+        existing = {}
+        if existing_client_ids:
+            cur.execute("""
+                SELECT client_id, id FROM finance.transactions
+                WHERE client_id = ANY(%s)
+            """, (existing_client_ids,))
+            existing = dict(cur.fetchall())
+            txn_by_client_id.update(existing)
+
+        # Link receipts to their transactions
+        links = [(receipt_by_client_id[c]['id'], txn_id) for c, txn_id in txn_by_client_id.items()]
+        execute_values(cur, """
+            UPDATE finance.receipts r
+            SET linked_transaction_id = v.transaction_id, updated_at = NOW()
+            FROM (VALUES %s) AS v (receipt_id, transaction_id)
+            WHERE r.id = v.receipt_id AND r.linked_transaction_id IS NULL
+        """, links, template="(%s::integer, %s::integer)", page_size=max(len(links), 1))
+
+    for client_id, txn_id in txn_by_client_id.items():
+        receipt = receipt_by_client_id[client_id]
+        if client_id in existing:
+            print(f"  Transaction already exists for receipt {receipt['id']}: txn {txn_id}")
+        else:
+            print(f"  Created transaction {txn_id} for receipt {receipt['id']} ({receipt['total_amount']} AED)")
+
+    return len(txn_by_client_id)
 
-    # Link receipt to the new transaction
-    with conn.cursor() as cur:
-        cur.execute("""
-            UPDATE finance.receipts
-            SET linked_transaction_id = %s, updated_at = NOW()
-            WHERE id = %s
-        """, (txn_id, receipt_id))
 
+@METRICS.timed('link')
+def create_transactions_for_unlinked_receipts(conn) -> int:
+    """Create transactions for all unlinked receipts that don't match SMS.
+
+    Matching, creation and linking are committed together once.
+    """
+    unlinked = load_unlinked_receipts(conn)
+
+    print(f"Found {len(unlinked)} unlinked receipts")
+
+    # First try to link to existing transactions
+    links = match_unlinked_receipts(conn, unlinked)
+    apply_receipt_links(conn, links)
+    for link in links:
+        print(f"  Linked receipt {link['receipt_id']} to existing txn {link['transaction_id']}")
+
+    # No SMS match - create new transactions from the remaining receipts
+    linked_ids = {link['receipt_id'] for link in links}
+    created_count = create_transactions_for_receipts(
+        conn, [r for r in unlinked if r['id'] not in linked_ids])
     conn.commit()
-    print(f"  Created transaction {txn_id} for receipt {receipt_id} ({total_amount} AED)")
-    return txn_id
+
+    return created_count
 
 
-def create_transactions_for_unlinked_receipts(conn) -> int:
-    """Create transactions for all unlinked receipts that don't match SMS."""
+# ============================================================================
+# Transaction Linkage
+# ============================================================================
+
+def load_unlinked_receipts(conn) -> List[Dict]:
+    """Parsed receipts with a total and no linked transaction.
+
+    search_date uses the same fallback as finance.find_matching_transaction:
+    receipt_date -> email_received_at (Dubai) -> created_at.
+    """
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
         cur.execute("""
-            SELECT r.id, r.pdf_hash, r.receipt_date, r.total_amount, r.store_name, r.vendor, r.created_at
+            SELECT r.id, r.pdf_hash, r.receipt_date, r.total_amount, r.store_name, r.vendor, r.created_at,
+                   COALESCE(
+                       r.receipt_date,
+                       (r.email_received_at AT TIME ZONE 'Asia/Dubai')::date,
+                       r.created_at::date
+                   ) AS search_date
             FROM finance.receipts r
             WHERE r.linked_transaction_id IS NULL
               AND r.parse_status = 'success'
               AND r.total_amount IS NOT NULL
             ORDER BY COALESCE(r.receipt_date, r.created_at::date) DESC
         """)
-        unlinked = cur.fetchall()
+        return cur.fetchall()
+
+
+def match_unlinked_receipts(conn, receipts: List[Dict]) -> List[Dict]:
+    """Match receipts to transactions in one pass (see transaction_matcher.py).
+
+    Loads every candidate transaction for all receipts' date/amount windows
+    in a single query, then computes a globally optimal assignment.
+
+    Returns: [{'receipt_id', 'transaction_id', 'match_type', 'confidence'}]
+    """
+    from transaction_matcher import match_receipts, MAX_DAYS, MAX_FILS
+
+    if not receipts:
+        return []
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT DISTINCT t.id, t.date, t.amount
+            FROM unnest(%s::date[], %s::numeric[]) AS w(search_date, total)
+            JOIN finance.transactions t
+              ON t.date BETWEEN w.search_date - %s AND w.search_date + %s
+             AND ABS(t.amount) BETWEEN w.total - %s AND w.total + %s
+            WHERE t.receipt_processed = FALSE
+              AND t.is_quarantined = FALSE
+        """, (
+            [r['search_date'] for r in receipts],
+            [r['total_amount'] for r in receipts],
+            MAX_DAYS, MAX_DAYS, MAX_FILS / 100, MAX_FILS / 100,
+        ))
+        candidates = cur.fetchall()
+
+    return match_receipts(
+        [{'id': r['id'], 'search_date': r['search_date'], 'total': r['total_amount']} for r in receipts],
+        candidates
+    )
+
+
+def apply_receipt_links(conn, links: List[Dict]):
+    """Link receipts and flag their transactions in one statement (caller commits).
+
+    Same writes as finance.link_receipt_to_transaction(), for all links at once.
+    """
+    if not links:
+        return
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            WITH links (receipt_id, transaction_id, method, confidence) AS (
+                VALUES %s
+            ),
+            linked AS (
+                UPDATE finance.receipts r
+                SET linked_transaction_id = l.transaction_id,
+                    link_confidence = l.confidence,
+                    link_method = l.method,
+                    linked_at = NOW(),
+                    updated_at = NOW()
+                FROM links l
+                WHERE r.id = l.receipt_id
+                RETURNING l.transaction_id
+            )
+            UPDATE finance.transactions t
+            SET receipt_processed = TRUE
+            FROM linked
+            WHERE t.id = linked.transaction_id
+        """, [
+            (link['receipt_id'], link['transaction_id'], link['match_type'], link['confidence'])
+            for link in links
+        ], template="(%s::integer, %s::integer, %s::varchar, %s::numeric)", page_size=len(links))
+
+
+@METRICS.timed('link')
+def link_receipts_to_transactions(conn) -> int:
+    """Attempt to link unlinked receipts to transactions."""
+    unlinked = load_unlinked_receipts(conn)
 
     print(f"Found {len(unlinked)} unlinked receipts")
 
-    created_count = 0
+    links = match_unlinked_receipts(conn, unlinked)
+    apply_receipt_links(conn, links)
+    conn.commit()
+
+    linked_by_receipt = {link['receipt_id']: link for link in links}
     for receipt in unlinked:
-        # First try to link to existing transaction
-        receipt_id = receipt['id']
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM finance.find_matching_transaction(%s)", (receipt_id,))
-            matches = cur.fetchall()
+        match = linked_by_receipt.get(receipt['id'])
+        if match:
+            print(f"  Linked receipt {receipt['id']} to transaction {match['transaction_id']} "
+                  f"({match['match_type']}, confidence: {match['confidence']})")
+        else:
+            print(f"  No match for receipt {receipt['id']} "
+                  f"(date: {receipt['receipt_date']}, amount: {receipt['total_amount']})")
 
-        if matches:
-            # Link to existing SMS transaction
-            match = matches[0]
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT finance.link_receipt_to_transaction(%s, %s, %s, %s)
-                """, (receipt_id, match['transaction_id'], match['match_type'], match['confidence']))
-            conn.commit()
-            print(f"  Linked receipt {receipt_id} to existing txn {match['transaction_id']}")
+    return len(links)
+
+
+@METRICS.timed('finalize')
+def finalize_pending_receipts(conn) -> int:
+    """Run finance.finalize_pending_receipts() (totals, transactions) and commit.
+
+    Returns: number of receipts processed
+    """
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT * FROM finance.finalize_pending_receipts()")
+        results = cur.fetchall()
+    conn.commit()
+    for r in results:
+        status = r['status']
+        details = r['details']
+        if status == 'finalized':
+            print(f"  Receipt {r['receipt_id']}: finalized -> txn {details.get('transaction_id')} "
+                  f"({details.get('total_amount')} {details.get('item_count')} items)")
+        elif status == 'needs_review':
+            print(f"  Receipt {r['receipt_id']}: needs_review - {details.get('reason')}")
         else:
-            # No SMS match - create new transaction from receipt
-            txn_id = create_transaction_for_receipt(conn, receipt)
-            if txn_id:
-                created_count += 1
+            print(f"  Receipt {r['receipt_id']}: {status}")
+    return len(results)
 
-    return created_count
+
+def report_pipeline_run(conn, error: Optional[str] = None):
+    """Write METRICS as a JSON report (PIPELINE_REPORT_PATH) and a ops.receipt_pipeline_runs row.
+
+    Reporting never fails the run: errors are printed and the row is skipped.
+    """
+    report = METRICS.report(status='error' if error else 'success', error=error)
+    print("\n=== Pipeline Stages ===")
+    for stage, stats in report['stages'].items():
+        print(f"  {stage:9s} {stats['seconds']:8.2f}s ({stats['self_seconds']:.2f}s self)  "
+              f"items={stats['items']:<6} bytes={stats['bytes']:<10} db={stats['db_round_trips']:<5} "
+              f"api={stats['api_calls']}")
+    try:
+        METRICS.write_json(PIPELINE_REPORT_PATH, report)
+    except OSError as e:
+        print(f"  Could not write {PIPELINE_REPORT_PATH}: {e}")
+    try:
+        if conn.closed:
+            return
+        conn.rollback()
+        METRICS.save(conn, report)
+    except psycopg2.Error as e:
+        print(f"  Could not record pipeline run: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
 
 
 # ============================================================================
-# Transaction Linkage
+# Daemon Mode
 # ============================================================================
 
-def link_receipts_to_transactions(conn) -> int:
-    """Attempt to link unlinked receipts to transactions."""
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("""
-            SELECT id, receipt_date, total_amount, store_name
-            FROM finance.receipts
-            WHERE linked_transaction_id IS NULL
-              AND parse_status = 'success'
-              AND total_amount IS NOT NULL
-            ORDER BY receipt_date DESC
-        """)
-        unlinked = cur.fetchall()
+class IngestDaemon:
+    """Long-running fetch -> extract/parse -> store -> link pipeline.
+
+    Keeps one Gmail client and one Postgres connection warm between cycles.
+    Stages are asyncio tasks joined by bounded queues, so a slow stage holds
+    back the ones before it instead of buffering without limit:
+
+        fetch    every `interval` seconds: incremental Gmail fetch per label
+                 (blob store + finance.receipts rows), then queue the pending
+                 receipts
+        extract  `workers` tasks running extract_receipt() in a pool
+        store    writes results in batches of up to PARSE_COMMIT_EVERY
+                 (store_parsed_batch), one commit per batch
+        link     after stored batches: link, create transactions, finalize;
+                 batches stored while a run is in progress share the next run
+
+    psycopg2 connections and Gmail clients are not thread-safe, so every
+    call touching either runs on a single "receipt-db" thread. SIGTERM/SIGINT
+    stop the fetch loop; receipts already queued are drained, stored and
+    linked before the connection is closed.
+    """
 
-    print(f"Found {len(unlinked)} unlinked receipts")
+    def __init__(self, interval: int = DAEMON_INTERVAL, workers: int = PARSE_WORKERS,
+                 batch_size: int = GMAIL_BATCH_SIZE):
+        self.interval = interval
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.loop = None
+        self.window_started = time.monotonic()
+        self.conn = None
+        self.service = None
+        self.in_flight = set()
+        self.db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipt-db')
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            # Ctrl-C reaches the whole process group; only the parent handles it
+            self.extract_executor = ProcessPoolExecutor(max_workers=workers, initializer=signal.signal,
+                                                        initargs=(signal.SIGINT, signal.SIG_IGN))
+        else:
+            self.extract_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='receipt-extract')
+
+    async def db(self, fn: Callable, *args):
+        """Run fn(conn, *args) on the DB thread, reconnecting if the connection dropped."""
+        def call():
+            if self.conn is None or self.conn.closed:
+                self.conn = get_db_connection()
+            return fn(self.conn, *args)
+        return await self.loop.run_in_executor(self.db_executor, call)
+
+    async def recover(self):
+        """Roll back after a failed stage; a broken connection is replaced on next use."""
+        def rollback():
+            if self.conn is None or self.conn.closed:
+                return
+            try:
+                self.conn.rollback()
+            except psycopg2.Error:
+                self.conn.close()
+        await self.loop.run_in_executor(self.db_executor, rollback)
+
+    async def run(self):
+        import asyncio
+
+        self.loop = loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.link_wanted = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        self.extract_q = asyncio.Queue(maxsize=DAEMON_QUEUE_SIZE)
+        self.store_q = asyncio.Queue(maxsize=DAEMON_QUEUE_SIZE)
+
+        print(f"Receipt daemon started (interval {self.interval}s, {self.workers} extract worker(s))")
+        METRICS.mode = 'daemon'
+        METRICS.reset()
+        creds = await loop.run_in_executor(self.db_executor, get_gmail_credentials)
+        self.service = await loop.run_in_executor(self.db_executor, build_gmail_service, creds)
+
+        extractors = [asyncio.create_task(self.extract_stage()) for _ in range(self.workers)]
+        store = asyncio.create_task(self.store_stage())
+        link = asyncio.create_task(self.link_stage())
+        try:
+            await self.fetch_stage()
+        finally:
+            # Drain: stop extractors once the queue is empty, then the writer, then link
+            for _ in extractors:
+                await self.extract_q.put(None)
+            await asyncio.gather(*extractors)
+            await self.store_q.put(None)
+            await store
+            link.cancel()
+            await asyncio.gather(link, return_exceptions=True)
+            if self.link_wanted.is_set():
+                await self.db(self.link_once)
+            await self.db(self.report_window)
+            await loop.run_in_executor(self.db_executor, lambda: self.conn and self.conn.close())
+            self.db_executor.shutdown()
+            self.extract_executor.shutdown()
+            print("Receipt daemon stopped")
+
+    def stop(self):
+        if not self.stopping.is_set():
+            print("Shutdown requested, draining queued receipts...")
+            self.stopping.set()
+
+    async def fetch_stage(self):
+        import asyncio
+
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            try:
+                await self.db(self.fetch_once)
+                await self.queue_pending()
+                if time.monotonic() - self.window_started >= DAEMON_REPORT_EVERY:
+                    await self.db(self.report_window)
+            except Exception as e:
+                print(f"Fetch cycle failed: {e}")
+                await self.recover()
+
+            delay = max(self.interval - (time.monotonic() - started), 0)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
-    linked_count = 0
-    for receipt in unlinked:
-        receipt_id = receipt['id']
+    def report_window(self, conn):
+        """Record the metrics gathered since the last report and start a new window."""
+        report_pipeline_run(conn)
+        METRICS.reset()
+        self.window_started = time.monotonic()
+
+    def fetch_once(self, conn):
+        """Incremental fetch of every vendor label (DB thread)."""
+        # Extract workers re-read the brand index cache file when it changes
+        refresh_brand_index(conn)
+        for vendor_key, (gmail_label, content_type) in VENDOR_LABELS.items():
+            counts = fetch_label_receipts(
+                self.service, conn, gmail_label,
+                vendor=vendor_key, content_type=content_type,
+                batch_size=self.batch_size, download_workers=0
+            )
+            if counts is None:
+                continue
+            processed, saved, skipped = counts
+            if saved:
+                print(f"  {vendor_key}: saved {saved} receipt(s) from {processed} message(s)")
+
+    async def queue_pending(self):
+        """Queue pending receipts not already in the pipeline (blocks while queues are full).
+
+        Each receipt is queued at most once per cycle, so one that keeps
+        failing is retried next cycle rather than in a loop.
+        """
+        queued = set()
+        while not self.stopping.is_set():
+            pending = await self.db(self.load_pending, sorted(self.in_flight | queued))
+            if not pending:
+                return
+            for receipt in pending:
+                queued.add(receipt['id'])
+                self.in_flight.add(receipt['id'])
+                await self.extract_q.put(receipt)
 
-        # Use the DB function to find match
+    def load_pending(self, conn, exclude_ids: List[int]) -> List[Dict]:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT * FROM finance.find_matching_transaction(%s)
-            """, (receipt_id,))
-            matches = cur.fetchall()
+            cur.execute(PENDING_RECEIPTS_SQL + """
+                WHERE r.parse_status = 'pending' AND NOT r.id = ANY(%s)
+                ORDER BY r.created_at
+                LIMIT %s
+            """, (exclude_ids, DAEMON_QUEUE_SIZE))
+            pending = [dict(r) for r in cur.fetchall()]
+        conn.commit()
+        # Idle here, so a (re)connected registry can LISTEN (see TemplateRegistry.load)
+        TEMPLATE_REGISTRY.refresh(conn)
+        return pending
+
+    async def extract_stage(self):
+        while True:
+            receipt = await self.extract_q.get()
+            if receipt is None:
+                return
+            try:
+                if self.workers > 1:
+                    extracted, metrics = await self.loop.run_in_executor(
+                        self.extract_executor, extract_receipt_measured, receipt)
+                    METRICS.merge(metrics)
+                else:
+                    extracted = await self.loop.run_in_executor(self.extract_executor, extract_receipt, receipt)
+            except Exception as e:
+                # Worker crash (not a parse error - those come back in the result)
+                print(f"Extraction of receipt {receipt['id']} failed: {e}")
+                self.in_flight.discard(receipt['id'])
+                continue
+            await self.store_q.put((receipt, extracted))
 
-        if matches:
-            match = matches[0]
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT finance.link_receipt_to_transaction(%s, %s, %s, %s)
-                """, (
-                    receipt_id,
-                    match['transaction_id'],
-                    match['match_type'],
-                    match['confidence']
-                ))
-            conn.commit()
+    async def store_stage(self):
+        done = False
+        while not done:
+            item = await self.store_q.get()
+            if item is None:
+                return
+            batch = [item]
+            # Take whatever else is ready, up to one commit batch
+            while len(batch) < PARSE_COMMIT_EVERY and not self.store_q.empty():
+                item = self.store_q.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            try:
+                parsed = await self.db(store_parsed_batch, batch)
+                print(f"Parsed {parsed}/{len(batch)} receipts")
+                self.link_wanted.set()
+            except Exception as e:
+                # Rolled back: the receipts are still pending and are re-queued next cycle
+                print(f"Storing {len(batch)} parsed receipts failed: {e}")
+                await self.recover()
+            for receipt, _ in batch:
+                self.in_flight.discard(receipt['id'])
+
+    async def link_stage(self):
+        while True:
+            await self.link_wanted.wait()
+            self.link_wanted.clear()
+            try:
+                await self.db(self.link_once)
+            except Exception as e:
+                print(f"Link run failed: {e}")
+                await self.recover()
 
-            print(f"  Linked receipt {receipt_id} to transaction {match['transaction_id']} "
-                  f"({match['match_type']}, confidence: {match['confidence']})")
-            linked_count += 1
-        else:
-            print(f"  No match for receipt {receipt_id} "
-                  f"(date: {receipt['receipt_date']}, amount: {receipt['total_amount']})")
+    def link_once(self, conn):
+        linked = link_receipts_to_transactions(conn)
+        created = create_transactions_for_unlinked_receipts(conn)
+        finalized = finalize_pending_receipts(conn)
+        if linked or created or finalized:
+            print(f"Linked {linked}, created {created} transactions, finalized {finalized} receipts")
+
+
+# ============================================================================
+# Startup Profiling
+# ============================================================================
+
+def report_import_profile(argv: List[str], top: int = 15) -> int:
+    """Re-run this script with `argv` under `python -X importtime` and summarise.
+
+    The child runs the real subcommand, so imports made lazily along its code
+    path are counted too. Its output passes through; the import table is
+    reduced to top-level modules, sorted by cumulative time.
+
+    Returns: the child's exit code
+    """
+    import subprocess
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(Path(__file__).resolve()), *argv],
+        stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - started
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            print(line, file=sys.stderr)
+            continue
+        fields = line[len('import time:'):].split('|')
+        # Nested imports are indented two spaces per level after the separator
+        if len(fields) != 3 or not fields[1].strip().isdigit() or fields[2].startswith('   '):
+            continue
+        imports.append((int(fields[1]), fields[2].strip()))
 
-    return linked_count
+    total_us = sum(us for us, _ in imports)
+    print(f"\n=== Import Profile ({' '.join(argv) or 'no arguments'}) ===")
+    print(f"Wall time: {elapsed * 1000:.0f} ms, imports: {total_us / 1000:.0f} ms "
+          f"({len(imports)} top-level modules)")
+    for us, name in sorted(imports, reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {us / total_us * 100:5.1f}%  {name}")
+    return result.returncode
 
 
 # ============================================================================
@@ -1065,20 +2891,49 @@ def main():
                         help='Create transactions for unlinked receipts')
     parser.add_argument('--all', action='store_true', help='Do all operations')
     parser.add_argument('--label', default=GMAIL_LABEL, help='Gmail label to monitor')
+    parser.add_argument('--download-workers', type=int, default=GMAIL_DOWNLOAD_WORKERS, metavar='N',
+                        help='Download attachments on N threads instead of batch requests')
+    parser.add_argument('--from-dir', type=Path, metavar='PATH',
+                        help='Import .eml, .mbox, .pdf and .html receipts from a directory tree')
+    parser.add_argument('--from-mbox', type=Path, metavar='FILE',
+                        help='Import receipt emails from an mbox file (e.g. a Gmail Takeout export)')
+    parser.add_argument('--scan-workers', type=int, default=LOCAL_SCAN_WORKERS, metavar='N',
+                        help='Scan --from-dir/--from-mbox sources in N processes')
+    parser.add_argument('--full-sync', action='store_true',
+                        help='Ignore the Gmail history cursor and list the whole label')
+    parser.add_argument('--batch-size', type=int, default=GMAIL_BATCH_SIZE, metavar='N',
+                        help='Gmail API calls per batch HTTP request (1 = no batching)')
+    parser.add_argument('--workers', type=int, default=PARSE_WORKERS, metavar='N',
+                        help='Extract and parse receipts in N processes')
     parser.add_argument('--receipt-id', type=int, help='Parse specific receipt by ID')
     parser.add_argument('--reparse', action='store_true', help='Re-parse even if already parsed')
+    parser.add_argument('--reparse-stale', action='store_true',
+                        help='Re-parse receipts from older parser versions, rewriting only changed ones')
     parser.add_argument('--approve-template', type=str, metavar='HASH',
                         help='Approve a template hash for drift detection')
     parser.add_argument('--report-drift', action='store_true',
                         help='Report receipts needing review (drift/reconciliation issues)')
     parser.add_argument('--finalize-pending', action='store_true',
                         help='Finalize pending receipts (compute totals, create transactions)')
+    parser.add_argument('--migrate-blobs', action='store_true',
+                        help='Move legacy flat-layout receipt files into the sharded blob store')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run continuously: fetch, parse and link as new receipts arrive')
+    parser.add_argument('--interval', type=int, default=DAEMON_INTERVAL, metavar='SECONDS',
+                        help='Seconds between Gmail fetch cycles in --daemon mode')
+    parser.add_argument('--profile', nargs='?', const='receipt_pipeline.prof', metavar='PATH',
+                        help='cProfile each stage and dump the one with the most self time')
+    parser.add_argument('--import-profile', action='store_true',
+                        help='Run the given subcommand under -X importtime and report startup cost')
 
     args = parser.parse_args()
 
-    if not any([args.fetch, args.parse, args.link, args.create_transactions,
+    if args.import_profile:
+        sys.exit(report_import_profile([a for a in sys.argv[1:] if a != '--import-profile']))
+
+    if not any([args.fetch, args.from_dir, args.from_mbox, args.parse, args.reparse_stale, args.link, args.create_transactions,
                 args.all, args.receipt_id, args.approve_template, args.report_drift,
-                args.finalize_pending]):
+                args.finalize_pending, args.migrate_blobs, args.daemon]):
         parser.print_help()
         return
 
@@ -1091,11 +2946,31 @@ def main():
                     DB_CONFIG['password'] = line.split('=', 1)[1].strip()
                     break
 
+    if args.daemon:
+        import asyncio
+        daemon = IngestDaemon(interval=args.interval, workers=args.workers, batch_size=args.batch_size)
+        asyncio.run(daemon.run())
+        return
+
+    METRICS.profiling = bool(args.profile)
     conn = get_db_connection()
+    error = None
 
     try:
+        # Item brands are matched against finance.known_brands (see brand_index.py);
+        # only the commands that parse (and fork parse workers) need it refreshed,
+        # including --approve-template, which re-parses the receipts waiting on
+        # the template; DB-only commands keep their single connection round trip
+        if (args.fetch or args.all or args.parse or args.reparse_stale or args.receipt_id
+                or args.from_dir or args.from_mbox or args.approve_template):
+            refresh_brand_index(conn)
+            conn.commit()
+            # Subscribe to template approvals while no transaction is open
+            TEMPLATE_REGISTRY.refresh(conn)
+
         if args.fetch or args.all:
-            service = get_gmail_service()
+            creds = get_gmail_credentials()
+            service = build_gmail_service(creds)
 
             # Determine which labels to fetch
             if args.all:
@@ -1119,16 +2994,16 @@ def main():
                 print(f"\n=== Fetching receipts from Gmail ({vendor_key}) ===")
                 print(f"Label: {gmail_label}")
 
-                label_id = get_label_id(service, gmail_label)
-                if not label_id:
-                    print(f"Warning: Label '{gmail_label}' not found in Gmail, skipping")
-                    continue
-
-                print(f"Label ID: {label_id}")
-                processed, saved, skipped = fetch_receipts_from_gmail(
-                    service, label_id, conn,
-                    vendor=vendor_key, content_type=content_type, label=gmail_label
+                counts = fetch_label_receipts(
+                    service, conn, gmail_label,
+                    vendor=vendor_key, content_type=content_type,
+                    batch_size=args.batch_size, incremental=not args.full_sync,
+                    download_workers=args.download_workers,
+                    service_factory=lambda: build_gmail_service(creds)
                 )
+                if counts is None:
+                    continue
+                processed, saved, skipped = counts
                 total_processed += processed
                 total_saved += saved
                 total_skipped += skipped
@@ -1153,14 +3028,22 @@ def main():
             print(f"  Unique content: {unique_hashes}")
             print(f"  Total storage: {total_size / 1024 / 1024:.2f} MB")
 
+        if args.from_dir or args.from_mbox:
+            print("\n=== Importing receipts from local files ===")
+            import_local_receipts(conn, from_dir=args.from_dir, from_mbox=args.from_mbox,
+                                  workers=args.scan_workers)
+
+        if args.migrate_blobs:
+            print("\n=== Migrating receipt files to blob store ===")
+            migrated, failed = migrate_legacy_blobs(conn)
+            print(f"Migrated {migrated} files ({failed} failed)")
+
         if args.receipt_id:
             print(f"\n=== Parsing specific receipt ID: {args.receipt_id} ===")
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                status_filter = "" if args.reparse else "AND parse_status = 'pending'"
-                cur.execute(f"""
-                    SELECT id, vendor, pdf_storage_path, pdf_hash, parse_status
-                    FROM finance.receipts
-                    WHERE id = %s {status_filter}
+                status_filter = "" if args.reparse else "AND r.parse_status = 'pending'"
+                cur.execute(PENDING_RECEIPTS_SQL + f"""
+                    WHERE r.id = %s {status_filter}
                 """, (args.receipt_id,))
                 receipt = cur.fetchone()
 
@@ -1191,9 +3074,14 @@ def main():
 
         if args.parse or args.all:
             print("\n=== Parsing pending receipts ===")
-            parsed = parse_pending_receipts(conn)
+            parsed = parse_pending_receipts(conn, workers=args.workers)
             print(f"Parsed {parsed} receipts")
 
+        if args.reparse_stale:
+            print("\n=== Re-parsing receipts from older parser versions ===")
+            rewritten, unchanged = reparse_stale_receipts(conn, workers=args.workers)
+            print(f"Rewrote {rewritten} receipts, {unchanged} unchanged")
+
         if args.link or args.all:
             print("\n=== Linking receipts to transactions ===")
             linked = link_receipts_to_transactions(conn)
@@ -1232,6 +3120,7 @@ def main():
                     """, (full_hash,))
                     result = cur.fetchone()
                     print(f"Approved template {result[0][:16]}... for vendor {result[1]}")
+                    TEMPLATE_REGISTRY.set_status(result[0], 'approved')
                     # Re-parse any receipts that were waiting on this template
                     cur.execute("""
                         SELECT id FROM finance.receipts
@@ -1246,29 +3135,16 @@ def main():
                                 WHERE id = %s
                             """, (rid,))
                         conn.commit()
-                        parse_pending_receipts(conn)
+                        parse_pending_receipts(conn, workers=args.workers)
                 conn.commit()
 
         if args.finalize_pending or args.all:
             print("\n=== Finalizing pending receipts ===")
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT * FROM finance.finalize_pending_receipts()")
-                results = cur.fetchall()
-                conn.commit()
-                if results:
-                    for r in results:
-                        status = r['status']
-                        details = r['details']
-                        if status == 'finalized':
-                            print(f"  Receipt {r['receipt_id']}: finalized -> txn {details.get('transaction_id')} "
-                                  f"({details.get('total_amount')} {details.get('item_count')} items)")
-                        elif status == 'needs_review':
-                            print(f"  Receipt {r['receipt_id']}: needs_review - {details.get('reason')}")
-                        else:
-                            print(f"  Receipt {r['receipt_id']}: {status}")
-                    print(f"Processed {len(results)} receipts")
-                else:
-                    print("No pending receipts to finalize")
+            finalized = finalize_pending_receipts(conn)
+            if finalized:
+                print(f"Processed {finalized} receipts")
+            else:
+                print("No pending receipts to finalize")
 
         if args.report_drift:
             print("\n=== Drift/Review Report ===")
@@ -1309,7 +3185,15 @@ def main():
                 else:
                     print("\nAll templates approved.")
 
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
     finally:
+        # Ops queries (--report-drift, --approve-template alone) are not pipeline runs
+        if any(stage in STAGES for stage in METRICS.stages):
+            report_pipeline_run(conn, error)
+        if args.profile:
+            METRICS.dump_profile(Path(args.profile))
         conn.close()
 
 
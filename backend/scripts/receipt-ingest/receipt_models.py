@@ -0,0 +1,162 @@
+"""
+Parsed receipt models shared by the vendor parsers
+
+A parser returns a ParsedReceipt: the vendor's header fields (invoice
+number, totals, savings, ...) in a dict, and its line items as LineItem
+objects. Both are slotted dataclasses: an item is one fixed-layout object
+rather than a ~15-key dict, and both pickle as positional tuples, which is
+what parse worker processes send back to the writer.
+
+to_json() produces the parsed_json document the dict-based parsers wrote,
+plus "schema_version":
+
+    {"parser_version": ..., "parse_version": ..., <header fields>,
+     "line_items": [{<item fields>}, ...], "schema_version": 1}
+
+Item keys are vendor-specific (ITEM_FIELDS): some are always written (null
+when unset), the rest only when set, e.g. Carrefour's is_free.
+
+orjson is used for serialization when installed, otherwise json.
+"""
+
+import json
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bump when the parsed_json layout changes
+SCHEMA_VERSION = 1
+
+
+@dataclass(slots=True)
+class LineItem:
+    """One receipt line; each vendor fills its own subset of the fields."""
+
+    description: str
+    # Carrefour
+    barcode: Optional[str] = None
+    qty_ordered: Optional[float] = None
+    qty_delivered: Optional[float] = None
+    unit_price_incl_vat: Optional[float] = None
+    unit_price_excl_vat: Optional[float] = None
+    total_excl_vat: Optional[float] = None
+    vat_rate: Optional[float] = None
+    vat_amount: Optional[float] = None
+    discount: Optional[float] = None
+    total_incl_vat: Optional[float] = None
+    is_free: Optional[bool] = None
+    voucher_discount: Optional[float] = None
+    # Careem
+    qty: Optional[int] = None
+    unit_price: Optional[float] = None
+    total: Optional[float] = None
+    original_price: Optional[float] = None
+    # brand_index.extract_brand() output
+    brand: Optional[str] = None
+    brand_confidence: Optional[float] = None
+    brand_source: Optional[str] = None
+
+    def __reduce__(self):
+        return LineItem, _line_item_values(self)
+
+    def to_dict(self, vendor: str) -> Dict[str, Any]:
+        """The item as the vendor's parsed_json entry (see ITEM_FIELDS)."""
+        names, always, getter = _item_layout(vendor)
+        return {name: value for name, keep, value in zip(names, always, getter(self))
+                if keep or value is not None}
+
+
+LINE_ITEM_FIELDS = tuple(f.name for f in fields(LineItem))
+_line_item_values = attrgetter(*LINE_ITEM_FIELDS)
+
+# vendor -> ((field, always written), ...) in parsed_json key order
+ITEM_FIELDS: Dict[str, Tuple[Tuple[str, bool], ...]] = {
+    'carrefour_uae': (
+        ('description', True), ('barcode', True),
+        ('qty_ordered', True), ('qty_delivered', True),
+        ('unit_price_incl_vat', True), ('unit_price_excl_vat', True),
+        ('total_excl_vat', True), ('vat_rate', True), ('vat_amount', True),
+        ('discount', True), ('total_incl_vat', True),
+        ('is_free', False),
+        ('brand', True), ('brand_confidence', True), ('brand_source', True),
+        ('voucher_discount', False),
+    ),
+    'careem_quik': (
+        ('description', True), ('qty', True), ('unit_price', True), ('total', True),
+        ('original_price', False), ('discount', False),
+        ('brand', True), ('brand_confidence', True), ('brand_source', True),
+    ),
+}
+
+_ITEM_LAYOUTS = {}
+for _vendor, _spec in ITEM_FIELDS.items():
+    _names = tuple(name for name, _ in _spec)
+    _ITEM_LAYOUTS[_vendor] = (_names, tuple(keep for _, keep in _spec), attrgetter(*_names))
+
+
+def _item_layout(vendor: str):
+    """(field names, always-written flags, getter of the values) for a vendor's items."""
+    try:
+        return _ITEM_LAYOUTS[vendor]
+    except KeyError:
+        raise ValueError(f"No line item layout for vendor {vendor!r}") from None
+
+
+@dataclass(slots=True)
+class ParsedReceipt:
+    """Parser output: header fields plus line items.
+
+    Header fields are also readable and writable dict-style
+    (parsed.get('invoice_no'), parsed['validation_errors'] = [...]);
+    'line_items' resolves to the item list.
+    """
+
+    vendor: str
+    header: Dict[str, Any] = field(default_factory=dict)
+    line_items: List[LineItem] = field(default_factory=list)
+    schema_version: int = SCHEMA_VERSION
+
+    def __reduce__(self):
+        return ParsedReceipt, (self.vendor, self.header, self.line_items, self.schema_version)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == 'line_items':
+            return self.line_items
+        return self.header.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'line_items':
+            return self.line_items
+        return self.header[key]
+
+    def __setitem__(self, key: str, value: Any):
+        if key == 'line_items':
+            raise KeyError("Set ParsedReceipt.line_items directly")
+        self.header[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return key == 'line_items' or key in self.header
+
+    def iter_item_dicts(self) -> Iterator[Dict[str, Any]]:
+        names, always, getter = _item_layout(self.vendor)
+        for item in self.line_items:
+            yield {name: value for name, keep, value in zip(names, always, getter(item))
+                   if keep or value is not None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The parsed_json document as a dict."""
+        document = dict(self.header)
+        document['line_items'] = list(self.iter_item_dicts())
+        document['schema_version'] = self.schema_version
+        return document
+
+    def to_json(self) -> str:
+        """The parsed_json document, serialized (non-ASCII kept as is)."""
+        if orjson is not None:
+            return orjson.dumps(self.to_dict()).decode('utf-8')
+        return json.dumps(self.to_dict(), ensure_ascii=False)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Carrefour receipt parser tests
+
+Checks document type detection on text excerpts of the Carrefour PDFs in
+backend/data/receipts (pdftotext -layout output, Arabic columns dropped), so
+the tests run without poppler.
+
+Usage:
+    pip install -r requirements.txt
+    pytest test_carrefour_parser.py
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+RECEIPT_INGEST_DIR = Path(__file__).resolve().parent.parent / "scripts" / "receipt-ingest"
+sys.path.insert(0, str(RECEIPT_INGEST_DIR))
+
+import carrefour_parser  # noqa: E402
+
+# 7e4e7589012f73b7_83293023TIP.pdf
+TIPS_RECEIPT = """\
+                                                  FU-COM LLC
+              Retail Corp, Ibn Batouta Sheikh Zayed Road, PO BOX 38323 Dubai, UAE
+                                                  TRN 100025416700003
+
+Tips Receipt
+
+Order No.                   : 784030013189789
+Receipt No.                 : 83293023TIP
+Order Date                  : 11-Jan-2026
+Receipt Date                : 11-Jan-2026
+
+Description                                                      Amount
+
+Driver Tip                                                         3.00
+Barcode:  1000001000001
+
+Total Amount                                                   AED 3.00
+
+Payment Type                  : Apple Pay
+Amount                        : AED 3.00
+
+This document is a tips receipt for voluntary payment made by the customer for the \
+delivery partner and should not be considered as a tax invoice/document.
+
+Thank you for shopping at Carrefour
+"""
+
+# 9f3bdfbcda5c4935_83293023.pdf: header and the refund policy footer
+TAX_INVOICE = """\
+                                                  FU-COM LLC
+                                                  TRN 100025416700003
+
+Tax Invoice
+
+Order No.                   : 784030013189789
+Invoice No.                 : 83293023
+
+Refund Note
+Refunds are credited to the original payment method.
+"""
+
+REFUND_NOTE = """\
+                                                  FU-COM LLC
+
+Refund Note
+
+Order No.                   : 784030013189789
+"""
+
+
+@pytest.mark.parametrize("text,doc_type", [
+    # The tips footer mentions "tax invoice"; it must not win
+    (TIPS_RECEIPT, "tips_receipt"),
+    # Invoices carry a refund policy section; the invoice heading wins
+    (TAX_INVOICE, "tax_invoice"),
+    (REFUND_NOTE, "refund_note"),
+    ("Driver Tip 3.00", "tips_receipt"),
+    ("Order summary", "unknown"),
+], ids=["tips", "invoice", "refund", "driver_tip", "unknown"])
+def test_detect_document_type(text, doc_type):
+    assert carrefour_parser.detect_document_type(text) == doc_type
+    assert carrefour_parser.detect_document_type(text, text.lower()) == doc_type
+
+
+def test_tips_receipt_is_skipped():
+    parsed = carrefour_parser.parse_carrefour_receipt(TIPS_RECEIPT)
+
+    assert parsed["doc_type"] == "tips_receipt"
+    assert parsed["skip_reason"] == "Document type 'tips_receipt' not supported for parsing"
+    assert parsed["parse_errors"] == []
+    assert parsed.line_items == []
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Receipt ingestion Gmail fetch tests
+
+Drives receipt_ingestion.fetch_receipts_from_gmail against the benchmark's
+FakeGmail service (bench_pipeline.py), which counts HTTP round trips, and
+checks how many calls a batched and an unbatched fetch make. The database
+side (sync cursor, dedup, receipt storage) is replaced by in-memory stand-ins.
+
+Usage:
+    pip install -r requirements.txt
+    pytest test_receipt_gmail_fetch.py
+"""
+
+import hashlib
+import sys
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+from pathlib import Path
+
+import pytest
+
+RECEIPT_INGEST_DIR = Path(__file__).resolve().parent.parent / "scripts" / "receipt-ingest"
+sys.path.insert(0, str(RECEIPT_INGEST_DIR))
+
+import bench_pipeline  # noqa: E402
+import receipt_ingestion  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+
+LABEL = "LifeOS/Receipts/Carrefour"
+
+
+def receipt_pdf(n: int) -> bytes:
+    return f"%PDF-1.4\n% test receipt {n}\n%%EOF\n".encode("ascii")
+
+
+def receipt_email(n: int) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = bench_pipeline.BENCH_SENDER
+    message["To"] = "test@example.com"
+    message["Subject"] = f"Your Carrefour receipt {n}"
+    message["Date"] = format_datetime(datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(hours=n))
+    message.set_content("Your receipt is attached.")
+    message.add_attachment(receipt_pdf(n), maintype="application", subtype="pdf",
+                           filename=f"receipt_{n}.pdf")
+    return message
+
+
+def build_mailbox(count: int) -> bench_pipeline.FakeGmail:
+    mailbox = bench_pipeline.FakeGmail()
+    for n in range(count):
+        mailbox.add_message(LABEL, receipt_email(n), copy=0)
+    return mailbox
+
+
+class NoDuplicates:
+    """ReceiptDedupIndex stand-in: nothing has been ingested yet."""
+
+    def __init__(self, conn):
+        pass
+
+    def message_receipt_counts(self, message_ids):
+        return {}
+
+    def prime_hashes(self, hashes):
+        pass
+
+
+@pytest.fixture
+def stored(monkeypatch, tmp_path):
+    """Replace the DB side of the fetch; returns what it would have stored."""
+    result = {"pdfs": {}, "cursor": None}
+
+    def process_gmail_message(service, msg, conn, pdfs=None, dedup=None):
+        result["pdfs"][msg["id"]] = [blob.content_hash for _, blob in pdfs]
+        return [{"message_id": msg["id"]}]
+
+    def save_sync_cursor(conn, gmail_label, label_id, history_id, full_sync):
+        result["cursor"] = (gmail_label, history_id, full_sync)
+
+    monkeypatch.setattr(receipt_ingestion, "BLOB_STORE", BlobStore(tmp_path))
+    monkeypatch.setattr(receipt_ingestion, "ReceiptDedupIndex", NoDuplicates)
+    monkeypatch.setattr(receipt_ingestion, "load_sync_cursor", lambda conn, key: None)
+    monkeypatch.setattr(receipt_ingestion, "save_sync_cursor", save_sync_cursor)
+    monkeypatch.setattr(receipt_ingestion, "process_gmail_message", process_gmail_message)
+    return result
+
+
+def fetch(mailbox: bench_pipeline.FakeGmail, batch_size: int):
+    service = mailbox.service()
+    return receipt_ingestion.fetch_receipts_from_gmail(
+        service, mailbox.labels[LABEL], None, label=LABEL,
+        batch_size=batch_size, download_workers=0)
+
+
+def expected_pdfs(mailbox: bench_pipeline.FakeGmail, count: int):
+    return {msg_id: [hashlib.sha256(receipt_pdf(n)).hexdigest()]
+            for n, msg_id in enumerate(mailbox.label_messages[mailbox.labels[LABEL]][:count])}
+
+
+@pytest.mark.parametrize("count,batch_size,round_trips", [
+    # getProfile + one list page, then one batch of message gets and one of
+    # attachment gets per batch_size messages
+    (5, 2, 2 + 3 + 3),
+    (5, 50, 2 + 1 + 1),
+    (120, 50, 2 + 1 + 3 + 3),
+    # batch_size 1: one round trip per message and per attachment
+    (5, 1, 2 + 5 + 5),
+])
+def test_fetch_round_trips(stored, capsys, count, batch_size, round_trips):
+    mailbox = build_mailbox(count)
+
+    assert fetch(mailbox, batch_size) == (count, count, 0)
+
+    assert mailbox.round_trips == round_trips
+    assert f"{round_trips} Gmail round trips" in capsys.readouterr().out
+    assert stored["pdfs"] == expected_pdfs(mailbox, count)
+    assert stored["cursor"] == (LABEL, mailbox.history_id, True)
+
+
+def test_failed_batch_is_retried_per_request(stored, capsys):
+    mailbox = build_mailbox(3)
+    mailbox.failing_batches = 1
+
+    assert fetch(mailbox, 5) == (3, 3, 0)
+
+    # getProfile + list, the failed message batch and its 3 gets one by one,
+    # then one attachment batch
+    assert mailbox.round_trips == 2 + 1 + 3 + 1
+    out = capsys.readouterr().out
+    assert "Gmail batch request failed" in out
+    assert "7 Gmail round trips" in out
+    assert stored["pdfs"] == expected_pdfs(mailbox, 3)
+    assert stored["cursor"] is not None
+
+
+def test_failed_attachment_batch_is_retried_per_request(stored):
+    mailbox = build_mailbox(4)
+    service = mailbox.service()
+    messages = [mailbox.messages[msg_id] for msg_id in mailbox.label_messages[mailbox.labels[LABEL]]]
+    requests = next(receipt_ingestion.attachment_batches(service, messages, 10))
+    mailbox.failing_batches = 1
+
+    responses, errors, round_trips = receipt_ingestion.execute_gmail_batch(service, requests, 10)
+
+    assert errors == {}
+    assert sorted(responses) == sorted(request_id for request_id, _ in requests)
+    assert round_trips == mailbox.round_trips == 1 + 4